@@ -0,0 +1,203 @@
+"""
+Agent data store
+Base agent data is deep-copied once at import and never mutated; each
+session gets a copy-on-write overlay holding only the rows it appended,
+capped per agent so memory stays flat no matter how long simulation runs
+"""
+import copy
+import itertools
+import threading
+from collections import deque
+from typing import Dict, List
+
+from agents_config import AGENTS_DATA
+from attention import classify_rows, ATTENTION_KEY
+from columnar import ColumnarRows
+from config import MAX_ROWS_PER_AGENT
+from kpi_engine import create_agent_kpis
+
+# Every row gets a process-unique id so payload deltas can address it
+ROW_ID_KEY = "_id"
+_row_ids = itertools.count(1)
+
+# Internal columns stored as plain integer arrays instead of dictionary codes
+INT_COLUMNS = {ROW_ID_KEY: "q", ATTENTION_KEY: "B"}
+
+
+def _ingest_rows(agent_id: str, rows: List[Dict]) -> List[int]:
+    """
+    Assign ids and attention codes to new rows
+    Returns ids of rows that need attention
+    """
+    classify_rows(agent_id, rows)
+    attention_ids = []
+    for row in rows:
+        row[ROW_ID_KEY] = next(_row_ids)
+        if row[ATTENTION_KEY]:
+            attention_ids.append(row[ROW_ID_KEY])
+    return attention_ids
+
+
+class AgentDataStore:
+    """Process-wide immutable base data shared by all sessions"""
+
+    def __init__(self, base_agents: List[Dict], max_rows_per_agent: int = MAX_ROWS_PER_AGENT):
+        self.max_rows_per_agent = max_rows_per_agent
+        # Rows are shared (never mutated) between snapshots; everything else
+        # is copied per snapshot so callers can't leak changes back here
+        self._base = tuple(copy.deepcopy(agent) for agent in base_agents)
+        self._base_attention = {}
+        self._base_kpis = {}
+        for agent in self._base:
+            rows = agent.get("rows", [])
+            self._base_attention[agent["id"]] = tuple(_ingest_rows(agent["id"], rows))
+            kpis = create_agent_kpis(agent["id"], agent.pop("kpi_baseline", None))
+            if kpis is not None:
+                kpis.add_rows(rows)
+            self._base_kpis[agent["id"]] = kpis
+        self._base_rows = {
+            agent["id"]: tuple(agent.get("rows", ())) for agent in self._base
+        }
+
+    @property
+    def agent_ids(self) -> List[str]:
+        return [agent["id"] for agent in self._base]
+
+    def base_rows(self, agent_id: str) -> tuple:
+        return self._base_rows.get(agent_id, ())
+
+    def new_row_container(self, agent_id: str) -> ColumnarRows:
+        """Capped columnar container for a session's rows of an agent"""
+        return ColumnarRows(self.max_rows_per_agent, INT_COLUMNS)
+
+    def base_kpis(self, agent_id: str):
+        return self._base_kpis.get(agent_id)
+
+    def new_session(self) -> "SessionAgentData":
+        """Create an empty overlay for a new session"""
+        return SessionAgentData(self)
+
+    def build_snapshot(self, session: "SessionAgentData", after_ids: Dict[str, int] = None) -> List[Dict]:
+        """
+        Materialize agent dicts for a session (base rows + overlay rows)
+        With after_ids (agent id -> newest row id the caller already has),
+        "rows" holds only newer rows and "first_row_id" the oldest visible
+        row id (None without rows), so callers tracking rows by id don't
+        decode the whole overlay again
+        """
+        snapshot = []
+        cap = self.max_rows_per_agent
+        for base_agent in self._base:
+            agent_id = base_agent["id"]
+            agent = {k: v for k, v in base_agent.items() if k != "rows"}
+            kpis = session.kpis(agent_id)
+            agent["kpis"] = kpis.kpis() if kpis else []
+            agent["mini_kpis"] = kpis.mini_kpis() if kpis else []
+            base_rows = self._base_rows[agent_id]
+            extra_rows = session.overlay_rows(agent_id)
+            extra_count = len(extra_rows) if extra_rows is not None else 0
+            # The overlay is capped too; base rows fill the rest of the window
+            base_rows = base_rows[max(0, len(base_rows) - max(cap - extra_count, 0)):]
+            if base_rows:
+                first_id = base_rows[0][ROW_ID_KEY]
+            else:
+                first_id = extra_rows.value(0, ROW_ID_KEY) if extra_count else None
+
+            after = after_ids.get(agent_id) if after_ids is not None else None
+            if after is None:
+                rows = list(base_rows)
+                if extra_count:
+                    rows.extend(extra_rows.to_records())
+            else:
+                # Ids grow monotonically along base + overlay rows
+                rows = [row for row in base_rows if row[ROW_ID_KEY] > after]
+                if extra_count:
+                    rows.extend(extra_rows.to_records(extra_rows.index_after(ROW_ID_KEY, after)))
+                agent["first_row_id"] = first_id
+            agent["rows"] = rows
+
+            # Row ids grow monotonically, so visible attention rows are
+            # exactly the indexed ids >= the first visible row id
+            first_id = first_id or 0
+            agent["attention_ids"] = [
+                row_id for row_id in self._base_attention[agent_id] if row_id >= first_id
+            ] + session.overlay_attention_ids(agent_id, first_id)
+            snapshot.append(agent)
+        return snapshot
+
+
+class SessionAgentData:
+    """Per-session overlay of rows appended on top of the shared base data"""
+
+    def __init__(self, store: AgentDataStore):
+        self.store = store
+        self._overlay: Dict[str, ColumnarRows] = {}
+        self._attention: Dict[str, deque] = {}
+        # Copy-on-write: aggregates are copied from the base on first append
+        self._kpis = {}
+        # The chat endpoint snapshots from another thread than the script
+        self._lock = threading.Lock()
+
+    def append_rows(self, agent_id: str, rows: List[Dict]):
+        """Append rows for an agent; the oldest rows are evicted beyond the cap"""
+        if not rows:
+            return
+        with self._lock:
+            self._append_rows(agent_id, rows)
+
+    def _append_rows(self, agent_id: str, rows: List[Dict]):
+        attention_ids = _ingest_rows(agent_id, rows)
+        kpis = self._kpis.get(agent_id)
+        if kpis is None and self.store.base_kpis(agent_id) is not None:
+            kpis = self._kpis[agent_id] = self.store.base_kpis(agent_id).copy()
+        if kpis is not None:
+            kpis.add_rows(rows)
+        overlay = self._overlay.get(agent_id)
+        if overlay is None:
+            overlay = self._overlay[agent_id] = self.store.new_row_container(agent_id)
+            self._attention[agent_id] = deque()
+        overlay.extend(rows)
+
+        attention = self._attention[agent_id]
+        attention.extend(attention_ids)
+        # Drop index entries for rows evicted from the overlay
+        first_id = overlay.value(0, ROW_ID_KEY)
+        while attention and attention[0] < first_id:
+            attention.popleft()
+
+    def kpis(self, agent_id: str):
+        """Running KPI aggregates for an agent (session's own or the shared base)"""
+        return self._kpis.get(agent_id) or self.store.base_kpis(agent_id)
+
+    def overlay_rows(self, agent_id: str) -> ColumnarRows:
+        return self._overlay.get(agent_id)
+
+    def overlay_attention_ids(self, agent_id: str, first_id: int = 0) -> List[int]:
+        """Attention row ids in the overlay, optionally only ids >= first_id"""
+        attention = self._attention.get(agent_id)
+        if not attention:
+            return []
+        if attention[0] >= first_id:
+            return list(attention)
+        return [row_id for row_id in attention if row_id >= first_id]
+
+    def overlay_size(self) -> int:
+        """Number of rows held by this session's overlay"""
+        return sum(len(rows) for rows in self._overlay.values())
+
+    def snapshot(self, after_ids: Dict[str, int] = None) -> List[Dict]:
+        """
+        Agent data for this session (row dicts are shared - don't mutate them)
+        after_ids limits rows to those newer than the given ids (see
+        AgentDataStore.build_snapshot)
+        """
+        with self._lock:
+            return self.store.build_snapshot(self, after_ids)
+
+
+_store = AgentDataStore(AGENTS_DATA)
+
+
+def get_agent_store() -> AgentDataStore:
+    """Get the process-wide agent data store"""
+    return _store
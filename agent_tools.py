@@ -0,0 +1,155 @@
+"""
+Function tools the chat model calls to fetch agent data on demand
+Instead of sending rows of every agent with each question, the prompt
+carries a short KPI overview and the model asks for what it needs: value
+counts of a column, attention items of an agent, rows of a patient, KPIs.
+Tools run over the role-filtered session snapshot in memory; their
+schemas depend only on the visible agents and columns, so they stay part
+of the cacheable prompt prefix.
+"""
+import json
+from typing import Callable, Dict, List
+
+from attention import ATTENTION_KEY, REASON_LABELS
+from retrieval import fold_text
+
+# Rows returned by listing tools
+TOOL_ROW_LIMIT = 10
+# Longest tool result sent back to the model (characters, ~1000 tokens)
+TOOL_RESULT_MAX_CHARS = 4000
+
+
+def _visible(row: Dict) -> Dict:
+    return {k: v for k, v in row.items() if v and not k.startswith("_")}
+
+
+def _columns(agent: Dict) -> List[str]:
+    rows = agent.get("rows", [])
+    return [k for k in rows[0] if not k.startswith("_")] if rows else []
+
+
+def agents_overview(agents_data: List[Dict]) -> str:
+    """Per-agent KPIs and record counts (the context when tools are enabled)"""
+    lines = []
+    for agent in agents_data:
+        kpis = ", ".join(f"{k[0]}: {k[1]}" for k in agent.get("kpis", []))
+        lines.append(
+            f"Agent: {agent.get('name', '')} (ID: {agent.get('id', '')}); KPIs: {kpis}; "
+            f"záznamů: {len(agent.get('rows', []))}, vyžaduje pozornost: {len(agent.get('attention_ids', []))}"
+        )
+    return "\n".join(lines)
+
+
+def build_tool_schemas(agents_data: List[Dict]) -> List[Dict]:
+    """Chat completions `tools` for the given (role-filtered) agents"""
+    agent_ids = [agent.get("id", "") for agent in agents_data]
+    columns = "; ".join(f"{agent.get('id', '')}: {', '.join(_columns(agent))}" for agent in agents_data)
+    agent_param = {"type": "string", "enum": agent_ids, "description": "ID agenta"}
+
+    def function(name: str, description: str, properties: Dict, required: List[str]) -> Dict:
+        return {"type": "function", "function": {
+            "name": name,
+            "description": description,
+            "parameters": {"type": "object", "properties": properties, "required": required}
+        }}
+
+    return [
+        function("get_agent_kpis", "KPI agenta, počet jeho záznamů a položek vyžadujících pozornost.",
+                 {"agent_id": agent_param}, ["agent_id"]),
+        function("count_rows", f"Počet záznamů agenta podle hodnot sloupce. Sloupce: {columns}.",
+                 {"agent_id": agent_param,
+                  "column": {"type": "string", "description": "Název sloupce"}},
+                 ["agent_id", "column"]),
+        function("list_attention_items", "Záznamy agenta, které vyžadují pozornost, s důvodem (nejnovější první).",
+                 {"agent_id": agent_param,
+                  "limit": {"type": "integer", "description": f"Nejvýše {TOOL_ROW_LIMIT}"}},
+                 ["agent_id"]),
+        function("find_patient", "Všechny záznamy všech agentů, které zmiňují pacienta (jméno, e-mail, soubor).",
+                 {"name": {"type": "string", "description": "Jméno nebo jeho část"}},
+                 ["name"]),
+    ]
+
+
+def _agent(agents_data: List[Dict], agent_id: str) -> Dict:
+    for agent in agents_data:
+        if agent.get("id") == agent_id:
+            return agent
+    raise KeyError(agent_id)
+
+
+def _get_agent_kpis(agents_data: List[Dict], agent_id: str) -> Dict:
+    agent = _agent(agents_data, agent_id)
+    return {
+        "agent": agent.get("name", ""),
+        "kpis": {k[0]: k[1] for k in agent.get("kpis", [])},
+        "records": len(agent.get("rows", [])),
+        "attention": len(agent.get("attention_ids", [])),
+    }
+
+
+def _count_rows(agents_data: List[Dict], agent_id: str, column: str) -> Dict:
+    agent = _agent(agents_data, agent_id)
+    columns = _columns(agent)
+    # Tolerate case and diacritics in the column name the model sends
+    matched = next((c for c in columns if fold_text(c) == fold_text(column)), None)
+    if matched is None:
+        return {"error": f"Neznámý sloupec '{column}'", "columns": columns}
+    counts: Dict[str, int] = {}
+    for row in agent.get("rows", []):
+        value = str(row.get(matched, ""))
+        counts[value] = counts.get(value, 0) + 1
+    return {"column": matched, "total": len(agent.get("rows", [])),
+            "counts": dict(sorted(counts.items(), key=lambda item: -item[1]))}
+
+
+def _list_attention_items(agents_data: List[Dict], agent_id: str, limit: int = TOOL_ROW_LIMIT) -> Dict:
+    agent = _agent(agents_data, agent_id)
+    limit = max(1, min(int(limit or TOOL_ROW_LIMIT), TOOL_ROW_LIMIT))
+    attention_ids = set(agent.get("attention_ids", []))
+    items = [
+        {**_visible(row), "Důvod": REASON_LABELS.get(row.get(ATTENTION_KEY, 0), "")}
+        for row in reversed(agent.get("rows", [])) if row.get("_id") in attention_ids
+    ]
+    return {"total": len(items), "items": items[:limit]}
+
+
+def _find_patient(agents_data: List[Dict], name: str) -> Dict:
+    needle = fold_text(name).strip()
+    if not needle:
+        return {"error": "Chybí jméno"}
+    matches = []
+    for agent in agents_data:
+        for row in agent.get("rows", []):
+            if any(needle in fold_text(v) for k, v in row.items() if v and not k.startswith("_")):
+                matches.append({**_visible(row), "Agent": agent.get("name", "")})
+    return {"total": len(matches), "records": matches[-TOOL_ROW_LIMIT:]}
+
+
+TOOLS: Dict[str, Callable] = {
+    "get_agent_kpis": _get_agent_kpis,
+    "count_rows": _count_rows,
+    "list_attention_items": _list_attention_items,
+    "find_patient": _find_patient,
+}
+
+
+def run_tool(name: str, arguments: str, agents_data: List[Dict]) -> str:
+    """
+    Execute one tool call over the agent data
+    Returns the JSON result for the tool message; errors are returned as
+    {"error": ...} so the model can recover instead of failing the turn
+    """
+    tool = TOOLS.get(name)
+    if tool is None:
+        result = {"error": f"Neznámý nástroj '{name}'"}
+    else:
+        try:
+            result = tool(agents_data, **json.loads(arguments or "{}"))
+        except KeyError as e:
+            result = {"error": f"Agent {e} není dostupný"}
+        except (TypeError, ValueError) as e:
+            result = {"error": f"Neplatné argumenty: {e}"}
+    text = json.dumps(result, ensure_ascii=False)
+    if len(text) > TOOL_RESULT_MAX_CHARS:
+        text = text[:TOOL_RESULT_MAX_CHARS] + "…(zkráceno)"
+    return text
@@ -1,11 +1,30 @@
 """
 Agent configuration and static data
 """
-from avatars_config import get_avatar_data_url
+from avatars_config import get_avatar_data_url, get_avatar_url
+from app_server import is_app_server_running
+from config import AVATAR_DELIVERY
+
+# Agent circles are 120px wide
+AVATAR_DISPLAY_SIZE = 120
+
+def _use_static_avatars() -> bool:
+    return AVATAR_DELIVERY == "static" and is_app_server_running()
 
 # Get avatars (will use PNG if available, otherwise emoji)
+# In "static" mode the payload carries only a cacheable URL; if the sidecar
+# server is not running (main.py starts it before importing the agent data)
+# we fall back to embedding the image
 def get_agent_avatar(agent_id: str) -> str:
-    return get_avatar_data_url(agent_id)
+    if _use_static_avatars():
+        return get_avatar_url(agent_id, AVATAR_DISPLAY_SIZE)
+    return get_avatar_data_url(agent_id, AVATAR_DISPLAY_SIZE * 2)
+
+# High-DPI variant for srcset (static mode only, inline already embeds 2x)
+def get_agent_avatar_2x(agent_id: str) -> str:
+    if _use_static_avatars():
+        return get_avatar_url(agent_id, AVATAR_DISPLAY_SIZE * 2)
+    return ""
 
 AGENTS_DATA = [
     {
@@ -13,26 +32,19 @@ AGENTS_DATA = [
         "name": "Isabella",
         "role": "Recepční na telefonu",
         "avatar": get_agent_avatar("isabella"),
+        "avatar_2x": get_agent_avatar_2x("isabella"),
         "notification": "3 nové hovory čekají na zpracování",
-        "kpis": [
-            ["📞 Zpracované hovory", "128"],
-            ["🌑 Mimo pracovní dobu", "14"]
-        ],
-        "mini_kpis": [
-            ["📞", "128"],
-            ["🌑", "14"],
-            ["✅", "94%"],
-            ["⏱️", "2.3m"]
-        ],
+        # Historical aggregates before the rows below; KPIs are computed by kpi_engine
+        "kpi_baseline": {"count": 120, "successes": 114, "out_of_hours": 13, "duration_total": 275.9, "duration_count": 120},
         "rows": [
-            {"Pacient": "Jan Novák", "Důvod hovoru": "Hygiena", "Požadavek": "Objednat", "Čas": "14:30", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""},
-            {"Pacient": "Petra Dvořáková", "Důvod hovoru": "Kontrola", "Požadavek": "Přesunout", "Čas": "10:15", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""},
-            {"Pacient": "Lukáš Beneš", "Důvod hovoru": "Bolest", "Požadavek": "Objednat", "Čas": "9:00", "Výsledek": "📞 Přepojeno na recepci", "Popis problému": "Hovor byl přepojen na recepci, je potřeba zkontrolovat, zda byl problém vyřešen a zda pacient obdržel potřebné informace."},
-            {"Pacient": "Eva Kovářová", "Důvod hovoru": "Rentgen", "Požadavek": "Informace", "Čas": "16:00", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""},
-            {"Pacient": "Martin Svoboda", "Důvod hovoru": "Nový pacient", "Požadavek": "Objednat", "Čas": "11:45", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""},
-            {"Pacient": "Tereza Kučerová", "Důvod hovoru": "Zrušení termínu", "Požadavek": "Zrušit", "Čas": "13:30", "Výsledek": "⏳ Čeká na potvrzení SMS", "Popis problému": "SMS potvrzení o zrušení termínu nebylo dosud doručeno. Zkontrolujte stav odeslání a v případě potřeby znovu odešlete potvrzovací SMS zprávu."},
-            {"Pacient": "Pavel Černý", "Důvod hovoru": "Kontrola", "Požadavek": "Objednat", "Čas": "15:15", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""},
-            {"Pacient": "Jana Malá", "Důvod hovoru": "Hygiena", "Požadavek": "Přesunout", "Čas": "12:00", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": ""}
+            {"Pacient": "Jan Novák", "Důvod hovoru": "Hygiena", "Požadavek": "Objednat", "Čas": "14:30", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 2.1},
+            {"Pacient": "Petra Dvořáková", "Důvod hovoru": "Kontrola", "Požadavek": "Přesunout", "Čas": "10:15", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 1.8},
+            {"Pacient": "Lukáš Beneš", "Důvod hovoru": "Bolest", "Požadavek": "Objednat", "Čas": "9:00", "Výsledek": "📞 Přepojeno na recepci", "Popis problému": "Hovor byl přepojen na recepci, je potřeba zkontrolovat, zda byl problém vyřešen a zda pacient obdržel potřebné informace.", "_min": 3.4},
+            {"Pacient": "Eva Kovářová", "Důvod hovoru": "Rentgen", "Požadavek": "Informace", "Čas": "16:00", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 2.6},
+            {"Pacient": "Martin Svoboda", "Důvod hovoru": "Nový pacient", "Požadavek": "Objednat", "Čas": "11:45", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 2.9},
+            {"Pacient": "Tereza Kučerová", "Důvod hovoru": "Zrušení termínu", "Požadavek": "Zrušit", "Čas": "13:30", "Výsledek": "⏳ Čeká na potvrzení SMS", "Popis problému": "SMS potvrzení o zrušení termínu nebylo dosud doručeno. Zkontrolujte stav odeslání a v případě potřeby znovu odešlete potvrzovací SMS zprávu.", "_min": 1.5},
+            {"Pacient": "Pavel Černý", "Důvod hovoru": "Kontrola", "Požadavek": "Objednat", "Čas": "15:15", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 2.2},
+            {"Pacient": "Jana Malá", "Důvod hovoru": "Hygiena", "Požadavek": "Přesunout", "Čas": "12:00", "Výsledek": "✅ Rezervace potvrzena", "Popis problému": "", "_min": 2.0}
         ],
         "simulation_tasks": [
             {"task": "Zavolat zpět paní Dvořákové ohledně zrušeného termínu", "priority": "Vysoká", "status": "Čeká"},
@@ -45,26 +57,19 @@ AGENTS_DATA = [
         "name": "Leo",
         "role": "Příprava karet pacientů",
         "avatar": get_agent_avatar("leo"),
+        "avatar_2x": get_agent_avatar_2x("leo"),
         "notification": "5 karet pacientů čeká na import",
-        "kpis": [
-            ["📘 Vytvořené karty", "8"],
-            ["📕 Zpracované archivy", "52"]
-        ],
-        "mini_kpis": [
-            ["📘", "8"],
-            ["📕", "52"],
-            ["✅", "98%"],
-            ["⏱️", "1.5m"]
-        ],
+        # Historical aggregates before the rows below; KPIs are computed by kpi_engine
+        "kpi_baseline": {"count": 92, "successes": 92, "archived": 46, "duration_total": 137.5, "duration_count": 92},
         "rows": [
-            {"Soubor": "patient_card_1.pdf", "Status": "✅ Nahráno", "Velikost": "856 kB", "Archiv": "archiv_2", "Popis problému": ""},
-            {"Soubor": "patient_card_2.pdf", "Status": "✅ Nahráno", "Velikost": "423 kB", "Archiv": "archiv_1", "Popis problému": ""},
-            {"Soubor": "patient_card_3.pdf", "Status": "⚠️ Chybí příloha", "Velikost": "234 kB", "Archiv": "archiv_3", "Popis problému": "V karetě pacienta chybí povinná příloha (pravděpodobně kopie občanského průkazu nebo pojišťovací karty). Zkontrolujte dokumentaci a doplňte chybějící přílohu před archivací."},
-            {"Soubor": "patient_card_4.pdf", "Status": "✅ Nahráno", "Velikost": "1087 kB", "Archiv": "archiv_2", "Popis problému": ""},
-            {"Soubor": "patient_card_5.pdf", "Status": "✅ Nahráno", "Velikost": "645 kB", "Archiv": "archiv_4", "Popis problému": ""},
-            {"Soubor": "patient_card_6.pdf", "Status": "⏳ Ve frontě", "Velikost": "512 kB", "Archiv": "archiv_1", "Popis problému": "Karta pacienta čeká ve frontě na zpracování již delší dobu. Zkontrolujte, zda nedošlo k chybě při importu a případně znovu spusťte proces nahrání."},
-            {"Soubor": "patient_card_7.pdf", "Status": "✅ Nahráno", "Velikost": "789 kB", "Archiv": "archiv_3", "Popis problému": ""},
-            {"Soubor": "patient_card_8.pdf", "Status": "✅ Nahráno", "Velikost": "956 kB", "Archiv": "archiv_2", "Popis problému": ""}
+            {"Soubor": "patient_card_1.pdf", "Status": "✅ Nahráno", "Velikost": "856 kB", "Archiv": "archiv_2", "Popis problému": "", "_min": 1.2},
+            {"Soubor": "patient_card_2.pdf", "Status": "✅ Nahráno", "Velikost": "423 kB", "Archiv": "archiv_1", "Popis problému": "", "_min": 1.6},
+            {"Soubor": "patient_card_3.pdf", "Status": "⚠️ Chybí příloha", "Velikost": "234 kB", "Archiv": "archiv_3", "Popis problému": "V karetě pacienta chybí povinná příloha (pravděpodobně kopie občanského průkazu nebo pojišťovací karty). Zkontrolujte dokumentaci a doplňte chybějící přílohu před archivací.", "_min": 2.4},
+            {"Soubor": "patient_card_4.pdf", "Status": "✅ Nahráno", "Velikost": "1087 kB", "Archiv": "archiv_2", "Popis problému": "", "_min": 1.1},
+            {"Soubor": "patient_card_5.pdf", "Status": "✅ Nahráno", "Velikost": "645 kB", "Archiv": "archiv_4", "Popis problému": "", "_min": 1.4},
+            {"Soubor": "patient_card_6.pdf", "Status": "⏳ Ve frontě", "Velikost": "512 kB", "Archiv": "archiv_1", "Popis problému": "Karta pacienta čeká ve frontě na zpracování již delší dobu. Zkontrolujte, zda nedošlo k chybě při importu a případně znovu spusťte proces nahrání.", "_min": 2.0},
+            {"Soubor": "patient_card_7.pdf", "Status": "✅ Nahráno", "Velikost": "789 kB", "Archiv": "archiv_3", "Popis problému": "", "_min": 1.3},
+            {"Soubor": "patient_card_8.pdf", "Status": "✅ Nahráno", "Velikost": "956 kB", "Archiv": "archiv_2", "Popis problému": "", "_min": 1.5}
         ],
         "simulation_tasks": [
             {"task": "Zkontrolovat a doplnit chybějící přílohy u karty patient_card_3.pdf", "priority": "Vysoká", "status": "Čeká"},
@@ -77,26 +82,19 @@ AGENTS_DATA = [
         "name": "Gabriel",
         "role": "Kontrola e-mailů",
         "avatar": get_agent_avatar("gabriel"),
+        "avatar_2x": get_agent_avatar_2x("gabriel"),
         "notification": "7 e-mailů vyžaduje okamžitou pozornost",
-        "kpis": [
-            ["📪 Zpracované e-maily", "121"],
-            ["⚠️ Nalezené problémy", "7"]
-        ],
-        "mini_kpis": [
-            ["📪", "121"],
-            ["⚠️", "7"],
-            ["✅", "91%"],
-            ["⏱️", "3.1m"]
-        ],
+        # Historical aggregates before the rows below; KPIs are computed by kpi_engine
+        "kpi_baseline": {"count": 113, "successes": 105, "issues": 3, "duration_total": 350.9, "duration_count": 113},
         "rows": [
-            {"Odesílatel": "patient15@mail.cz", "Téma": "Dotaz na pojištění", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "Pacient se dotazuje na krytí pojišťovnou pro konkrétní zákrok. Je potřeba zkontrolovat jeho pojištění a odpovědět s přesnými informacemi o hrazení léčby."},
-            {"Odesílatel": "patient23@mail.cz", "Téma": "Zrušení termínu", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": ""},
-            {"Odesílatel": "patient8@mail.cz", "Téma": "Neodpovězený e-mail", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "E-mail od pacienta zůstal neodpovězený déle než 48 hodin. Je nutné neprodleně odpovědět a omluvit se za zpoždění, případně nabídnout alternativní řešení."},
-            {"Odesílatel": "patient42@mail.cz", "Téma": "Pozdní potvrzení", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": ""},
-            {"Odesílatel": "patient31@mail.cz", "Téma": "Přeposlaný mail", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": ""},
-            {"Odesílatel": "patient19@mail.cz", "Téma": "Dotaz na pojištění", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": ""},
-            {"Odesílatel": "patient5@mail.cz", "Téma": "Zrušení termínu", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "Pacient žádá o zrušení termínu, ale automatické potvrzení nebylo odesláno. Zkontrolujte důvod zrušení a potvrďte pacientovi zrušení termínu, případně nabídněte náhradní termín."},
-            {"Odesílatel": "patient37@mail.cz", "Téma": "Neodpovězený e-mail", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": ""}
+            {"Odesílatel": "patient15@mail.cz", "Téma": "Dotaz na pojištění", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "Pacient se dotazuje na krytí pojišťovnou pro konkrétní zákrok. Je potřeba zkontrolovat jeho pojištění a odpovědět s přesnými informacemi o hrazení léčby.", "_min": 4.2},
+            {"Odesílatel": "patient23@mail.cz", "Téma": "Zrušení termínu", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": "", "_min": 1.9},
+            {"Odesílatel": "patient8@mail.cz", "Téma": "Neodpovězený e-mail", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "E-mail od pacienta zůstal neodpovězený déle než 48 hodin. Je nutné neprodleně odpovědět a omluvit se za zpoždění, případně nabídnout alternativní řešení.", "_min": 3.8},
+            {"Odesílatel": "patient42@mail.cz", "Téma": "Pozdní potvrzení", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": "", "_min": 2.2},
+            {"Odesílatel": "patient31@mail.cz", "Téma": "Přeposlaný mail", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": "", "_min": 2.5},
+            {"Odesílatel": "patient19@mail.cz", "Téma": "Dotaz na pojištění", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": "", "_min": 2.0},
+            {"Odesílatel": "patient5@mail.cz", "Téma": "Zrušení termínu", "Zjištěno": "Ano", "Komentář": "⚠️ Vyžaduje reakci", "Popis problému": "Pacient žádá o zrušení termínu, ale automatické potvrzení nebylo odesláno. Zkontrolujte důvod zrušení a potvrďte pacientovi zrušení termínu, případně nabídněte náhradní termín.", "_min": 4.6},
+            {"Odesílatel": "patient37@mail.cz", "Téma": "Neodpovězený e-mail", "Zjištěno": "Ne", "Komentář": "✅ Zpracováno automaticky", "Popis problému": "", "_min": 3.0}
         ],
         "simulation_tasks": [
             {"task": "Odpovědět na dotaz ohledně pojištění od patient15@mail.cz", "priority": "Vysoká", "status": "Čeká"},
@@ -109,17 +107,10 @@ AGENTS_DATA = [
         "name": "Nora",
         "role": "Shrnutí pacienta",
         "avatar": get_agent_avatar("nora"),
+        "avatar_2x": get_agent_avatar_2x("nora"),
         "notification": "2 shrnutí pacientů připraveno ke kontrole",
-        "kpis": [
-            ["🕐 Ušetřený čas", "86 min"],
-            ["🧾 Shrnutých pacientů", "12"]
-        ],
-        "mini_kpis": [
-            ["🕐", "86m"],
-            ["🧾", "12"],
-            ["✅", "100%"],
-            ["⏱️", "4.2m"]
-        ],
+        # Historical aggregates before the rows below; KPIs are computed by kpi_engine
+        "kpi_baseline": {"count": 4, "successes": 4, "saved": 35, "duration_total": 21.4, "duration_count": 4},
         "rows": [
             {"Pacient": "Eva Dvořáková", "Pojišťovna": "VZP", "Shrnutí": "Bez kazů", "Čas přípravy": "3 min", "Popis problému": ""},
             {"Pacient": "Jan Šimek", "Pojišťovna": "OZP", "Shrnutí": "Doporučena hygiena", "Čas přípravy": "2 min", "Popis problému": ""},
@@ -141,23 +132,16 @@ AGENTS_DATA = [
         "name": "Auditor",
         "role": "Kontrola záznamů",
         "avatar": get_agent_avatar("auditor"),
+        "avatar_2x": get_agent_avatar_2x("auditor"),
         "notification": "3 nesrovnalosti nalezeny při auditu",
-        "kpis": [
-            ["📋 Zkontrolované záznamy", "245"],
-            ["⚠️ Nalezené problémy", "3"]
-        ],
-        "mini_kpis": [
-            ["📋", "245"],
-            ["⚠️", "3"],
-            ["✅", "99%"],
-            ["⏱️", "0.8m"]
-        ],
+        # Historical aggregates before the rows below; KPIs are computed by kpi_engine
+        "kpi_baseline": {"count": 240, "successes": 240, "issues": 0, "duration_total": 190.9, "duration_count": 240},
         "rows": [
-            {"Pacient": "Jan Novák", "Problém": "Chybí podpis lékaře", "Priorita": "Vysoká", "Link": "https://dentalsystem.cz/record/1", "Popis problému": "V záznamu pacienta chybí povinný podpis ošetřujícího lékaře. Zkontrolujte dokumentaci a zajistěte doplnění podpisu před archivací záznamu."},
-            {"Pacient": "Petra Svobodová", "Problém": "Nesoulad fakturace", "Priorita": "Vysoká", "Link": "https://dentalsystem.cz/record/2", "Popis problému": "Byl zjištěn nesoulad mezi provedenými zákroky a fakturovanými položkami. Je nutné zkontrolovat fakturaci a opravit případné chyby v účtování."},
-            {"Pacient": "Tomáš Dvořák", "Problém": "Neúplná anamnéza", "Priorita": "Střední", "Link": "https://dentalsystem.cz/record/3", "Popis problému": "Anamnéza pacienta je neúplná - chybí některé povinné údaje. Doplňte chybějící informace do anamnézy před dalším použitím záznamu."},
-            {"Pacient": "Eva Malá", "Problém": "Chybějící rentgen", "Priorita": "Nízká", "Link": "https://dentalsystem.cz/record/4", "Popis problému": "K záznamu pacientky chybí rentgenový snímek, který byl zmíněn v dokumentaci. Zkontrolujte, zda byl snímek nahrán do systému, nebo zda je potřeba ho doplnit."},
-            {"Pacient": "Lukáš Černý", "Problém": "Duplicitní záznam", "Priorita": "Střední", "Link": "https://dentalsystem.cz/record/5", "Popis problému": "Byl nalezen duplicitní záznam pro stejného pacienta. Zkontrolujte oba záznamy, rozhodněte, který je správný, a odstraňte nebo sloučte duplicitní záznam."}
+            {"Pacient": "Jan Novák", "Problém": "Chybí podpis lékaře", "Priorita": "Vysoká", "Link": "https://dentalsystem.cz/record/1", "Popis problému": "V záznamu pacienta chybí povinný podpis ošetřujícího lékaře. Zkontrolujte dokumentaci a zajistěte doplnění podpisu před archivací záznamu.", "_min": 1.2},
+            {"Pacient": "Petra Svobodová", "Problém": "Nesoulad fakturace", "Priorita": "Vysoká", "Link": "https://dentalsystem.cz/record/2", "Popis problému": "Byl zjištěn nesoulad mezi provedenými zákroky a fakturovanými položkami. Je nutné zkontrolovat fakturaci a opravit případné chyby v účtování.", "_min": 1.4},
+            {"Pacient": "Tomáš Dvořák", "Problém": "Neúplná anamnéza", "Priorita": "Střední", "Link": "https://dentalsystem.cz/record/3", "Popis problému": "Anamnéza pacienta je neúplná - chybí některé povinné údaje. Doplňte chybějící informace do anamnézy před dalším použitím záznamu.", "_min": 0.9},
+            {"Pacient": "Eva Malá", "Problém": "Chybějící rentgen", "Priorita": "Nízká", "Link": "https://dentalsystem.cz/record/4", "Popis problému": "K záznamu pacientky chybí rentgenový snímek, který byl zmíněn v dokumentaci. Zkontrolujte, zda byl snímek nahrán do systému, nebo zda je potřeba ho doplnit.", "_min": 0.6},
+            {"Pacient": "Lukáš Černý", "Problém": "Duplicitní záznam", "Priorita": "Střední", "Link": "https://dentalsystem.cz/record/5", "Popis problému": "Byl nalezen duplicitní záznam pro stejného pacienta. Zkontrolujte oba záznamy, rozhodněte, který je správný, a odstraňte nebo sloučte duplicitní záznam.", "_min": 1.0}
         ],
         "simulation_tasks": [
             {"task": "Doplnit chybějící podpis lékaře u záznamu pana Nováka", "priority": "Vysoká", "status": "Čeká"},
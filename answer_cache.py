@@ -0,0 +1,69 @@
+"""
+Answer cache for repeated chat questions
+Answers are keyed by the normalized question, the version of the data the
+user may see (role-filtered agent data fingerprint) and a hash of the
+latest history exchange. Any change to the agent rows or KPIs produces a
+new fingerprint, so stale answers are never served (except as a fallback
+while Azure is unavailable); old entries simply age out by TTL/LRU.
+"""
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional
+
+from azure_chat import agents_data_fingerprint
+from retrieval import fold_text
+from ttl_cache import TTLCache
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("DENTAL_IQ_ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("DENTAL_IQ_ANSWER_CACHE_TTL", "300"))
+
+# History messages that make a follow-up question mean something else
+ANSWER_CACHE_HISTORY_MESSAGES = 2
+
+# Last answer per question regardless of data version, served only while
+# Azure is unavailable
+STALE_ANSWER_TTL_SECONDS = float(os.getenv("DENTAL_IQ_STALE_ANSWER_TTL", "3600"))
+
+_answers = TTLCache(ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL_SECONDS)
+_latest_answers = TTLCache(ANSWER_CACHE_MAX_ENTRIES, STALE_ANSWER_TTL_SECONDS)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+_SPACES_RE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """"Kolik hovorů čeká?" and "kolik hovoru ceka" map to the same key"""
+    text = _PUNCTUATION_RE.sub(" ", fold_text(text))
+    return _SPACES_RE.sub(" ", text).strip()
+
+
+def _history_hash(chat_history: List[Dict]) -> str:
+    recent = (chat_history or [])[-ANSWER_CACHE_HISTORY_MESSAGES:]
+    text = "\n".join(f"{m.get('who', '')}:{m.get('text', '')}" for m in recent)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def answer_cache_key(client_id: str, question: str, agents_data: List[Dict], chat_history: List[Dict]) -> tuple:
+    return (
+        client_id,
+        normalize_question(question),
+        # Agents the role may see - stale fallbacks never cross roles
+        tuple(agent.get("id", "") for agent in agents_data),
+        agents_data_fingerprint(agents_data),
+        _history_hash(chat_history)
+    )
+
+
+def get_cached_answer(key: tuple) -> Optional[str]:
+    return _answers.get(key)
+
+
+def store_answer(key: tuple, answer: str):
+    _answers.set(key, answer)
+    _latest_answers.set(key[:3], answer)
+
+
+def get_stale_answer(key: tuple) -> Optional[str]:
+    """Most recent answer to the question for the same clinic and agents, possibly on older data"""
+    return _latest_answers.get(key[:3])
@@ -0,0 +1,312 @@
+"""
+Lightweight sidecar HTTP server running next to Streamlit
+Serves registered static assets (agent avatars) under content-hashed URLs
+with long-lived cache headers, so browsers download them only once, and
+answers chat requests (POST /chat, POST /chat/stream) without a Streamlit
+script rerun. A new chat request of a session cancels its previous one, as
+does POST /chat/cancel (chat closed). POST /payload returns a full
+dashboard payload to a browser that lost track of the deltas. GET /metrics exports the in-process
+metrics (metrics.py) and the prompt cache usage summary (usage_stats.py)
+to local clients.
+"""
+import os
+import json
+import threading
+import mimetypes
+from urllib.parse import parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Optional, Tuple
+
+from config import APP_SERVER_HOST, APP_SERVER_PORT, APP_SERVER_PUBLIC_URL
+from azure_chat import is_error_response
+from chat_api import handle_chat_request, handle_chat_stream
+from chat_sessions import begin_chat_request, cancel_chat_request, end_chat_request, get_chat_session
+from metrics import get_metrics, stage
+from usage_stats import get_usage_stats
+
+# Hashed URLs never change content, so they can be cached "forever"
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Chat requests carry a message and little else
+MAX_REQUEST_BODY_BYTES = 64 * 1024
+
+# /metrics is served to loopback clients only unless enabled here
+METRICS_ALLOW_REMOTE = os.getenv("DENTAL_IQ_METRICS_ALLOW_REMOTE", "0") == "1"
+
+# url path -> (file path, content type, etag)
+_static_files: Dict[str, Tuple[str, str, str]] = {}
+_static_lock = threading.Lock()
+
+_server: Optional[ThreadingHTTPServer] = None
+_server_lock = threading.Lock()
+
+
+def register_static_file(url_path: str, file_path: str, etag: str, content_type: str = None):
+    """Expose a file under url_path (which should contain its content hash)"""
+    if content_type is None:
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    with _static_lock:
+        _static_files[url_path] = (file_path, content_type, etag)
+
+
+def get_public_url() -> str:
+    """Base URL of the sidecar for the browser ("" = derive from page host)"""
+    return APP_SERVER_PUBLIC_URL
+
+
+class AppRequestHandler(BaseHTTPRequestHandler):
+    """Request handler for the sidecar routes"""
+
+    server_version = "DentalIQ"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # Keep the Streamlit console clean
+        pass
+
+    def _send_cors_headers(self):
+        self.send_header("Access-Control-Allow-Origin", "*")
+
+    def _send_empty(self, status: int):
+        self.send_response(status)
+        self._send_cors_headers()
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_OPTIONS(self):
+        self.send_response(204)
+        self._send_cors_headers()
+        self.send_header("Access-Control-Allow-Methods", "GET, POST, OPTIONS")
+        self.send_header("Access-Control-Allow-Headers", "Content-Type, Authorization")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._handle_metrics()
+            return
+        with _static_lock:
+            entry = _static_files.get(path)
+        if entry is None:
+            self._send_empty(404)
+            return
+        self._serve_static(*entry)
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/chat":
+            with stage("chat_request"):
+                self._handle_chat()
+        elif path == "/chat/stream":
+            with stage("chat_stream_request"):
+                self._handle_chat_stream()
+        elif path == "/chat/cancel":
+            self._handle_chat_cancel()
+        elif path == "/payload":
+            with stage("payload_resync"):
+                self._handle_payload_resync()
+        else:
+            self._send_empty(404)
+
+    def _send_json(self, status: int, data: dict):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self._send_cors_headers()
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json_body(self):
+        """Parse the JSON request body; returns None if missing or invalid"""
+        try:
+            length = int(self.headers.get("Content-Length", "0"))
+        except ValueError:
+            return None
+        if length <= 0 or length > MAX_REQUEST_BODY_BYTES:
+            return None
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return None
+
+    def _get_session(self):
+        auth = self.headers.get("Authorization", "")
+        token = auth[7:] if auth.startswith("Bearer ") else ""
+        return get_chat_session(token)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _read_chat_request(self):
+        """
+        Authenticate and parse a chat request
+        Returns (session, request data) or (None, None) after sending an error
+        """
+        body = self._read_json_body()
+        session = self._get_session()
+        if session is None:
+            self._send_json(401, {"error": "Invalid session"})
+            return None, None
+        if not body or not isinstance(body.get("message"), str) or not body["message"].strip():
+            self._send_json(400, {"error": "No message provided"})
+            return None, None
+
+        with stage("session_snapshot"):
+            agents_data = session.agent_data.snapshot()
+        request_data = {
+            "message": body["message"].strip(),
+            "agents_data": agents_data,
+            "chat_history": list(session.chat_history),
+            "client_id": session.user_info.get("client_id"),
+            "job_role": session.user_info.get("job_role", "admin"),
+            "history_summary": session.history_compactor.summary if session.history_compactor else "",
+            # Supersedes (cancels) the session's previous request
+            "cancel": begin_chat_request(session.token)
+        }
+        return session, request_data
+
+    def _record_exchange(self, session, request_data: dict, response: str):
+        """Append the exchange to the session history and fold old turns if needed"""
+        if request_data["cancel"].cancelled:
+            # A newer message superseded this one - drop the late answer
+            return
+        session.chat_history.append({"who": "user", "text": request_data["message"]})
+        session.chat_history.append({"who": "bot", "text": response})
+        if session.history_compactor:
+            session.history_compactor.maybe_compact(session.chat_history, request_data["client_id"])
+
+    def _handle_chat(self):
+        """Answer a chat message with a single JSON response"""
+        session, request_data = self._read_chat_request()
+        if session is None:
+            return
+        try:
+            result = handle_chat_request(request_data)
+        finally:
+            end_chat_request(session.token, request_data["cancel"])
+        # Error messages are not answers - keep them out of the history the model sees
+        if "response" in result and not is_error_response(result["response"]):
+            self._record_exchange(session, request_data, result["response"])
+        if result.get("cancelled") or request_data["cancel"].cancelled:
+            self._send_json(409, {"error": "Cancelled", "cancelled": True})
+            return
+        self._send_json(200 if "response" in result else 400, result)
+
+    def _handle_chat_stream(self):
+        """Stream a chat answer as NDJSON events ({"delta": ...}, then {"done": ...})"""
+        session, request_data = self._read_chat_request()
+        if session is None:
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson; charset=utf-8")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Transfer-Encoding", "chunked")
+        self._send_cors_headers()
+        self.end_headers()
+
+        events = handle_chat_stream(request_data)
+        try:
+            for event in events:
+                self._write_chunk((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+                if event.get("done"):
+                    self._record_exchange(session, request_data, event["response"])
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # Browser went away - closing the generator aborts the upstream stream
+            pass
+        finally:
+            events.close()
+            end_chat_request(session.token, request_data["cancel"])
+
+    def _handle_chat_cancel(self):
+        """Cancel the session's in-flight chat request (chat closed)"""
+        session = self._get_session()
+        if session is None:
+            self._send_json(401, {"error": "Invalid session"})
+            return
+        self._send_json(200, {"cancelled": cancel_chat_request(session.token)})
+
+    def _handle_payload_resync(self):
+        """Full dashboard payload for a browser whose state missed a version"""
+        session = self._get_session()
+        if session is None or session.payload_tracker is None:
+            self._send_json(401, {"error": "Invalid session"})
+            return
+        self._send_json(200, session.payload_tracker.resync(session.agent_data))
+
+    def _handle_metrics(self):
+        """Metrics as JSON, or Prometheus text with ?format=prometheus"""
+        if not METRICS_ALLOW_REMOTE and self.client_address[0] not in ("127.0.0.1", "::1"):
+            self._send_empty(403)
+            return
+        query = parse_qs(self.path.split("?", 1)[1]) if "?" in self.path else {}
+        if query.get("format", [""])[0] != "prometheus":
+            self._send_json(200, dict(get_metrics().to_json(), usage=get_usage_stats().summary()))
+            return
+        body = (get_metrics().to_prometheus() + get_usage_stats().to_prometheus()).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+    def _serve_static(self, file_path: str, content_type: str, etag: str):
+        quoted_etag = f'"{etag}"'
+        if self.headers.get("If-None-Match") == quoted_etag:
+            self.send_response(304)
+            self.send_header("ETag", quoted_etag)
+            self.send_header("Cache-Control", IMMUTABLE_CACHE_CONTROL)
+            self._send_cors_headers()
+            self.end_headers()
+            return
+        try:
+            with open(file_path, "rb") as f:
+                body = f.read()
+        except OSError:
+            self._send_empty(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", IMMUTABLE_CACHE_CONTROL)
+        self.send_header("ETag", quoted_etag)
+        self.send_header("X-Content-Type-Options", "nosniff")
+        self._send_cors_headers()
+        self.end_headers()
+        if self.command != "HEAD":
+            self.wfile.write(body)
+
+
+def ensure_app_server() -> bool:
+    """
+    Start the sidecar server once per process (Streamlit reruns share it)
+    Returns True if the server is running
+    """
+    global _server
+    with _server_lock:
+        if _server is not None:
+            return True
+        try:
+            _server = ThreadingHTTPServer((APP_SERVER_HOST, APP_SERVER_PORT), AppRequestHandler)
+        except OSError as e:
+            print(f"Error starting app server on port {APP_SERVER_PORT}: {e}")
+            return False
+        _server.daemon_threads = True
+        thread = threading.Thread(target=_server.serve_forever, name="dental-iq-app-server", daemon=True)
+        thread.start()
+        return True
+
+
+def is_app_server_running() -> bool:
+    """Check whether the sidecar server was started in this process"""
+    return _server is not None
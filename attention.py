@@ -0,0 +1,94 @@
+"""
+Attention classification for agent rows
+Rows are classified once when they enter the agent store; the result is
+kept on the row as a compact reason code and the store maintains a
+per-agent index of attention row ids, so the dashboard never has to scan
+row text again
+"""
+from typing import Dict
+
+ATTENTION_KEY = "_a"
+
+# Reason codes (0 = row is fine)
+REASON_NONE = 0
+REASON_INDICATOR = 1      # generic indicator text (Nesoulad, Duplicitní, ...)
+REASON_PENDING = 2        # ⏳ / Čeká / Ve frontě
+REASON_TRANSFERRED = 3    # 📞 Přepojeno na recepci
+REASON_WARNING = 4        # ⚠️ Vyžaduje reakci / Chybí příloha
+REASON_FLAGGED = 5        # Gabriel: Zjištěno = Ano
+REASON_FINDING = 6        # Nora: Drobné záněty / Nutná kontrola
+REASON_AUDIT = 7          # Auditor: every record needs review
+
+REASON_LABELS = {
+    REASON_NONE: "",
+    REASON_INDICATOR: "Nalezen problém",
+    REASON_PENDING: "Čeká na zpracování",
+    REASON_TRANSFERRED: "Přepojeno",
+    REASON_WARNING: "Vyžaduje reakci",
+    REASON_FLAGGED: "Zjištěno",
+    REASON_FINDING: "Nutná kontrola",
+    REASON_AUDIT: "Audit",
+}
+
+# Lowercased once; matched against all row values
+ATTENTION_INDICATORS = tuple(i.lower() for i in (
+    '⚠️', '⏳', '📞',
+    'Chybí', 'Nalezeno', 'Problém', 'Neodpovězený',
+    'Přepojeno', 'Čeká', 'Vyžaduje', 'Nesoulad',
+    'Chybějící', 'Neúplná', 'Duplicitní'
+))
+
+
+def _indicator_reason(row: Dict) -> int:
+    values = " ".join(str(v) for k, v in row.items() if not k.startswith("_")).lower()
+    for indicator in ATTENTION_INDICATORS:
+        if indicator in values:
+            if indicator == '⏳' or indicator == 'čeká':
+                return REASON_PENDING
+            if indicator == '📞' or indicator == 'přepojeno':
+                return REASON_TRANSFERRED
+            if indicator == '⚠️' or indicator == 'vyžaduje' or indicator == 'chybí':
+                return REASON_WARNING
+            return REASON_INDICATOR
+    return REASON_NONE
+
+
+def classify_row(agent_id: str, row: Dict) -> int:
+    """Return the attention reason code for a row (REASON_NONE if fine)"""
+    if agent_id == "auditor":
+        # All auditor rows need attention
+        return REASON_AUDIT
+
+    reason = _indicator_reason(row)
+    if reason:
+        return reason
+
+    # Agent-specific fields
+    if agent_id == "isabella":
+        result = row.get("Výsledek", "")
+        if "⏳" in result or "Čeká" in result:
+            return REASON_PENDING
+        if "📞" in result:
+            return REASON_TRANSFERRED
+    elif agent_id == "gabriel":
+        if "⚠️" in row.get("Komentář", ""):
+            return REASON_WARNING
+        if row.get("Zjištěno", "") == "Ano":
+            return REASON_FLAGGED
+    elif agent_id == "leo":
+        status = row.get("Status", "")
+        if "⚠️" in status or "Chybí" in status:
+            return REASON_WARNING
+        if "⏳" in status:
+            return REASON_PENDING
+    elif agent_id == "nora":
+        summary = row.get("Shrnutí", "")
+        if "Drobné" in summary or "Nutná" in summary:
+            return REASON_FINDING
+    return REASON_NONE
+
+
+def classify_rows(agent_id: str, rows) -> None:
+    """Store the reason code on each row (in place)"""
+    for row in rows:
+        row[ATTENTION_KEY] = classify_row(agent_id, row)
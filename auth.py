@@ -3,7 +3,9 @@ Authentication module for Dental IQ
 Handles user login, logout, and session management
 """
 import hashlib
+import secrets
 import streamlit as st
+from chat_sessions import unregister_chat_session
 
 # Mock user database - in production, this would be a real database
 USERS_DB = {
@@ -37,6 +39,18 @@ USERS_DB = {
     }
 }
 
+# Agents visible to each job role (mirrored by ROLE_AGENT_ACCESS in main.js)
+ROLE_AGENT_ACCESS = {
+    "doctor": ["nora", "auditor"],
+    "receptionist": ["isabella", "gabriel", "leo"],
+    "admin": ["isabella", "leo", "gabriel", "nora", "auditor"]
+}
+
+def filter_agents_for_role(agents_data: list, job_role: str) -> list:
+    """Keep only the agents a job role may see (unknown roles see all, like the UI)"""
+    allowed = ROLE_AGENT_ACCESS.get(job_role) or ROLE_AGENT_ACCESS["admin"]
+    return [agent for agent in agents_data if agent.get("id") in allowed]
+
 def hash_password(password: str) -> str:
     """Hash a password using SHA256"""
     return hashlib.sha256(password.encode()).hexdigest()
@@ -72,12 +86,19 @@ def login_user(user_info: dict):
     st.session_state.logged_in = True
     st.session_state.user_info = user_info
     st.session_state.show_welcome = True
+    # Bearer token for the sidecar chat endpoint (see chat_sessions.py);
+    # kept apart from _session_token, the localStorage restore token
+    st.session_state._chat_token = secrets.token_urlsafe(32)
 
 def logout_user():
     """Clear user session"""
     st.session_state.logged_in = False
     st.session_state.user_info = None
     st.session_state.show_welcome = False
+    if st.session_state.get("_chat_token"):
+        unregister_chat_session(st.session_state._chat_token)
+        st.session_state._chat_token = ""
+    st.session_state._session_token = ""
     # Clear other session data
     if "simulate_active" in st.session_state:
         st.session_state.simulate_active = False
@@ -85,6 +106,12 @@ def logout_user():
         st.session_state.selected_agent = ""
     if "chat_history" in st.session_state:
         st.session_state.chat_history = []
+    if "agent_data" in st.session_state:
+        del st.session_state["agent_data"]
+    if "payload_tracker" in st.session_state:
+        del st.session_state["payload_tracker"]
+    if "history_compactor" in st.session_state:
+        del st.session_state["history_compactor"]
 
 def is_logged_in() -> bool:
     """Check if user is logged in"""
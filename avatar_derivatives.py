@@ -0,0 +1,116 @@
+"""
+Avatar derivative build step
+Produces small resized/recompressed variants of the agent avatar PNGs
+(1x/2x of the 120px agent circle) in an on-disk cache keyed by the
+source file hash, so a variant is rebuilt only when its source changes
+
+Run `python avatar_derivatives.py` to prebuild all variants; otherwise
+they are built lazily the first time an avatar is requested.
+"""
+import os
+import threading
+from typing import List, Optional, Tuple
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow is optional - originals are served without it
+    Image = None
+
+# Pixel sizes of generated variants (1x and 2x of the 120px agent circle)
+AVATAR_VARIANT_SIZES = (120, 240)
+VARIANT_FORMAT = "webp"
+VARIANT_CONTENT_TYPE = "image/webp"
+VARIANT_QUALITY = 82
+
+_build_lock = threading.Lock()
+
+
+def get_cache_dir() -> str:
+    """Directory holding built avatar variants"""
+    return os.path.join(os.path.dirname(__file__), 'static', 'avatars', 'cache')
+
+
+def get_variant_path(name: str, source_hash: str, size: int) -> str:
+    """Cache path of one variant; the source hash makes stale files unreachable"""
+    return os.path.join(get_cache_dir(), f"{name}-{source_hash[:16]}-{size}.{VARIANT_FORMAT}")
+
+
+def _prune_stale_variants(name: str, source_hash: str):
+    """Remove variants built from older versions of the source file"""
+    prefix = f"{name}-"
+    current = f"{name}-{source_hash[:16]}-"
+    for filename in os.listdir(get_cache_dir()):
+        if filename.startswith(prefix) and not filename.startswith(current):
+            # Only touch files matching our naming scheme (name-hash-size.ext)
+            if filename[len(prefix):].count("-") == 1:
+                try:
+                    os.remove(os.path.join(get_cache_dir(), filename))
+                except OSError:
+                    pass
+
+
+def _render_variant(source_path: str, target_path: str, size: int):
+    """Center-crop to a square, resize and recompress one variant"""
+    with Image.open(source_path) as img:
+        img = img.convert("RGBA")
+        img = ImageOps.fit(img, (size, size), method=Image.LANCZOS)
+        tmp_path = f"{target_path}.{os.getpid()}.tmp"
+        img.save(tmp_path, format=VARIANT_FORMAT.upper(), quality=VARIANT_QUALITY, method=6)
+    os.replace(tmp_path, target_path)
+
+
+def build_variants(name: str, source_path: str, source_hash: str) -> List[Tuple[int, str]]:
+    """
+    Ensure all variants of a source image exist
+    Returns list of (size, path) sorted by size; empty if Pillow is unavailable
+    """
+    if Image is None:
+        return []
+
+    variants = [(size, get_variant_path(name, source_hash, size)) for size in AVATAR_VARIANT_SIZES]
+    if all(os.path.exists(path) for _, path in variants):
+        return variants
+
+    with _build_lock:
+        os.makedirs(get_cache_dir(), exist_ok=True)
+        try:
+            for size, path in variants:
+                if not os.path.exists(path):
+                    _render_variant(source_path, path, size)
+        except Exception as e:
+            print(f"Error building avatar variants for {name}: {e}")
+            return []
+        _prune_stale_variants(name, source_hash)
+    return variants
+
+
+def pick_variant(variants: List[Tuple[int, str]], size: Optional[int]) -> Optional[Tuple[int, str]]:
+    """
+    Pick the smallest variant that is at least `size` pixels
+    Returns None if no variant is large enough (caller uses the original)
+    """
+    if not variants:
+        return None
+    if size is None:
+        return variants[-1]
+    for variant in variants:
+        if variant[0] >= size:
+            return variant
+    return None
+
+
+if __name__ == "__main__":
+    from avatars_config import DEFAULT_AVATARS, get_avatar_path, get_avatar_hash
+
+    if Image is None:
+        print("Pillow is not installed - install it with `pip install pillow`")
+        raise SystemExit(1)
+
+    for agent_id in DEFAULT_AVATARS:
+        path = get_avatar_path(agent_id)
+        if not path:
+            print(f"{agent_id}: no custom avatar, skipping")
+            continue
+        built = build_variants(agent_id, path, get_avatar_hash(agent_id))
+        sizes = ", ".join(f"{size}px {os.path.getsize(p) // 1024} kB" for size, p in built)
+        print(f"{agent_id}: {os.path.getsize(path) // 1024} kB -> {sizes}")
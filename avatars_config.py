@@ -4,6 +4,11 @@ Place your custom PNG avatars in the 'static/avatars/' directory
 """
 import os
 import base64
+import hashlib
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from avatar_derivatives import build_variants, pick_variant, VARIANT_CONTENT_TYPE
 
 # Default emoji avatars (fallback)
 DEFAULT_AVATARS = {
@@ -20,22 +25,75 @@ def get_avatar_path(agent_id: str) -> str:
     avatar_file = os.path.join(avatars_dir, f"{agent_id}.png")
     return avatar_file if os.path.exists(avatar_file) else None
 
-def get_avatar_data_url(agent_id: str) -> str:
+@lru_cache(maxsize=64)
+def _file_sha256(path: str, mtime: float, size: int) -> str:
+    """Content hash of a file (cached per path/mtime/size)"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def get_avatar_hash(agent_id: str) -> str:
+    """Get content hash of the avatar PNG, or None if there is no custom avatar"""
+    avatar_path = get_avatar_path(agent_id)
+    if not avatar_path:
+        return None
+    stat = os.stat(avatar_path)
+    return _file_sha256(avatar_path, stat.st_mtime, stat.st_size)
+
+def _parse_size_px(size) -> Optional[int]:
+    """Convert 44 / "44px" to pixels; None for other units or no size"""
+    if size is None:
+        return None
+    if isinstance(size, int):
+        return size
+    size = str(size).strip()
+    if size.endswith("px"):
+        size = size[:-2]
+    try:
+        return int(float(size))
+    except ValueError:
+        return None
+
+def get_avatar_variant(agent_id: str, size=None) -> Optional[Tuple[int, str]]:
+    """
+    Get the smallest built derivative that fits the requested size
+    Returns (size, path) or None when the original PNG should be used
+    """
+    avatar_path = get_avatar_path(agent_id)
+    if not avatar_path:
+        return None
+    try:
+        variants = build_variants(agent_id, avatar_path, get_avatar_hash(agent_id))
+    except OSError as e:
+        print(f"Error preparing avatar variants for {agent_id}: {e}")
+        return None
+    return pick_variant(variants, _parse_size_px(size))
+
+def get_avatar_data_url(agent_id: str, size=None) -> str:
     """
     Get avatar as data URL for embedding in HTML
+    Uses the smallest derivative that fits `size` (px) when available
     Returns either:
+    - data:image/webp;base64,... for a resized derivative
     - data:image/png;base64,... for custom PNG
     - emoji character for default
     """
     avatar_path = get_avatar_path(agent_id)
     
     if avatar_path and os.path.exists(avatar_path):
-        # Read and encode PNG file
+        variant = get_avatar_variant(agent_id, size)
+        content_type = "image/png"
+        if variant:
+            avatar_path = variant[1]
+            content_type = VARIANT_CONTENT_TYPE
+        # Read and encode image file
         try:
             with open(avatar_path, 'rb') as f:
                 image_data = f.read()
                 base64_data = base64.b64encode(image_data).decode('utf-8')
-                return f"data:image/png;base64,{base64_data}"
+                return f"data:{content_type};base64,{base64_data}"
         except Exception as e:
             print(f"Error loading avatar for {agent_id}: {e}")
             return DEFAULT_AVATARS.get(agent_id, "👤")
@@ -43,13 +101,47 @@ def get_avatar_data_url(agent_id: str) -> str:
         # Return emoji fallback
         return DEFAULT_AVATARS.get(agent_id, "👤")
 
+def get_avatar_url(agent_id: str, size=None) -> str:
+    """
+    Get avatar as a content-hashed URL served by the sidecar app server
+    Uses the smallest derivative that fits `size` (px) when available
+    Returns either:
+    - /avatars/cache/<agent_id>-<hash>-<size>.webp for a resized derivative
+    - /avatars/<agent_id>.<hash>.png for custom PNG
+    - emoji character for default
+    """
+    from app_server import register_static_file, get_public_url
+
+    avatar_path = get_avatar_path(agent_id)
+    if not avatar_path:
+        return DEFAULT_AVATARS.get(agent_id, "👤")
+    try:
+        content_hash = get_avatar_hash(agent_id)
+    except OSError as e:
+        print(f"Error hashing avatar for {agent_id}: {e}")
+        return DEFAULT_AVATARS.get(agent_id, "👤")
+
+    variant = get_avatar_variant(agent_id, size)
+    if variant:
+        variant_size, variant_path = variant
+        url_path = f"/avatars/cache/{os.path.basename(variant_path)}"
+        register_static_file(url_path, variant_path, f"{content_hash}-{variant_size}", VARIANT_CONTENT_TYPE)
+    else:
+        url_path = f"/avatars/{agent_id}.{content_hash[:12]}.png"
+        register_static_file(url_path, avatar_path, content_hash, "image/png")
+    return get_public_url() + url_path
+
+def is_image_avatar(avatar: str) -> bool:
+    """Check whether an avatar value is an image (data URL or asset URL)"""
+    return avatar.startswith(("data:image", "/", "http://", "https://"))
+
 def get_avatar_html(agent_id: str, size: str = "44px") -> str:
     """
     Generate HTML for displaying avatar
     """
-    avatar = get_avatar_data_url(agent_id)
+    avatar = get_avatar_data_url(agent_id, size)
     
-    if avatar.startswith("data:image"):
+    if is_image_avatar(avatar):
         # It's a custom image - use img tag
         return f'<img src="{avatar}" style="width:{size};height:{size};border-radius:50%;object-fit:cover;" alt="{agent_id}">'
     else:
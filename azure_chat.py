@@ -3,37 +3,280 @@ Azure OpenAI chat integration
 """
 import os
 import json
+import atexit
+import hashlib
+import threading
+import time
+from collections import defaultdict
+import openai
 from openai import AzureOpenAI
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+
+from agent_tools import agents_overview, build_tool_schemas, run_tool
+from chat_executor import CancelToken, ChatCancelled, ChatQueueTimeout, get_chat_executor
+from metrics import get_metrics, observe_stage, stage
+from rate_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, get_rate_scheduler
+from resilience import CircuitOpenError, get_resilient_caller, retry_after_seconds
+from retrieval import RowIndex, row_text, tokenize
+from token_budget import INPUT_TOKEN_BUDGET, estimate_tokens, fit_prompt, message_tokens
+from ttl_cache import TTLCache
+from usage_stats import record_usage
+
+try:
+    import httpx  # installed with openai; used to tune the connection pool
+except ImportError:
+    httpx = None
+
+# Connection pool settings for the shared HTTP client
+AZURE_OPENAI_MAX_CONNECTIONS = int(os.getenv("AZURE_OPENAI_MAX_CONNECTIONS", "20"))
+AZURE_OPENAI_KEEPALIVE_SECONDS = float(os.getenv("AZURE_OPENAI_KEEPALIVE_SECONDS", "120"))
+AZURE_OPENAI_TIMEOUT_SECONDS = float(os.getenv("AZURE_OPENAI_TIMEOUT_SECONDS", "60"))
+
+# Built prompt contexts, keyed by clinic and data fingerprint
+CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("DENTAL_IQ_CONTEXT_CACHE_SIZE", "256"))
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv("DENTAL_IQ_CONTEXT_CACHE_TTL", "600"))
+_context_cache = TTLCache(CONTEXT_CACHE_MAX_ENTRIES, CONTEXT_CACHE_TTL_SECONDS)
+
+# Retrieval of rows relevant to the question
+CONTEXT_TOP_K = int(os.getenv("DENTAL_IQ_CONTEXT_TOP_K", "20"))
+CONTEXT_ROW_TOKEN_BUDGET = int(os.getenv("DENTAL_IQ_CONTEXT_ROW_TOKENS", "1200"))
+# Rows per agent used when the question matches no row
+CONTEXT_FALLBACK_ROWS = 5
+# Ask for usage on streamed answers: "auto" does when the API version
+# supports it (2024-09-01-preview or newer), "1"/"0" force it on/off
+AZURE_OPENAI_STREAM_USAGE = os.getenv("AZURE_OPENAI_STREAM_USAGE", "auto")
+STREAM_USAGE_MIN_API_VERSION = "2024-09-01"
+
+# Let the model fetch rows through function tools (agent_tools.py) instead
+# of sending retrieved rows with every question
+CHAT_TOOLS_ENABLED = os.getenv("DENTAL_IQ_CHAT_TOOLS", "1") == "1"
+# Tool-calling rounds per answer; the last round must answer
+MAX_TOOL_ROUNDS = 3
+_index_cache = TTLCache(64, CONTEXT_CACHE_TTL_SECONDS)
+
+# Process-wide client registry: one client (with its own keep-alive
+# connection pool) per configuration, reused by every chat turn and session
+_clients: Dict[tuple, AzureOpenAI] = {}
+_clients_lock = threading.Lock()
+
+
+def _stream_usage_enabled(api_version: str) -> bool:
+    if AZURE_OPENAI_STREAM_USAGE in ("0", "1"):
+        return AZURE_OPENAI_STREAM_USAGE == "1"
+    # Versions are dates, optionally with a "-preview" suffix
+    return api_version[:10] >= STREAM_USAGE_MIN_API_VERSION
+
+
+def get_azure_config() -> Dict[str, str]:
+    """Read Azure OpenAI configuration (re-read on every call so changes apply)"""
+    return {
+        "endpoint": os.getenv("AZURE_OPENAI_ENDPOINT", ""),
+        "api_key": os.getenv("AZURE_OPENAI_API_KEY", ""),
+        "api_version": os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21"),
+        "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4"),
+    }
+
+
+def _client_key(config: Dict[str, str]) -> tuple:
+    # The key itself is not kept around, only a fingerprint of it
+    key_hash = hashlib.sha256(config["api_key"].encode()).hexdigest()[:16]
+    return (config["endpoint"], config["deployment"], config["api_version"], key_hash)
+
+
+def _build_http_client():
+    if httpx is None:
+        return None
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=AZURE_OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=AZURE_OPENAI_MAX_CONNECTIONS,
+            keepalive_expiry=AZURE_OPENAI_KEEPALIVE_SECONDS
+        ),
+        timeout=httpx.Timeout(AZURE_OPENAI_TIMEOUT_SECONDS, connect=10.0)
+    )
 
-# Azure OpenAI configuration
-AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT", "")
-AZURE_OPENAI_API_KEY = os.getenv("AZURE_OPENAI_API_KEY", "")
-AZURE_OPENAI_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
-AZURE_OPENAI_DEPLOYMENT_NAME = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME", "gpt-4")
 
 def get_azure_client() -> Optional[AzureOpenAI]:
-    """Initialize Azure OpenAI client"""
-    if not AZURE_OPENAI_ENDPOINT or not AZURE_OPENAI_API_KEY:
+    """
+    Get the shared Azure OpenAI client for the current configuration
+    Clients are pooled per endpoint/deployment/API version; when the
+    configuration changes, clients built for the old one are closed
+    """
+    config = get_azure_config()
+    if not config["endpoint"] or not config["api_key"]:
         return None
+
+    key = _client_key(config)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is not None:
+            return client
+        try:
+            client = AzureOpenAI(
+                api_key=config["api_key"],
+                api_version=config["api_version"],
+                azure_endpoint=config["endpoint"],
+                http_client=_build_http_client(),
+                # Retries are done by resilience.ResilientCaller
+                max_retries=0
+            )
+        except Exception as e:
+            print(f"Error initializing Azure OpenAI client: {e}")
+            return None
+        stale = list(_clients.values())
+        _clients.clear()
+        _clients[key] = client
+
+    # Configuration changed - release the old connection pools
+    for old_client in stale:
+        _close_client(old_client)
+    return client
+
+
+def _close_client(client: AzureOpenAI):
     try:
-        return AzureOpenAI(
-            api_key=AZURE_OPENAI_API_KEY,
-            api_version=AZURE_OPENAI_API_VERSION,
-            azure_endpoint=AZURE_OPENAI_ENDPOINT
-        )
+        client.close()
     except Exception as e:
-        print(f"Error initializing Azure OpenAI client: {e}")
-        return None
+        print(f"Error closing Azure OpenAI client: {e}")
 
-def build_context_from_agents_data(agents_data: List[Dict]) -> str:
+
+def close_azure_clients():
+    """Close all pooled clients (registered to run at interpreter shutdown)"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for client in clients:
+        _close_client(client)
+
+
+atexit.register(close_azure_clients)
+
+def create_completion(client: AzureOpenAI, client_id: str = None, priority: int = PRIORITY_INTERACTIVE,
+                      cancel: CancelToken = None, **request):
+    """
+    Send one chat completion request within the shared TPM/RPM quota
+    Returns (response, reservation); non-streamed responses are reconciled
+    with their reported usage here, streams by the caller once consumed.
+    A request cancelled while waiting for quota is never sent
+    """
+    scheduler = get_rate_scheduler()
+    estimate = sum(message_tokens(m) for m in request["messages"]) + request.get("max_tokens", 0)
+    if request.get("tools"):
+        estimate += estimate_tokens(json.dumps(request["tools"], ensure_ascii=False))
+    with stage("rate_wait"):
+        reservation = scheduler.acquire(estimate, client_id, priority, cancel=cancel)
+    started = time.monotonic()
+    try:
+        if cancel is not None:
+            cancel.check()
+        response = client.chat.completions.create(**request)
+    except Exception as e:
+        if reservation is not None:
+            _release_failed(reservation, e)
+        if isinstance(e, openai.RateLimitError):
+            # Quota exhausted anyway (other consumers) - hold everyone back
+            scheduler.pause(retry_after_seconds(e) or 1.0)
+        raise
+    if request.get("stream"):
+        return response, reservation
+    kind = "summary" if priority == PRIORITY_BACKGROUND else "chat"
+    latency = time.monotonic() - started
+    observe_stage(f"azure_{kind}", latency)
+    total_tokens = record_usage(kind, getattr(response, "usage", None), latency)
+    if reservation is not None:
+        reservation.reconcile(total_tokens)
+    return response, reservation
+
+def _release_failed(reservation, error: Exception):
+    """
+    Free the tokens of a failed request so retries and hedges don't eat the
+    quota; a request the server saw (error response, timeout) still counts
+    against RPM
+    """
+    if isinstance(error, (openai.APIStatusError, openai.APITimeoutError)):
+        reservation.reconcile(0)
+    else:
+        reservation.release()
+
+def agents_data_fingerprint(agents_data: List[Dict]) -> str:
+    """
+    Version of the agent data as seen by the prompt context
+    Rows are append-only with monotonically growing ids, so row count plus
+    first/last row id identify the rows; KPIs are included as formatted
+    """
+    parts = []
+    for agent in agents_data:
+        rows = agent.get("rows", [])
+        first_id = rows[0].get("_id") if rows else None
+        last_id = rows[-1].get("_id") if rows else None
+        kpis = tuple(tuple(k) for k in agent.get("kpis", []))
+        parts.append((agent.get("id", ""), len(rows), first_id, last_id, kpis))
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+def build_context_from_agents_data(agents_data: List[Dict], client_id: str = None, query: str = None) -> str:
     """
     Build context string from agents data for prompt template
-    This will be filtered/pre-filtered in production
+    With a query, the rows most relevant to it are picked by the retrieval
+    index (within the row token budget); with a client_id the index and
+    the result are cached per clinic and data version, so repeat questions
+    on unchanged data skip the assembly
     """
+    if client_id is None:
+        index = RowIndex(agents_data) if query else None
+        return _build_context(agents_data, index, query)
+
+    fingerprint = agents_data_fingerprint(agents_data)
+    terms = tuple(sorted(set(tokenize(query)))) if query else ()
+    key = (client_id, fingerprint, terms)
+    context = _context_cache.get(key)
+    if context is None:
+        index = None
+        if terms:
+            index = _index_cache.get((client_id, fingerprint))
+            if index is None:
+                index = RowIndex(agents_data)
+                _index_cache.set((client_id, fingerprint), index)
+        context = _build_context(agents_data, index, query)
+        _context_cache.set(key, context)
+    return context
+
+
+def _select_rows(agents_data: List[Dict], index: Optional[RowIndex], query: Optional[str]) -> Dict[int, List[Dict]]:
+    """Rows to include per agent position, best first, within the token budget"""
+    if index is not None:
+        candidates = [(agent_pos, row_pos) for _, agent_pos, row_pos in index.search(query, CONTEXT_TOP_K)]
+    else:
+        candidates = []
+    if not candidates:
+        # Nothing matched the question - fall back to a sample of each agent
+        candidates = [
+            (agent_pos, row_pos)
+            for agent_pos, agent in enumerate(agents_data)
+            for row_pos in range(min(CONTEXT_FALLBACK_ROWS, len(agent.get("rows", []))))
+        ]
+
+    selected = defaultdict(list)
+    budget = CONTEXT_ROW_TOKEN_BUDGET
+    for agent_pos, row_pos in candidates:
+        row = agents_data[agent_pos]["rows"][row_pos]
+        cost = estimate_tokens(row_text(row))
+        if cost > budget:
+            continue
+        budget -= cost
+        selected[agent_pos].append(row)
+    return selected
+
+
+def _build_context(agents_data: List[Dict], index: Optional[RowIndex] = None, query: str = None) -> str:
     context_parts = []
+    selected = _select_rows(agents_data, index, query)
     
-    for agent in agents_data:
+    for agent_pos, agent in enumerate(agents_data):
         agent_id = agent.get("id", "")
         agent_name = agent.get("name", "")
         agent_role = agent.get("role", "")
@@ -42,29 +285,31 @@ def build_context_from_agents_data(agents_data: List[Dict]) -> str:
         kpis = agent.get("kpis", [])
         kpi_str = ", ".join([f"{k[0]}: {k[1]}" for k in kpis])
         
-        # Get rows (sample data)
-        rows = agent.get("rows", [])
-        if rows:
-            # Take first 5 rows as sample
-            sample_rows = rows[:5]
+        if agent.get("rows"):
             rows_summary = []
-            for row in sample_rows:
-                row_str = ", ".join([f"{k}: {v}" for k, v in row.items() if v])
+            for row in selected.get(agent_pos, []):
+                row_str = ", ".join([f"{k}: {v}" for k, v in row.items() if v and not k.startswith("_")])
                 rows_summary.append(f"  - {row_str}")
             
             context_parts.append(f"""
 Agent: {agent_name} ({agent_role})
 ID: {agent_id}
 KPIs: {kpi_str}
-Sample Data:
+Relevant Data ({len(rows_summary)} of {len(agent["rows"])} records):
 {chr(10).join(rows_summary)}
 """)
     
     return "\n".join(context_parts)
 
-def build_system_prompt() -> str:
-    """Build system prompt for the AI assistant"""
-    return """Jsi Axel, inteligentní asistent pro zubní ordinaci. Pomáháš personálu s administrativními úkoly a dotazy týkajícími se agentů a jejich dat.
+def build_system_prompt(agents_data: List[Dict] = None, tools: bool = False) -> str:
+    """
+    Build system prompt for the AI assistant
+    With agents_data (already filtered for the user's role) the prompt also
+    lists the agents the user may ask about. It only depends on the role and
+    the agent set, never on the rows or KPIs, so it stays byte-identical
+    across turns and Azure can serve it from its prompt cache.
+    """
+    prompt = """Jsi Axel, inteligentní asistent pro zubní ordinaci. Pomáháš personálu s administrativními úkoly a dotazy týkajícími se agentů a jejich dat.
 
 Tvoje role:
 - Pomáhat s dotazy o agentech (Isabella, Gabriel, Leo, Nora, Auditor)
@@ -78,8 +323,97 @@ Máš přístup k datům všech agentů včetně:
 - Informací o jejich rolích
 
 Odpovídej stručně, ale informativně. Pokud nevíš odpověď, upřímně to přiznej."""
+    if agents_data is None:
+        return prompt
+
+    # Role policy and clinic profile: agents visible to this user
+    agent_lines = "\n".join(
+        f"- {agent.get('name', '')} ({agent.get('role', '')}), ID: {agent.get('id', '')}"
+        for agent in agents_data
+    )
+    data_hint = (
+        "Aktuální KPI najdeš v kontextu před dotazem, konkrétní záznamy si vyžádej nástroji."
+        if tools else "Aktuální data najdeš v kontextu před dotazem."
+    )
+    return f"""{prompt}
+
+Uživatel smí vidět pouze data těchto agentů:
+{agent_lines or "- (žádní)"}
+Na data ostatních agentů neodpovídej. {data_hint}"""
+
+# Every error returned to the user starts with this (never cached)
+ERROR_PREFIX = "Chyba"
+
+AZURE_NOT_CONFIGURED_MESSAGE = f"{ERROR_PREFIX}: Azure OpenAI není nakonfigurováno. Zkontrolujte proměnné prostředí AZURE_OPENAI_ENDPOINT a AZURE_OPENAI_API_KEY."
+
+AZURE_BUSY_MESSAGE = f"{ERROR_PREFIX}: AI asistent je momentálně přetížený. Zkuste to prosím za chvíli znovu."
+# Returned while the circuit breaker is open (chat_api answers from cache/locally)
+AZURE_UNAVAILABLE_MESSAGE = f"{ERROR_PREFIX}: AI asistent je dočasně nedostupný."
+# Returned when a newer message or closing the chat cancelled the request
+AZURE_CANCELLED_MESSAGE = f"{ERROR_PREFIX}: Dotaz byl zrušen."
+
+def is_error_response(text: str) -> bool:
+    """Check whether a response is an error message rather than an answer"""
+    return text.startswith(ERROR_PREFIX)
 
-def chat_with_azure(user_message: str, agents_data: List[Dict], chat_history: List[Dict] = None) -> str:
+class StreamError(str):
+    """Final fragment of a stream reporting an error instead of answer text"""
+
+def build_chat_messages(user_message: str, agents_data: List[Dict], chat_history: List[Dict] = None,
+                        client_id: str = None, history_summary: str = "",
+                        tools: List[Dict] = None) -> List[Dict]:
+    """Build the message list sent to Azure OpenAI (tools: schemas sent along, if any)"""
+    # Build context from agents data; with tools only the KPI overview
+    with stage("build_context"):
+        if tools:
+            context = agents_overview(agents_data)
+        else:
+            context = build_context_from_agents_data(agents_data, client_id, user_message)
+    
+    # Fit system prompt, context, summary and history into the input token budget
+    # (tool schemas count against it too)
+    budget = INPUT_TOKEN_BUDGET
+    if tools:
+        budget -= estimate_tokens(json.dumps(tools, ensure_ascii=False))
+    with stage("fit_prompt"):
+        return fit_prompt(build_system_prompt(agents_data, bool(tools)), context, chat_history, user_message,
+                          budget=budget, history_summary=history_summary)
+
+def _chat_tools(agents_data: List[Dict]) -> Optional[List[Dict]]:
+    return build_tool_schemas(agents_data) if CHAT_TOOLS_ENABLED and agents_data else None
+
+def _completion_request(messages: List[Dict], tools: Optional[List[Dict]], round_no: int, **extra) -> Dict:
+    """Chat completion arguments for one tool-calling round"""
+    request = dict(
+        model=get_azure_config()["deployment"],
+        messages=messages,
+        temperature=0.7,
+        max_tokens=500,
+        **extra
+    )
+    if tools:
+        request["tools"] = tools
+        # Out of rounds - the model has to answer with what it has
+        request["tool_choice"] = "none" if round_no >= MAX_TOOL_ROUNDS else "auto"
+    return request
+
+def _tool_messages(content: Optional[str], tool_calls: List[Dict], agents_data: List[Dict]) -> List[Dict]:
+    """The assistant's tool-call message followed by one result message per call"""
+    messages = [{"role": "assistant", "content": content or None, "tool_calls": tool_calls}]
+    with stage("tools"):
+        for call in tool_calls:
+            name = call["function"]["name"]
+            get_metrics().inc("tool_calls", tool=name)
+            messages.append({
+                "role": "tool",
+                "tool_call_id": call["id"],
+                "content": run_tool(name, call["function"]["arguments"], agents_data)
+            })
+    return messages
+
+def chat_with_azure(user_message: str, agents_data: List[Dict], chat_history: List[Dict] = None,
+                    client_id: str = None, history_summary: str = "",
+                    cancel: CancelToken = None) -> str:
     """
     Send message to Azure OpenAI and get response
     
@@ -87,45 +421,220 @@ def chat_with_azure(user_message: str, agents_data: List[Dict], chat_history: Li
         user_message: User's message
         agents_data: List of agent data dictionaries
         chat_history: Previous chat messages (optional)
+        client_id: Clinic id, enables the shared context cache (optional)
+        history_summary: Summary of turns no longer in chat_history (optional)
+        cancel: Cancellation of the request; checked before every upstream call (optional)
     
     Returns:
         AI response text
     """
-    client = get_azure_client()
+    with stage("client"):
+        client = get_azure_client()
     if not client:
-        return "Chyba: Azure OpenAI není nakonfigurováno. Zkontrolujte proměnné prostředí AZURE_OPENAI_ENDPOINT a AZURE_OPENAI_API_KEY."
+        return AZURE_NOT_CONFIGURED_MESSAGE
     
     try:
-        # Build context from agents data
-        context = build_context_from_agents_data(agents_data)
+        tools = _chat_tools(agents_data)
+        messages = build_chat_messages(user_message, agents_data, chat_history, client_id, history_summary, tools)
+        deployment = get_azure_config()["deployment"]
         
-        # Build messages
-        messages = [
-            {"role": "system", "content": build_system_prompt()},
-            {"role": "system", "content": f"Kontext z agentů:\n{context}\n\nPoužij tyto informace k zodpovězení dotazů uživatele."}
-        ]
-        
-        # Add chat history if available
-        if chat_history:
-            for msg in chat_history[-10:]:  # Last 10 messages for context
-                if msg.get("who") == "user":
-                    messages.append({"role": "user", "content": msg.get("text", "")})
-                elif msg.get("who") == "bot":
-                    messages.append({"role": "assistant", "content": msg.get("text", "")})
+        # Call Azure OpenAI (with retries, hedging and the circuit breaker),
+        # running the model's tool calls until it answers
+        def request():
+            conversation = list(messages)
+            for round_no in range(MAX_TOOL_ROUNDS + 1):
+                if cancel is not None:
+                    # Also ends requests cancelled while queued without calling Azure
+                    cancel.check()
+                response = get_resilient_caller().call(lambda: create_completion(
+                    client, client_id, cancel=cancel, **_completion_request(conversation, tools, round_no)
+                )[0], cancel=cancel)
+                message = response.choices[0].message
+                if not message.tool_calls:
+                    break
+                tool_calls = [
+                    {"id": c.id, "type": "function",
+                     "function": {"name": c.function.name, "arguments": c.function.arguments}}
+                    for c in message.tool_calls
+                ]
+                conversation.extend(_tool_messages(message.content, tool_calls, agents_data))
+            return message.content or ""
         
-        # Add current user message
-        messages.append({"role": "user", "content": user_message})
+        # Identical prompts in flight share one upstream call. Tool results
+        # come from the leader's rows, which the prompt (a KPI overview) does
+        # not identify, so the clinic and the data version are part of the key
+        prompt_key = hashlib.sha1(json.dumps(
+            [deployment, client_id, agents_data_fingerprint(agents_data), messages], ensure_ascii=False
+        ).encode("utf-8")).hexdigest()
+        response = get_chat_executor().run(request, client_id, prompt_key, cancel=cancel)
         
-        # Call Azure OpenAI
-        response = client.chat.completions.create(
-            model=AZURE_OPENAI_DEPLOYMENT_NAME,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=500
-        )
-        
-        return response.choices[0].message.content.strip()
+        return response.strip()
         
+    except ChatCancelled:
+        return AZURE_CANCELLED_MESSAGE
+    except ChatQueueTimeout:
+        return AZURE_BUSY_MESSAGE
+    except CircuitOpenError:
+        return AZURE_UNAVAILABLE_MESSAGE
+    except Exception as e:
+        return f"{ERROR_PREFIX} při komunikaci s AI: {str(e)}"
+
+def stream_chat_with_azure(user_message: str, agents_data: List[Dict], chat_history: List[Dict] = None,
+                           client_id: str = None, history_summary: str = "",
+                           cancel: CancelToken = None) -> Iterator[str]:
+    """
+    Stream the response from Azure OpenAI as it is generated
+    Cancelling `cancel` closes the upstream stream and ends the generator
+    without a further fragment
+    
+    Yields:
+        Text fragments in order; an error is yielded as a final StreamError
+        fragment, possibly after partial text
+    """
+    with stage("client"):
+        client = get_azure_client()
+    if not client:
+        yield StreamError(AZURE_NOT_CONFIGURED_MESSAGE)
+        return
+    
+    stream = None
+    # (reservation, request, streamed parts) of a round not reconciled yet
+    unreconciled = None
+    try:
+        tools = _chat_tools(agents_data)
+        messages = build_chat_messages(user_message, agents_data, chat_history, client_id, history_summary, tools)
+        conversation = list(messages)
+        extra = {"stream": True}
+        if _stream_usage_enabled(get_azure_config()["api_version"]):
+            extra["stream_options"] = {"include_usage": True}
+        started = None
+
+        def start_stream(request):
+            nonlocal started
+            started = time.monotonic()
+            return create_completion(client, client_id, cancel=cancel, **request)
+
+        # The stream is consumed by the caller, so it holds a slot for its duration
+        with get_chat_executor().slot(client_id, cancel=cancel):
+            for round_no in range(MAX_TOOL_ROUNDS + 1):
+                if cancel is not None:
+                    cancel.check()
+                request = _completion_request(conversation, tools, round_no, **extra)
+                # Retried until the response starts; a broken stream is not retried
+                stream, reservation = get_resilient_caller().call(
+                    lambda: start_stream(request), hedge=False, cancel=cancel
+                )
+                if cancel is not None:
+                    # Closing the response aborts the upstream generation
+                    cancel.add_callback(stream.close)
+                parts = []
+                unreconciled = (reservation, request, parts)
+                content, tool_calls, usage, first_token_latency = yield from _stream_round(
+                    stream, started, cancel, parts
+                )
+                if cancel is not None:
+                    cancel.remove_callback(stream.close)
+                    cancel.check()
+                stream.close()
+                observe_stage("azure_stream", time.monotonic() - started)
+                total_tokens = record_usage("stream", usage, first_token_latency or time.monotonic() - started)
+                if reservation is not None:
+                    reservation.reconcile(total_tokens if total_tokens is not None
+                                          else _streamed_tokens(reservation, request, content))
+                unreconciled = None
+                if not tool_calls:
+                    break
+                conversation.extend(_tool_messages(content, tool_calls, agents_data))
+    except ChatCancelled:
+        return
+    except ChatQueueTimeout:
+        yield StreamError(AZURE_BUSY_MESSAGE)
+    except CircuitOpenError:
+        yield StreamError(AZURE_UNAVAILABLE_MESSAGE)
     except Exception as e:
-        return f"Chyba při komunikaci s AI: {str(e)}"
+        if cancel is not None and cancel.cancelled:
+            # Reading the stream failed because it was closed on cancel
+            return
+        yield StreamError(f"{ERROR_PREFIX} při komunikaci s AI: {str(e)}")
+    finally:
+        if stream is not None:
+            stream.close()
+        if unreconciled is not None and unreconciled[0] is not None:
+            # Broken or cancelled part-way - only the prompt and the text so far were used
+            reservation, request, parts = unreconciled
+            reservation.reconcile(_streamed_tokens(reservation, request, "".join(parts)))
 
+def _streamed_tokens(reservation, request: Dict, content: str) -> int:
+    """Tokens of a stream without reported usage: the reserved max_tokens swapped for the streamed length"""
+    return reservation.tokens - request["max_tokens"] + estimate_tokens(content)
+
+def _stream_round(stream, started: float, cancel: CancelToken = None, parts: List[str] = None):
+    """
+    Yield the text of one streamed completion as it arrives
+    Returns (text, tool calls, usage or None, time to first token or None);
+    the fragments are also collected in `parts` as they arrive
+    """
+    parts = [] if parts is None else parts
+    calls, usage, first_token_latency = {}, None, None
+    for chunk in stream:
+        if cancel is not None and cancel.cancelled:
+            break
+        # The usage chunk (stream_options) comes last, without choices
+        if getattr(chunk, "usage", None) is not None:
+            usage = chunk.usage
+        # Azure sends content-filter chunks without choices
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        # Tool calls arrive in pieces keyed by their index
+        for call in delta.tool_calls or []:
+            entry = calls.setdefault(call.index, {"id": "", "type": "function",
+                                                  "function": {"name": "", "arguments": ""}})
+            if call.id:
+                entry["id"] = call.id
+            if call.function is not None:
+                entry["function"]["name"] += call.function.name or ""
+                entry["function"]["arguments"] += call.function.arguments or ""
+        if delta.content:
+            if first_token_latency is None:
+                first_token_latency = time.monotonic() - started
+                observe_stage("azure_first_token", first_token_latency)
+            parts.append(delta.content)
+            yield delta.content
+    return "".join(parts), [calls[i] for i in sorted(calls)], usage, first_token_latency
+
+SUMMARY_MAX_TOKENS = 250
+
+def summarize_chat_history(previous_summary: str, messages: List[Dict], client_id: str = None) -> Optional[str]:
+    """
+    Fold chat messages into the running conversation summary
+    Returns None if the model is unavailable (caller falls back to a local summary)
+    """
+    with stage("client"):
+        client = get_azure_client()
+    if not client:
+        return None
+    
+    transcript = "\n".join(
+        f"{'Uživatel' if m.get('who') == 'user' else 'Asistent'}: {m.get('text', '')}" for m in messages
+    )
+    prompt = [
+        {"role": "system", "content": "Shrň konverzaci do několika stručných bodů v češtině. "
+                                      "Zachovej jména pacientů, čísla a otevřené úkoly."},
+        {"role": "user", "content": f"Dosavadní shrnutí:\n{previous_summary or '(žádné)'}\n\nNové zprávy:\n{transcript}"}
+    ]
+    deployment = get_azure_config()["deployment"]
+    try:
+        response, _ = get_chat_executor().run(lambda: get_resilient_caller().call(
+            lambda: create_completion(
+                client, client_id, PRIORITY_BACKGROUND,
+                model=deployment,
+                messages=prompt,
+                temperature=0.2,
+                max_tokens=SUMMARY_MAX_TOKENS
+            ), hedge=False
+        ), client_id)
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error summarizing chat history: {e}")
+        return None
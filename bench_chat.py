@@ -0,0 +1,218 @@
+"""
+Chat load benchmark
+Fires concurrent chat sessions at the chat path and reports latency
+percentiles, throughput and error rates. Runs fully offline against the
+local mock (mock_azure_server.py).
+
+In-process mode (default) drives chat_api like the sidecar does, with one
+data overlay and chat history per simulated session:
+    python bench_chat.py --sessions 20 --turns 5 --start-mock --latency-ms 800
+
+HTTP mode hits a running app's sidecar with session tokens of logged-in
+browsers (Authorization: Bearer):
+    python bench_chat.py --mode http --url http://127.0.0.1:8510 --token <token>
+
+Set DENTAL_IQ_ANSWER_CACHE_TTL=0 to measure without the answer cache.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from typing import Dict, List
+
+from mock_azure_server import add_mock_arguments, settings_from_args, start_mock_server
+
+QUESTIONS = (
+    "Kolik hovorů čeká na zpracování?",
+    "Jaké jsou problémy u Gabriela?",
+    "Které karty pacientů chybí?",
+    "Shrň výsledky auditu.",
+    "Kolik času ušetřila Nora?",
+    "Kdo volal kvůli bolesti?",
+    "Které e-maily vyžadují reakci?",
+    "Jaký je stav archivace u Lea?",
+)
+
+
+class Results:
+    """Thread-safe collection of per-request measurements"""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.first_token: List[float] = []
+        self.errors = 0
+        self.cached = 0
+        self.local = 0
+        self._lock = threading.Lock()
+
+    def add(self, latency: float, error: bool, cached: bool = False, first_token: float = None,
+            local: bool = False):
+        with self._lock:
+            self.latencies.append(latency)
+            if first_token is not None:
+                self.first_token.append(first_token)
+            self.errors += int(error)
+            self.cached += int(cached)
+            self.local += int(local)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _question(session: int, turn: int) -> str:
+    return QUESTIONS[(session + turn) % len(QUESTIONS)]
+
+
+def run_inprocess_session(session: int, args, results: Results):
+    from agent_store import get_agent_store
+    from azure_chat import is_error_response
+    from chat_api import handle_chat_request, handle_chat_stream
+
+    agent_data = get_agent_store().new_session()
+    history: List[Dict] = []
+    client_id = f"bench-clinic-{session % args.clinics}"
+    for turn in range(args.turns):
+        request_data = {
+            "message": _question(session, turn),
+            "agents_data": agent_data.snapshot(),
+            "chat_history": list(history),
+            "client_id": client_id,
+            "job_role": "admin"
+        }
+        start = time.perf_counter()
+        first_token = None
+        if args.stream:
+            result = {}
+            for event in handle_chat_stream(request_data):
+                if first_token is None and ("delta" in event or "done" in event):
+                    first_token = time.perf_counter() - start
+                if event.get("done") or event.get("error"):
+                    result = event
+        else:
+            result = handle_chat_request(request_data)
+        latency = time.perf_counter() - start
+
+        response = result.get("response", "")
+        error = not response or is_error_response(response)
+        results.add(latency, error, result.get("cached", False), first_token, result.get("local", False))
+        history += [{"who": "user", "text": request_data["message"]}, {"who": "bot", "text": response}]
+        time.sleep(args.think_ms / 1000)
+
+
+def run_http_session(session: int, args, results: Results):
+    token = args.token[session % len(args.token)]
+    path = "/chat/stream" if args.stream else "/chat"
+    for turn in range(args.turns):
+        body = json.dumps({"message": _question(session, turn)}).encode("utf-8")
+        request = urllib.request.Request(
+            args.url.rstrip("/") + path, data=body,
+            headers={"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
+        )
+        start = time.perf_counter()
+        first_token = None
+        error, cached, local = False, False, False
+        try:
+            with urllib.request.urlopen(request, timeout=args.timeout) as response:
+                if args.stream:
+                    result = {}
+                    for line in response:
+                        if first_token is None:
+                            first_token = time.perf_counter() - start
+                        if line.strip():
+                            event = json.loads(line)
+                            if event.get("done") or event.get("error"):
+                                result = event
+                else:
+                    result = json.loads(response.read())
+            text = result.get("response", "")
+            error = not text or text.startswith("Chyba")
+            cached = result.get("cached", False)
+            local = result.get("local", False)
+        except (urllib.error.URLError, OSError, ValueError):
+            error = True
+        results.add(time.perf_counter() - start, error, cached, first_token, local)
+        time.sleep(args.think_ms / 1000)
+
+
+def print_report(results: Results, elapsed: float):
+    total = len(results.latencies)
+    print(f"Requests:    {total} in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.1f} req/s)")
+    print(f"Errors:      {results.errors} ({results.errors / total * 100 if total else 0:.1f}%)")
+    print(f"Cached:      {results.cached} ({results.cached / total * 100 if total else 0:.1f}%)")
+    print(f"Local:       {results.local} ({results.local / total * 100 if total else 0:.1f}%)")
+    for name, values in (("Latency", results.latencies), ("First token", results.first_token)):
+        if values:
+            print(f"{name + ':':<12} p50 {percentile(values, 50) * 1000:.0f} ms, "
+                  f"p95 {percentile(values, 95) * 1000:.0f} ms, "
+                  f"p99 {percentile(values, 99) * 1000:.0f} ms, "
+                  f"max {max(values) * 1000:.0f} ms")
+
+
+def print_usage():
+    """Prompt cache effect of the in-process run (usage_stats summary)"""
+    from usage_stats import get_usage_stats
+
+    usage = get_usage_stats().summary()
+    if not usage["requests"]:
+        return
+    print(f"Prompt:      {usage['prompt_tokens']} tokens, {usage['cached_tokens']} cached "
+          f"({usage['cached_ratio'] * 100:.1f}%), {usage['requests_with_cache_hit']}/{usage['requests']} "
+          f"requests with a cache hit")
+    # Latencies are only comparable within one kind of request
+    for kind, stats in usage["by_kind"].items():
+        for name, key in (("cache hit", "mean_latency_cache_hit"), ("cache miss", "mean_latency_cache_miss")):
+            if stats[key] is not None:
+                print(f"{kind + ', ' + name + ':':<20} mean {stats['latency']} {stats[key] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Dental IQ chat load benchmark")
+    parser.add_argument("--mode", choices=("inprocess", "http"), default="inprocess")
+    parser.add_argument("--sessions", type=int, default=10, help="Concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Questions per session")
+    parser.add_argument("--clinics", type=int, default=2, help="Clinics the sessions are spread over (in-process)")
+    parser.add_argument("--think-ms", type=float, default=0, help="Pause between questions of a session")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming chat path")
+    parser.add_argument("--url", default="http://127.0.0.1:8510", help="Sidecar URL (http mode)")
+    parser.add_argument("--token", action="append", default=[], help="Session token (http mode, repeatable)")
+    parser.add_argument("--timeout", type=float, default=120, help="Request timeout (http mode)")
+    parser.add_argument("--start-mock", action="store_true", help="Start the mock Azure server in-process")
+    parser.add_argument("--mock-port", type=int, default=8600)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    if args.mode == "http" and not args.token:
+        parser.error("--token is required in http mode")
+
+    if args.start_mock:
+        start_mock_server("127.0.0.1", args.mock_port, settings_from_args(args))
+        os.environ["AZURE_OPENAI_ENDPOINT"] = f"http://127.0.0.1:{args.mock_port}"
+        os.environ.setdefault("AZURE_OPENAI_API_KEY", "mock")
+
+    run_session = run_http_session if args.mode == "http" else run_inprocess_session
+    results = Results()
+    threads = [
+        threading.Thread(target=run_session, args=(i, args, results), daemon=True)
+        for i in range(args.sessions)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print_report(results, time.perf_counter() - start)
+    if args.mode == "inprocess":
+        print_usage()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,131 @@
 """
 Chat API endpoint handler for Streamlit
 """
-import streamlit as st
-from azure_chat import chat_with_azure
-import json
+from answer_cache import answer_cache_key, get_cached_answer, get_stale_answer, store_answer
+from auth import filter_agents_for_role
+from local_intents import answer_locally
+from azure_chat import (
+    chat_with_azure, stream_chat_with_azure, is_error_response, StreamError, AZURE_CANCELLED_MESSAGE,
+    AZURE_UNAVAILABLE_MESSAGE
+)
+from metrics import get_metrics, stage
+
+def _local_answer(agents_data):
+    """Answer without the model: KPIs and attention counts straight from the data"""
+    lines = ["AI asistent je dočasně nedostupný. Přehled z dat agentů:"]
+    for agent in agents_data:
+        kpis = ", ".join(f"{k[0]}: {k[1]}" for k in agent.get("kpis", []))
+        attention = len(agent.get("attention_ids", []))
+        lines.append(f"- {agent.get('name', '')}: {kpis}; vyžaduje pozornost: {attention}")
+    return "\n".join(lines)
+
+def _fallback_result(cache_key, agents_data):
+    """Result while Azure is unavailable: last known answer, else a local summary"""
+    stale = get_stale_answer(cache_key)
+    if stale is not None:
+        return {"response": stale, "cached": True, "stale": True}
+    return {"response": _local_answer(agents_data), "degraded": True}
+
+def _parse_request(request_data):
+    """Extract request fields; agents are filtered to what the user's role may see"""
+    user_message = request_data.get("message", "")
+    agents_data = request_data.get("agents_data", [])
+    chat_history = request_data.get("chat_history", [])
+    client_id = request_data.get("client_id")
+    job_role = request_data.get("job_role")
+    if job_role:
+        agents_data = filter_agents_for_role(agents_data, job_role)
+    return user_message, agents_data, chat_history, client_id, request_data.get("history_summary", "")
+
+def _lookup_answer(cache_key):
+    """Answer cache lookup, counted as hit or miss"""
+    with stage("answer_cache"):
+        cached = get_cached_answer(cache_key)
+    get_metrics().inc("answer_cache_lookups", result="miss" if cached is None else "hit")
+    return cached
 
 def handle_chat_request(request_data):
     """Handle chat request and return response"""
     if not request_data:
         return {"error": "No request data"}
-    
-    user_message = request_data.get("message", "")
-    agents_data = request_data.get("agents_data", [])
-    chat_history = request_data.get("chat_history", [])
-    
+
+    user_message, agents_data, chat_history, client_id, history_summary = _parse_request(request_data)
+
     if not user_message:
         return {"error": "No message provided"}
-    
+
+    # Plain data lookup - answer from the agent data without the model
+    local = answer_locally(user_message, agents_data)
+    if local is not None:
+        return {"response": local, "local": True}
+
+    # Repeated question on unchanged data - answer from cache
+    cache_key = answer_cache_key(client_id, user_message, agents_data, chat_history)
+    cached = _lookup_answer(cache_key)
+    if cached is not None:
+        return {"response": cached, "cached": True}
+
     # Get AI response
-    response = chat_with_azure(user_message, agents_data, chat_history)
-    
+    response = chat_with_azure(user_message, agents_data, chat_history, client_id, history_summary,
+                               request_data.get("cancel"))
+    if response == AZURE_CANCELLED_MESSAGE:
+        return {"cancelled": True}
+    if response == AZURE_UNAVAILABLE_MESSAGE:
+        return _fallback_result(cache_key, agents_data)
+    if not is_error_response(response):
+        store_answer(cache_key, response)
+
     return {"response": response}
 
+def handle_chat_stream(request_data):
+    """
+    Handle chat request and yield response events as they arrive
+    Yields {"delta": text} events followed by {"done": True, "response": full_text};
+    local and cached answers come as a single done event with "local"/"cached": True;
+    a cancelled request ends with {"cancelled": True}, a failed one (possibly after
+    some deltas) with {"error": message} and no done event, so it is neither cached
+    nor recorded as an answer
+    """
+    if not request_data:
+        yield {"error": "No request data"}
+        return
+
+    user_message, agents_data, chat_history, client_id, history_summary = _parse_request(request_data)
+
+    if not user_message:
+        yield {"error": "No message provided"}
+        return
+
+    local = answer_locally(user_message, agents_data)
+    if local is not None:
+        yield {"done": True, "response": local, "local": True}
+        return
+
+    cache_key = answer_cache_key(client_id, user_message, agents_data, chat_history)
+    cached = _lookup_answer(cache_key)
+    if cached is not None:
+        yield {"done": True, "response": cached, "cached": True}
+        return
+
+    cancel = request_data.get("cancel")
+    parts = []
+    for fragment in stream_chat_with_azure(user_message, agents_data, chat_history, client_id, history_summary,
+                                           cancel):
+        if not parts and fragment == AZURE_UNAVAILABLE_MESSAGE:
+            yield dict(_fallback_result(cache_key, agents_data), done=True)
+            return
+        if isinstance(fragment, StreamError):
+            yield {"error": str(fragment)}
+            return
+        parts.append(fragment)
+        yield {"delta": fragment}
+
+    if cancel is not None and cancel.cancelled:
+        # Superseded - the partial answer is neither cached nor reported as done
+        yield {"cancelled": True}
+        return
+
+    response = "".join(parts).strip()
+    if response:
+        store_answer(cache_key, response)
+    yield {"done": True, "response": response}
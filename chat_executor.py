@@ -0,0 +1,254 @@
+"""
+Concurrency-limited chat executor
+Upstream chat calls are scheduled on one asyncio event loop running in a
+background thread. The loop enforces a global and a per-clinic limit on
+concurrent Azure requests, queues the rest with a deadline, and coalesces
+identical in-flight prompts so they share a single upstream request
+(single-flight). Callers stay synchronous: Streamlit and the sidecar
+handler threads block on the returned result.
+
+Requests can carry a CancelToken. Cancelling it gives up a queued slot
+wait (or a wait for a coalesced answer) immediately and runs the token's
+callbacks (e.g. closing an upstream stream); blocking calls check the
+token between steps and wake from their waits (quota queue, retry backoff)
+on cancel. The waits are cancelled on the loop itself, so a
+slot taken just before the cancellation is handed back to the caller
+and released by it instead of being lost.
+"""
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Hashable, Optional
+
+from metrics import observe_stage
+
+MAX_CONCURRENT_REQUESTS = int(os.getenv("AZURE_OPENAI_MAX_CONCURRENT", "8"))
+MAX_CONCURRENT_PER_CLINIC = int(os.getenv("AZURE_OPENAI_MAX_CONCURRENT_PER_CLINIC", "3"))
+# Longest a request may wait for a free slot before it is rejected
+QUEUE_TIMEOUT_SECONDS = float(os.getenv("AZURE_OPENAI_QUEUE_TIMEOUT_SECONDS", "20"))
+
+
+class ChatQueueTimeout(Exception):
+    """No slot became free before the request's deadline"""
+
+
+class ChatCancelled(Exception):
+    """The request was superseded or the chat was closed"""
+
+
+class CancelToken:
+    """Cancellation flag of one chat request"""
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Mark cancelled and run the registered callbacks (once)"""
+        with self._lock:
+            if self._cancelled.is_set():
+                return
+            self._cancelled.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Error cancelling chat request: {e}")
+
+    def add_callback(self, callback: Callable):
+        """Run callback on cancel (right away if already cancelled)"""
+        with self._lock:
+            if not self._cancelled.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def remove_callback(self, callback: Callable):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def wait(self, timeout: float) -> bool:
+        """Sleep up to timeout, waking early on cancel; returns True if cancelled"""
+        return self._cancelled.wait(timeout)
+
+    def check(self):
+        """Raise ChatCancelled if cancelled"""
+        if self._cancelled.is_set():
+            raise ChatCancelled()
+
+
+class ChatExecutor:
+    """Event loop thread with concurrency limits and single-flight coalescing"""
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT_REQUESTS,
+                 max_per_clinic: int = MAX_CONCURRENT_PER_CLINIC):
+        self.max_concurrent = max_concurrent
+        self.max_per_clinic = max_per_clinic
+        self._loop = asyncio.new_event_loop()
+        # Blocking SDK calls run here; one worker per global slot
+        self._workers = ThreadPoolExecutor(max_concurrent, thread_name_prefix="dental-iq-chat")
+        self._global: Optional[asyncio.Semaphore] = None
+        self._clinics: Dict[str, asyncio.Semaphore] = {}
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+        self.rejected = 0
+        self._thread = threading.Thread(target=self._run_loop, name="dental-iq-chat-loop", daemon=True)
+        self._thread.start()
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self._loop)
+        self._global = asyncio.Semaphore(self.max_concurrent)
+        self._loop.run_forever()
+
+    def _clinic_semaphore(self, client_id: str) -> asyncio.Semaphore:
+        semaphore = self._clinics.get(client_id)
+        if semaphore is None:
+            semaphore = self._clinics[client_id] = asyncio.Semaphore(self.max_per_clinic)
+        return semaphore
+
+    async def _acquire(self, client_id: str, deadline: float):
+        """Take the clinic slot, then the global one, both within the deadline"""
+        started = time.monotonic()
+        clinic = self._clinic_semaphore(client_id or "")
+        try:
+            await asyncio.wait_for(clinic.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise ChatQueueTimeout()
+        try:
+            await asyncio.wait_for(self._global.acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            clinic.release()
+            self.rejected += 1
+            raise ChatQueueTimeout()
+        except asyncio.CancelledError:
+            clinic.release()
+            raise
+        observe_stage("queue_wait", time.monotonic() - started)
+        return clinic
+
+    def _release(self, clinic: asyncio.Semaphore):
+        self._global.release()
+        clinic.release()
+
+    async def _cancellable(self, awaitable, cancel: Optional[CancelToken]):
+        """
+        Await `awaitable` as a task that `cancel` stops (raises ChatCancelled)
+        The task is cancelled on the loop: if it already finished (e.g. took
+        its slots), the cancellation is a no-op and its result is returned
+        """
+        task = asyncio.ensure_future(awaitable)
+        if cancel is None:
+            return await task
+
+        def on_cancel():
+            self._loop.call_soon_threadsafe(task.cancel)
+
+        cancel.add_callback(on_cancel)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task.cancelled() and cancel.cancelled:
+                raise ChatCancelled()
+            raise
+        finally:
+            cancel.remove_callback(on_cancel)
+
+    async def _execute(self, client_id: str, fn: Callable, deadline: float, cancel: Optional[CancelToken]):
+        clinic = await self._cancellable(self._acquire(client_id, deadline), cancel)
+        try:
+            # Not cancellable: the worker thread would keep running outside the limits
+            return await self._loop.run_in_executor(self._workers, fn)
+        finally:
+            self._release(clinic)
+
+    async def _submit(self, client_id: str, key: Optional[Hashable], fn: Callable, deadline: float,
+                      cancel: Optional[CancelToken]):
+        if key is None:
+            return await self._execute(client_id, fn, deadline, cancel)
+
+        # Identical prompt already in flight - wait for its answer instead
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            try:
+                # shield: giving up here must not cancel the leader
+                return await self._cancellable(asyncio.shield(future), cancel)
+            except ChatCancelled:
+                if cancel is not None and cancel.cancelled:
+                    raise
+                # The leader was cancelled, this request still wants the answer
+                return await self._execute(client_id, fn, deadline, cancel)
+
+        future = self._inflight[key] = self._loop.create_future()
+        try:
+            result = await self._execute(client_id, fn, deadline, cancel)
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a leader-only failure doesn't log a warning
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    def run(self, fn: Callable, client_id: str = None, key: Hashable = None,
+            queue_timeout: float = QUEUE_TIMEOUT_SECONDS, cancel: CancelToken = None):
+        """
+        Run a blocking call under the concurrency limits and return its result
+
+        Args:
+            fn: Zero-argument callable doing the upstream request
+            client_id: Clinic the request counts against
+            key: Coalescing key; requests with equal keys in flight share one call
+            queue_timeout: Maximum wait for a free slot (raises ChatQueueTimeout)
+            cancel: Stops waiting for a slot or a coalesced answer (raises
+                ChatCancelled); a call already running is not interrupted
+        """
+        deadline = time.monotonic() + queue_timeout
+        return asyncio.run_coroutine_threadsafe(
+            self._submit(client_id, key, fn, deadline, cancel), self._loop
+        ).result()
+
+    @contextmanager
+    def slot(self, client_id: str = None, queue_timeout: float = QUEUE_TIMEOUT_SECONDS,
+             cancel: CancelToken = None):
+        """
+        Hold a concurrency slot in the calling thread (for streamed responses,
+        which are consumed by the caller rather than the executor)
+        Raises ChatCancelled if `cancel` fires while waiting for the slot
+        """
+        deadline = time.monotonic() + queue_timeout
+        clinic = asyncio.run_coroutine_threadsafe(
+            self._cancellable(self._acquire(client_id, deadline), cancel), self._loop
+        ).result()
+        try:
+            yield
+        finally:
+            self._loop.call_soon_threadsafe(self._release, clinic)
+
+
+_executor: Optional[ChatExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def get_chat_executor() -> ChatExecutor:
+    """Process-wide executor (started on first use)"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ChatExecutor()
+    return _executor
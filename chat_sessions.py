@@ -0,0 +1,98 @@
+"""
+Registry of logged-in sessions for the sidecar chat endpoint
+Streamlit session state is only reachable from the script thread, so each
+rerun registers the session's token together with references to its user
+info, agent data, chat history, history summary and payload tracker; the
+app server looks them up by token.
+
+Each session has at most one chat request in flight: starting a new one
+cancels the previous request, whose late answer is then discarded.
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+from chat_executor import CancelToken
+
+# Sessions not seen by a rerun for this long are dropped
+SESSION_IDLE_TTL_SECONDS = 12 * 60 * 60
+
+
+class ChatSession:
+    """What the chat endpoint needs to know about one logged-in session"""
+
+    def __init__(self, token: str, user_info: Dict, agent_data, chat_history: List[Dict],
+                 history_compactor=None, payload_tracker=None):
+        self.token = token
+        self.user_info = user_info
+        self.agent_data = agent_data
+        self.chat_history = chat_history
+        self.history_compactor = history_compactor
+        self.payload_tracker = payload_tracker
+        self.last_seen = time.monotonic()
+
+
+_sessions: Dict[str, ChatSession] = {}
+_sessions_lock = threading.Lock()
+
+# Session token -> cancel token of its in-flight chat request (kept apart
+# from ChatSession, which is replaced on every rerun)
+_active_requests: Dict[str, CancelToken] = {}
+
+
+def register_chat_session(token: str, user_info: Dict, agent_data, chat_history: List[Dict],
+                          history_compactor=None, payload_tracker=None):
+    """Register (or refresh) a session; called on every rerun"""
+    if not token:
+        return
+    now = time.monotonic()
+    with _sessions_lock:
+        _sessions[token] = ChatSession(token, user_info, agent_data, chat_history, history_compactor,
+                                       payload_tracker)
+        expired = [t for t, s in _sessions.items() if now - s.last_seen > SESSION_IDLE_TTL_SECONDS]
+        for t in expired:
+            del _sessions[t]
+            _active_requests.pop(t, None)
+
+
+def unregister_chat_session(token: str):
+    """Forget a session (logout) and cancel its chat request"""
+    cancel_chat_request(token)
+    with _sessions_lock:
+        _sessions.pop(token, None)
+
+
+def begin_chat_request(token: str) -> CancelToken:
+    """Track a new chat request of the session, cancelling the previous one"""
+    cancel = CancelToken()
+    with _sessions_lock:
+        previous = _active_requests.get(token)
+        _active_requests[token] = cancel
+    if previous is not None:
+        previous.cancel()
+    return cancel
+
+
+def end_chat_request(token: str, cancel: CancelToken):
+    """The request finished; forget it unless a newer one took its place"""
+    with _sessions_lock:
+        if _active_requests.get(token) is cancel:
+            del _active_requests[token]
+
+
+def cancel_chat_request(token: str) -> bool:
+    """Cancel the session's in-flight chat request; returns False if there was none"""
+    with _sessions_lock:
+        cancel = _active_requests.pop(token, None)
+    if cancel is None:
+        return False
+    cancel.cancel()
+    return True
+
+
+def get_chat_session(token: str) -> Optional[ChatSession]:
+    """Look up a session by its token"""
+    if not token:
+        return None
+    with _sessions_lock:
+        return _sessions.get(token)
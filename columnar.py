@@ -0,0 +1,191 @@
+"""
+Columnar row storage
+Agent rows are kept as array-backed columns instead of one dict per row.
+String columns are dictionary-encoded: each distinct value (patient name,
+status, insurance, problem description template...) is stored once and
+rows hold small integer codes. Each container owns its dictionaries and
+prunes values of evicted rows when it compacts, so a capped container
+holds at most about twice its row cap of distinct values per column, and
+everything is freed with the container (the session).
+"""
+import bisect
+import json
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+
+class ValueDictionary:
+    """Append-only value <-> code mapping (rebuilt on compaction)"""
+
+    def __init__(self):
+        # Code 0 is reserved for "column absent in this row"
+        self.values: List = [None]
+        self._codes: Dict = {}
+
+    def encode(self, value) -> int:
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def decode(self, code: int):
+        return self.values[code]
+
+    def __len__(self) -> int:
+        return len(self.values) - 1
+
+
+class ColumnarRows:
+    """
+    Append-only columnar row container with an optional row cap
+    Oldest rows are evicted once max_rows is exceeded (amortized O(1))
+    """
+
+    # Code arrays start with 1-byte codes and widen as dictionaries grow
+    _WIDTHS = (("B", 0xFF), ("H", 0xFFFF), ("I", 0xFFFFFFFF))
+
+    def __init__(self, max_rows: Optional[int] = None,
+                 int_columns: Dict[str, str] = None):
+        """
+        Args:
+            max_rows: Maximum rows kept (None = unbounded)
+            int_columns: Columns stored as plain integer arrays, name -> typecode
+        """
+        self.max_rows = max_rows
+        self._int_columns = dict(int_columns or {})
+        self._dictionaries: Dict[str, ValueDictionary] = {}
+        self._columns: Dict[str, array] = {}
+        self._order: List[str] = []
+        self._start = 0
+        self._end = 0
+
+    def __len__(self) -> int:
+        return self._end - self._start
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self._order)
+
+    def _add_column(self, name: str):
+        if name in self._int_columns:
+            typecode = self._int_columns[name]
+        else:
+            self._dictionaries[name] = ValueDictionary()
+            typecode = self._WIDTHS[0][0]
+        # Existing rows don't have this column (code/value 0)
+        self._columns[name] = array(typecode, bytes(array(typecode).itemsize * self._end))
+        self._order.append(name)
+
+    def _widen(self, name: str, code: int):
+        column = self._columns[name]
+        for typecode, limit in self._WIDTHS:
+            if code <= limit:
+                if typecode != column.typecode:
+                    self._columns[name] = array(typecode, column)
+                return
+
+    def append(self, row: Dict):
+        """Append one row - amortized O(number of columns)"""
+        for name in row:
+            if name not in self._columns:
+                self._add_column(name)
+        for name in self._order:
+            column = self._columns[name]
+            if name in self._int_columns:
+                column.append(row.get(name, 0))
+                continue
+            code = self._dictionaries[name].encode(row[name]) if name in row else 0
+            try:
+                column.append(code)
+            except OverflowError:
+                self._widen(name, code)
+                self._columns[name].append(code)
+        self._end += 1
+        if self.max_rows is not None and len(self) > self.max_rows:
+            self._evict(len(self) - self.max_rows)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def _evict(self, count: int):
+        self._start += count
+        # Compact once more than half of the arrays is dead space
+        if self._start > len(self):
+            for name in self._order:
+                del self._columns[name][:self._start]
+            self._end -= self._start
+            self._start = 0
+            self._prune_dictionaries()
+
+    def _prune_dictionaries(self):
+        """Re-encode dictionary columns with only the values live rows use"""
+        for name in self._order:
+            if name in self._int_columns:
+                continue
+            column = self._columns[name]
+            values = self._dictionaries[name].values
+            pruned = ValueDictionary()
+            remap = {0: 0}
+            for code in column:
+                if code not in remap:
+                    remap[code] = pruned.encode(values[code])
+            typecode = next(t for t, limit in self._WIDTHS if len(pruned) <= limit)
+            self._columns[name] = array(typecode, (remap[code] for code in column))
+            self._dictionaries[name] = pruned
+
+    def _decode_row(self, i: int) -> Dict:
+        row = {}
+        for name in self._order:
+            value = self._columns[name][i]
+            if name in self._int_columns:
+                row[name] = value
+            elif value:
+                row[name] = self._dictionaries[name].values[value]
+        return row
+
+    def value(self, index: int, column: str):
+        """Single cell without decoding the whole row"""
+        i = self._physical_index(index)
+        value = self._columns[column][i]
+        if column in self._int_columns:
+            return value
+        return self._dictionaries[column].values[value] if value else None
+
+    def index_after(self, column: str, value: int) -> int:
+        """Index of the first row whose value in an ascending int column is > value"""
+        return bisect.bisect_right(self._columns[column], value, self._start, self._end) - self._start
+
+    def _physical_index(self, index: int) -> int:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("row index out of range")
+        return self._start + index
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode_row(self._start + i) for i in range(*index.indices(len(self)))]
+        return self._decode_row(self._physical_index(index))
+
+    def __iter__(self) -> Iterator[Dict]:
+        for i in range(self._start, self._end):
+            yield self._decode_row(i)
+
+    def to_records(self, start: int = 0, stop: Optional[int] = None) -> List[Dict]:
+        """Decode rows [start, stop) into dicts"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        return [self._decode_row(self._start + i) for i in range(max(start, 0), stop)]
+
+    def to_json(self, start: int = 0, stop: Optional[int] = None) -> str:
+        """JSON array of rows [start, stop)"""
+        return json.dumps(self.to_records(start, stop), ensure_ascii=False)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the code arrays (excluding dictionaries)"""
+        return sum(column.itemsize * len(column) for column in self._columns.values())
+
+    def dictionary_size(self) -> int:
+        """Distinct values held by all dictionaries"""
+        return sum(len(dictionary) for dictionary in self._dictionaries.values())
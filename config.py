@@ -1,6 +1,7 @@
 """
 Configuration settings for Dental IQ application
 """
+import os
 
 PAGE_CONFIG = {
     "page_title": "Dental IQ",
@@ -22,4 +23,18 @@ iframe {
     display: block;
 }
 </style>
-"""
\ No newline at end of file
+"""
+
+# Sidecar HTTP server (app_server.py) for cacheable static assets
+APP_SERVER_HOST = os.getenv("DENTAL_IQ_SERVER_HOST", "0.0.0.0")
+APP_SERVER_PORT = int(os.getenv("DENTAL_IQ_SERVER_PORT", "8510"))
+# Public base URL of the sidecar as seen by the browser (e.g. behind a proxy).
+# Empty means "same host as the Streamlit page, APP_SERVER_PORT".
+APP_SERVER_PUBLIC_URL = os.getenv("DENTAL_IQ_SERVER_PUBLIC_URL", "").rstrip("/")
+
+# Avatar delivery: "static" serves content-hashed URLs from the sidecar,
+# "inline" embeds base64 data URLs into the payload (legacy behaviour)
+AVATAR_DELIVERY = os.getenv("DENTAL_IQ_AVATAR_DELIVERY", "static")
+
+# Maximum rows kept per agent in a session (base + simulated, newest win)
+MAX_ROWS_PER_AGENT = int(os.getenv("DENTAL_IQ_MAX_ROWS_PER_AGENT", "500"))
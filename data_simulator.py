@@ -3,6 +3,8 @@ Data simulation utilities for generating test data
 """
 import random
 
+from kpi_engine import HANDLING_TIME_KEY
+
 class DataSimulator:
     """Handles simulation of various data types for different agents"""
     
@@ -64,7 +66,8 @@ class DataSimulator:
                 "Požadavek": random.choice(self.REQUESTS),
                 "Čas": f"{random.randint(8, 17)}:{random.choice(['00','15','30','45'])}",
                 "Výsledek": status,
-                "Popis problému": problem_desc
+                "Popis problému": problem_desc,
+                HANDLING_TIME_KEY: round(random.uniform(1.0, 4.0), 1)
             })
         return rows
     
@@ -94,7 +97,8 @@ class DataSimulator:
                 "Téma": random.choice(self.EMAIL_ISSUES),
                 "Zjištěno": zjisteno,
                 "Komentář": comment,
-                "Popis problému": problem_desc
+                "Popis problému": problem_desc,
+                HANDLING_TIME_KEY: round(random.uniform(1.5, 5.0), 1)
             })
         return rows
     
@@ -144,7 +148,8 @@ class DataSimulator:
                 "Status": status,
                 "Velikost": f"{random.randint(120,1200)} kB",
                 "Archiv": f"archiv_{random.randint(1,4)}",
-                "Popis problému": problem_desc
+                "Popis problému": problem_desc,
+                HANDLING_TIME_KEY: round(random.uniform(0.8, 2.5), 1)
             })
         return rows
     
@@ -173,6 +178,7 @@ class DataSimulator:
                 "Problém": problem,
                 "Priorita": random.choice(self.PRIORITIES),
                 "Link": f"https://dentalsystem.cz/record/{i+1}",
-                "Popis problému": problem_desc
+                "Popis problému": problem_desc,
+                HANDLING_TIME_KEY: round(random.uniform(0.3, 1.5), 1)
             })
         return rows
\ No newline at end of file
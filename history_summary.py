@@ -0,0 +1,82 @@
+"""
+Rolling summary of long chat histories
+Only the last few turns of a conversation are kept verbatim. Older turns
+are folded into a running summary in the background, then removed from
+the session's history list, so both the prompt and the session memory stay
+bounded on all-day conversations.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+# Messages kept verbatim (user + bot, i.e. 3 exchanges)
+HISTORY_RAW_MESSAGES = int(os.getenv("DENTAL_IQ_HISTORY_RAW_MESSAGES", "6"))
+# Fold only once this many messages beyond the raw tail have piled up
+HISTORY_COMPACT_BATCH = 4
+# Longest summary kept (characters); also the cap of the local fallback
+SUMMARY_MAX_CHARS = 1200
+# Per-message excerpt length of the local (no-model) summary
+_EXCERPT_CHARS = 160
+
+# Summaries are generated off the request path
+_summary_workers = ThreadPoolExecutor(2, thread_name_prefix="dental-iq-summary")
+
+
+def _local_summary(previous: str, messages: List[Dict]) -> str:
+    """Extractive summary used when the model is unavailable"""
+    lines = [previous] if previous else []
+    for msg in messages:
+        who = "Uživatel" if msg.get("who") == "user" else "Asistent"
+        text = " ".join(msg.get("text", "").split())
+        if len(text) > _EXCERPT_CHARS:
+            text = text[:_EXCERPT_CHARS].rsplit(" ", 1)[0] + "…"
+        lines.append(f"{who}: {text}")
+    # Keep the newest part when over the cap
+    return "\n".join(lines)[-SUMMARY_MAX_CHARS:]
+
+
+class HistoryCompactor:
+    """Running summary of one session's chat history"""
+
+    def __init__(self, summarize: Callable[[str, List[Dict], Optional[str]], Optional[str]] = None):
+        """
+        Args:
+            summarize: fn(previous summary, messages, client_id) -> new summary,
+                       or None if it failed (the local summary is used then)
+        """
+        self.summary = ""
+        self._summarize = summarize
+        self._pending = False
+        self._lock = threading.Lock()
+
+    def maybe_compact(self, chat_history: List[Dict], client_id: str = None):
+        """Schedule folding of old turns if the raw history has grown too long"""
+        fold_count = len(chat_history) - HISTORY_RAW_MESSAGES
+        if fold_count < HISTORY_COMPACT_BATCH:
+            return
+        with self._lock:
+            if self._pending:
+                return
+            self._pending = True
+        folded = list(chat_history[:fold_count])
+        _summary_workers.submit(self._compact, chat_history, folded, client_id)
+
+    def _compact(self, chat_history: List[Dict], folded: List[Dict], client_id: Optional[str]):
+        try:
+            summary = None
+            if self._summarize is not None:
+                try:
+                    summary = self._summarize(self.summary, folded, client_id)
+                except Exception as e:
+                    print(f"Error summarizing chat history: {e}")
+            if not summary:
+                summary = _local_summary(self.summary, folded)
+            with self._lock:
+                self.summary = summary[:SUMMARY_MAX_CHARS]
+                # Appends only happen at the end, so the folded turns are still the head
+                if chat_history[:len(folded)] == folded:
+                    del chat_history[:len(folded)]
+        finally:
+            with self._lock:
+                self._pending = False
@@ -0,0 +1,183 @@
+"""
+KPI engine
+Keeps running aggregates per agent (counts, success rate, mean handling
+time, out-of-hours and issue counters) that are updated in O(1) for every
+row appended. Dashboard KPI arrays are formatted from these aggregates,
+never from a rescan of the rows.
+"""
+from typing import Callable, Dict, List, Optional, Tuple
+
+from attention import ATTENTION_KEY
+
+# Clinic office hours (rows outside count as "out of hours")
+OFFICE_HOURS = (8, 16)
+# Hidden column with the handling time of a row in minutes (call, card, e-mail, audit)
+HANDLING_TIME_KEY = "_min"
+# Time a receptionist needs for one patient summary by hand
+MANUAL_SUMMARY_MINUTES = 10
+
+
+def _parse_hour(value: str) -> Optional[int]:
+    try:
+        return int(value.split(":", 1)[0])
+    except (AttributeError, ValueError):
+        return None
+
+
+def _is_out_of_hours(row: Dict) -> bool:
+    hour = _parse_hour(row.get("Čas", ""))
+    return hour is not None and not (OFFICE_HOURS[0] <= hour < OFFICE_HOURS[1])
+
+
+def _prep_minutes(row: Dict) -> Optional[float]:
+    try:
+        return float(row.get("Čas přípravy", "").split()[0])
+    except (IndexError, ValueError):
+        return None
+
+
+def _handling_minutes(row: Dict) -> Optional[float]:
+    return row.get(HANDLING_TIME_KEY)
+
+
+def _saved_minutes(row: Dict) -> float:
+    minutes = _prep_minutes(row)
+    return max(MANUAL_SUMMARY_MINUTES - minutes, 0) if minutes is not None else 0
+
+
+class KpiSpec:
+    """
+    How rows of one agent feed its aggregates and how KPIs are labelled
+    Counters add 1 for rows their function returns True for, or the
+    returned amount (e.g. minutes) when it returns a number
+    """
+
+    def __init__(self,
+                 success: Callable[[Dict], bool],
+                 kpis: List[Tuple[str, str]],
+                 mini_kpis: List[Tuple[str, str]],
+                 counters: Dict[str, Callable[[Dict], bool]] = None,
+                 duration: Callable[[Dict], Optional[float]] = None):
+        self.success = success
+        self.kpis = kpis
+        self.mini_kpis = mini_kpis
+        self.counters = counters or {}
+        self.duration = duration
+
+
+def _needs_attention(row: Dict) -> bool:
+    return bool(row.get(ATTENTION_KEY))
+
+
+KPI_SPECS: Dict[str, KpiSpec] = {
+    "isabella": KpiSpec(
+        success=lambda row: "✅" in row.get("Výsledek", ""),
+        counters={"out_of_hours": _is_out_of_hours},
+        duration=_handling_minutes,
+        kpis=[("📞 Zpracované hovory", "count"), ("🌑 Mimo pracovní dobu", "out_of_hours")],
+        mini_kpis=[("📞", "count"), ("🌑", "out_of_hours"), ("✅", "success_rate"), ("⏱️", "mean_time")],
+    ),
+    "leo": KpiSpec(
+        success=lambda row: "✅" in row.get("Status", ""),
+        counters={"cards": lambda row: True, "archived": lambda row: "✅" in row.get("Status", "")},
+        duration=_handling_minutes,
+        kpis=[("📘 Vytvořené karty", "cards"), ("📕 Zpracované archivy", "archived")],
+        mini_kpis=[("📘", "cards"), ("📕", "archived"), ("✅", "success_rate"), ("⏱️", "mean_time")],
+    ),
+    "gabriel": KpiSpec(
+        success=lambda row: "✅" in row.get("Komentář", ""),
+        counters={"issues": _needs_attention},
+        duration=_handling_minutes,
+        kpis=[("📪 Zpracované e-maily", "count"), ("⚠️ Nalezené problémy", "issues")],
+        mini_kpis=[("📪", "count"), ("⚠️", "issues"), ("✅", "success_rate"), ("⏱️", "mean_time")],
+    ),
+    "nora": KpiSpec(
+        # Every generated summary counts as a success
+        success=lambda row: True,
+        counters={"saved": _saved_minutes},
+        duration=_prep_minutes,
+        kpis=[("🕐 Ušetřený čas", "saved_time"), ("🧾 Shrnutých pacientů", "count")],
+        mini_kpis=[("🕐", "saved_time_short"), ("🧾", "count"), ("✅", "success_rate"), ("⏱️", "mean_time")],
+    ),
+    "auditor": KpiSpec(
+        # Every audit row is a found problem
+        success=lambda row: False,
+        counters={"issues": lambda row: True},
+        duration=_handling_minutes,
+        kpis=[("📋 Zkontrolované záznamy", "count"), ("⚠️ Nalezené problémy", "issues")],
+        mini_kpis=[("📋", "count"), ("⚠️", "issues"), ("✅", "success_rate"), ("⏱️", "mean_time")],
+    ),
+}
+
+
+class AgentKpis:
+    """Running aggregates for one agent"""
+
+    __slots__ = ("spec", "count", "successes", "duration_total", "duration_count", "counters")
+
+    def __init__(self, spec: KpiSpec, baseline: Dict = None):
+        baseline = baseline or {}
+        self.spec = spec
+        self.count = baseline.get("count", 0)
+        self.successes = baseline.get("successes", 0)
+        self.duration_total = baseline.get("duration_total", 0.0)
+        self.duration_count = baseline.get("duration_count", 0)
+        self.counters = {name: baseline.get(name, 0) for name in spec.counters}
+
+    def copy(self) -> "AgentKpis":
+        clone = AgentKpis.__new__(AgentKpis)
+        clone.spec = self.spec
+        clone.count = self.count
+        clone.successes = self.successes
+        clone.duration_total = self.duration_total
+        clone.duration_count = self.duration_count
+        clone.counters = dict(self.counters)
+        return clone
+
+    def add_row(self, row: Dict):
+        """Update aggregates with one new row - O(1)"""
+        spec = self.spec
+        self.count += 1
+        if spec.success(row):
+            self.successes += 1
+        if spec.duration is not None:
+            minutes = spec.duration(row)
+            if minutes is not None:
+                self.duration_total += minutes
+                self.duration_count += 1
+        for name, counter in spec.counters.items():
+            amount = counter(row)
+            if amount:
+                self.counters[name] += amount
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add_row(row)
+
+    def value(self, metric: str) -> str:
+        """Formatted value of a metric"""
+        if metric == "count":
+            return str(self.count)
+        if metric == "success_rate":
+            rate = self.successes / self.count if self.count else 0
+            return f"{round(rate * 100)}%"
+        if metric == "mean_time":
+            mean = self.duration_total / self.duration_count if self.duration_count else 0
+            return f"{mean:.1f}m"
+        if metric == "saved_time":
+            return f"{round(self.counters.get('saved', 0))} min"
+        if metric == "saved_time_short":
+            return f"{round(self.counters.get('saved', 0))}m"
+        return str(self.counters.get(metric, 0))
+
+    def kpis(self) -> List[List[str]]:
+        return [[label, self.value(metric)] for label, metric in self.spec.kpis]
+
+    def mini_kpis(self) -> List[List[str]]:
+        return [[icon, self.value(metric)] for icon, metric in self.spec.mini_kpis]
+
+
+def create_agent_kpis(agent_id: str, baseline: Dict = None) -> Optional[AgentKpis]:
+    """Create aggregates for an agent, or None if it has no KPI spec"""
+    spec = KPI_SPECS.get(agent_id)
+    return AgentKpis(spec, baseline) if spec else None
@@ -0,0 +1,242 @@
+"""
+Local answers to simple Czech data questions
+Plain lookups ("kolik e-mailů zpracoval Gabriel?", "co čeká u Lea?") are
+answered straight from the agent data without calling the model. The
+matcher recognises three intents for the agents named in the question:
+
+- kpi:       "kolik" + all words of one of the agent's KPI labels
+- count:     "kolik" + records ("záznamů") or waiting/problem words
+- attention: a lookup opening ("co", "které", "ukaž", ...) + waiting/problem
+             words without "kolik" (lists the items)
+
+The kpi and count intents answer only when no other content word is left
+over: a qualifier like "za poslední týden", "nevyřešila" or a patient name
+changes the number asked for. Anything else, questions naming no agent,
+open-ended questions ("proč", "navrhni", "co s tím", ...) and requests to
+write or prepare something ("napiš", "pošli", ...) go to Azure. Every lookup is counted in the
+dental_iq_local_intents_total metric by intent ("none" = not matched), so
+the hit rate shows which questions are worth a new intent.
+"""
+import os
+import re
+from typing import Dict, List, Optional
+
+from attention import ATTENTION_KEY, REASON_LABELS
+from metrics import get_metrics, stage
+from retrieval import STOPWORDS, fold_text
+
+LOCAL_INTENTS_ENABLED = os.getenv("DENTAL_IQ_LOCAL_INTENTS", "1") == "1"
+
+# Longer messages are rarely plain lookups
+MAX_QUESTION_WORDS = 14
+# Attention items listed in an answer
+MAX_LISTED_ITEMS = 5
+# Stem length for matching KPI labels (Czech inflection: "e-mailů" ~ "e-maily")
+STEM_LENGTH = 4
+
+# Agent name forms (folded); names of 5+ characters also match as prefixes
+AGENT_ALIASES = {
+    "isabella": ("isabell", "isabel"),
+    "gabriel": ("gabriel",),
+    "leo": ("leo", "lea", "leovi", "leem", "leu"),
+    "nora": ("nora", "nory", "nore", "noru", "norou"),
+    "auditor": ("auditor",),
+}
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+# Folded stems
+_COUNT_WORDS = ("kolik",)
+_RECORD_STEMS = ("zazn", "polo", "radk")
+_ATTENTION_STEMS = ("ceka", "cek", "pozor", "probl", "resi", "vyres", "chyb", "nevyr", "upozor")
+# Lookups open with one of these (within the first LOOKUP_OPENING_WORDS words);
+# a relative "který" later in a sentence is not a question
+_LOOKUP_WORDS = (
+    "co", "ktere", "ktery", "ktera", "kteri", "jake", "jaky", "jaka", "jaci",
+    "ukaz", "ukazte", "vypis", "vypiste", "zobraz",
+)
+LOOKUP_OPENING_WORDS = 2
+_OPEN_ENDED_WORDS = (
+    "proc", "jak", "jakto", "kdyby",
+    # Requests to act, not to look something up
+    "napis", "napiste", "posli", "poslete", "vytvor", "vytvorte", "priprav", "pripravte",
+)
+_OPEN_ENDED_STEMS = ("navrh", "doporu", "vysvet", "porov", "analy", "pomoz", "zleps")
+_OPEN_ENDED_PHRASES = ("co s tim", "co s nim", "co s ni", "co delat", "co mam")
+# Content words that don't change what a count question asks for
+_FILLER_STEMS = ("agen", "celk", "aktu", "ted", "zati")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD_RE.findall(fold_text(text))
+
+
+def _stems(words) -> set:
+    return {w[:STEM_LENGTH] for w in words if len(w) > 1 and w not in STOPWORDS}
+
+
+def _aliases(agent: Dict) -> tuple:
+    return AGENT_ALIASES.get(agent.get("id", ""), (fold_text(agent.get("name", "")),))
+
+
+def _is_alias(word: str, aliases) -> bool:
+    return any(word == a or (len(a) >= 5 and word.startswith(a)) for a in aliases)
+
+
+def _named_agents(words: List[str], agents_data: List[Dict]) -> List[Dict]:
+    return [agent for agent in agents_data if any(_is_alias(w, _aliases(agent)) for w in words)]
+
+
+def _content_words(words: List[str], agents: List[Dict]) -> List[str]:
+    """Words of the question other than stopwords, agent names and filler"""
+    return [
+        w for w in words
+        if len(w) > 1 and w not in STOPWORDS and w not in _COUNT_WORDS and not w.startswith(_FILLER_STEMS)
+        and not any(_is_alias(w, _aliases(agent)) for agent in agents)
+    ]
+
+
+def _matches_stem(word: str, stem: str) -> bool:
+    # Short label words ("čas") match their inflected forms ("času")
+    return word[:STEM_LENGTH] == stem or (len(stem) < STEM_LENGTH and word.startswith(stem))
+
+
+def _plural(count: int, one: str, few: str, many: str) -> str:
+    if count == 1:
+        return f"{count} {one}"
+    if 2 <= count <= 4:
+        return f"{count} {few}"
+    return f"{count} {many}"
+
+
+def _label(kpi_label: str) -> str:
+    """KPI label without its leading emoji"""
+    return kpi_label.split(" ", 1)[1] if " " in kpi_label and not kpi_label[0].isalnum() else kpi_label
+
+
+def _exact_kpi(agent: Dict, content_words: List[str]) -> Optional[list]:
+    """
+    The KPI whose label words are all in the question and cover all of its
+    content words (None if there is no such KPI or more than one)
+    """
+    matches = []
+    for kpi in agent.get("kpis", []):
+        label_stems = _stems(_words(_label(kpi[0])))
+        if not label_stems:
+            continue
+        covered = all(any(_matches_stem(w, stem) for w in content_words) for stem in label_stems)
+        leftover = [w for w in content_words if not any(_matches_stem(w, stem) for stem in label_stems)]
+        if covered and not leftover:
+            matches.append(kpi)
+    return matches[0] if len(matches) == 1 else None
+
+
+def _attention_rows(agent: Dict) -> List[Dict]:
+    attention_ids = set(agent.get("attention_ids", []))
+    return [row for row in reversed(agent.get("rows", [])) if row.get("_id") in attention_ids]
+
+
+def _describe_row(row: Dict) -> str:
+    values = [str(v) for k, v in row.items() if v and not k.startswith("_") and k != "Popis problému"]
+    reason = REASON_LABELS.get(row.get(ATTENTION_KEY, 0), "")
+    return " – ".join(values[:2]) + (f" ({reason})" if reason else "")
+
+
+def _attention_answer(agent: Dict) -> str:
+    rows = _attention_rows(agent)
+    if not rows:
+        return f"U agenta {agent.get('name', '')} teď nic nevyžaduje pozornost."
+    lines = [f"Záznamy vyžadující pozornost u agenta {agent.get('name', '')} ({len(rows)}):"]
+    lines.extend(f"- {_describe_row(row)}" for row in rows[:MAX_LISTED_ITEMS])
+    if len(rows) > MAX_LISTED_ITEMS:
+        lines.append(f"- … a další ({len(rows) - MAX_LISTED_ITEMS})")
+    return "\n".join(lines)
+
+
+def _match(message: str, agents_data: List[Dict]):
+    """Returns (intent, answer) or (None, None)"""
+    words = _words(message)
+    if not words or len(words) > MAX_QUESTION_WORDS:
+        return None, None
+    if any(w in _OPEN_ENDED_WORDS or w.startswith(_OPEN_ENDED_STEMS) for w in words):
+        return None, None
+    text = " ".join(words)
+    if any(f" {phrase} " in f" {text} " for phrase in _OPEN_ENDED_PHRASES):
+        return None, None
+    agents = _named_agents(words, agents_data)
+    if not agents:
+        return None, None
+
+    asks_count = any(w in _COUNT_WORDS for w in words)
+    asks_attention = any(w.startswith(_ATTENTION_STEMS) for w in words)
+
+    if asks_count:
+        content_words = _content_words(words, agents)
+        kpis = [(agent, _exact_kpi(agent, content_words)) for agent in agents]
+        if all(kpi is not None for _, kpi in kpis):
+            return "kpi", "\n".join(f"{agent.get('name', '')} – {_label(kpi[0])}: {kpi[1]}" for agent, kpi in kpis)
+        # Counts of rows: only waiting/problem and record words may be left over
+        if any(not w.startswith(_ATTENTION_STEMS + _RECORD_STEMS) for w in content_words):
+            return None, None
+        if asks_attention:
+            return "count", "\n".join(
+                f"Záznamy vyžadující pozornost u agenta {agent.get('name', '')}: {len(_attention_rows(agent))}"
+                for agent in agents
+            )
+        if any(w.startswith(_RECORD_STEMS) for w in words):
+            return "count", "\n".join(
+                f"Agent {agent.get('name', '')} má v přehledu "
+                f"{_plural(len(agent.get('rows', [])), 'záznam', 'záznamy', 'záznamů')}."
+                for agent in agents
+            )
+        return None, None
+    if asks_attention and any(w in _LOOKUP_WORDS for w in words[:LOOKUP_OPENING_WORDS]):
+        return "attention", "\n\n".join(_attention_answer(agent) for agent in agents)
+    return None, None
+
+
+def answer_locally(message: str, agents_data: List[Dict]) -> Optional[str]:
+    """
+    Answer a plain data question from the (role-filtered) agent data
+    Returns None when the question needs the model
+    """
+    if not LOCAL_INTENTS_ENABLED:
+        return None
+    with stage("local_intent"):
+        intent, answer = _match(message, agents_data)
+    get_metrics().inc("local_intents", intent=intent or "none")
+    return answer
+
+
+if __name__ == "__main__":
+    # Regression check of the matcher: python local_intents.py
+    from agent_store import get_agent_store
+
+    agents = get_agent_store().new_session().snapshot()
+    examples = [
+        ("Kolik e-mailů zpracoval Gabriel?", "kpi"),
+        ("Co čeká u Lea?", "attention"),
+        ("Jaké jsou problémy u Gabriela?", "attention"),
+        ("Které záznamy vyžadují pozornost u Nory?", "attention"),
+        ("Kolik záznamů má Isabella?", "count"),
+        ("Proč Leo nevyřešil kartu?", None),
+        ("Gabriel má problém s tiskárnou, co s tím?", None),
+        ("Napiš e-mail pacientovi, který čeká u Gabriela", None),
+        ("Pošli Leovi připomínku k chybě", None),
+        ("Gabriel má problém", None),
+        ("Kolik hovorů zpracovala Isabella?", "kpi"),
+        ("Kolik času ušetřila Nora?", "kpi"),
+        ("Kolik záznamů čeká u Auditora?", "count"),
+        # Qualifiers the local answer would ignore
+        ("Kolik hovorů čeká u Isabelly?", None),
+        ("Kolik zpracovaných hovorů Isabella nevyřešila?", None),
+        ("Kolik e-mailů od pacienta patient15 čeká u Gabriela?", None),
+        ("Kolik chyb mají karty u Lea za poslední týden?", None),
+        ("Kolik pacientů čeká u Isabelly na potvrzení SMS?", None),
+    ]
+    failed = 0
+    for message, expected in examples:
+        intent, _ = _match(message, agents)
+        ok = intent == expected
+        failed += not ok
+        print(f"{'ok  ' if ok else 'FAIL'} {message!r}: {intent} (expected {expected})")
+    raise SystemExit(1 if failed else 0)
@@ -1,12 +1,27 @@
 import streamlit as st
-from config import PAGE_CONFIG, CUSTOM_CSS
+from config import PAGE_CONFIG, CUSTOM_CSS, APP_SERVER_PORT
+from app_server import ensure_app_server, get_public_url
+
+# Start the sidecar (chat endpoints, hashed avatars) before the agent data is
+# imported, so avatar URLs point to it only when it is running. Chat is
+# served only by the sidecar, so every rerun retries a failed start.
+app_server_running = ensure_app_server()
+
 from data_simulator import DataSimulator
-from agents_config import AGENTS_DATA
-from ui_template import get_html_template
+from agent_store import get_agent_store
+from payload_delta import PayloadTracker
+from ui_template import render_html
 from auth import init_auth_state, is_logged_in, get_current_user, logout_user, restore_session_from_token
 from login_ui import render_login_page
-from azure_chat import chat_with_azure
+from chat_sessions import register_chat_session
+from history_summary import HistoryCompactor
+from azure_chat import summarize_chat_history
+from metrics import observe_stage, stage
 import json
+import time
+
+# Script run duration, reported as the streamlit_rerun stage
+_rerun_started = time.perf_counter()
 
 # Page configuration
 st.set_page_config(**PAGE_CONFIG)
@@ -23,6 +38,12 @@ def init_session_state():
         st.session_state.selected_agent = ""
     if "chat_history" not in st.session_state:
         st.session_state.chat_history = []
+    if "agent_data" not in st.session_state:
+        st.session_state.agent_data = get_agent_store().new_session()
+    if "payload_tracker" not in st.session_state:
+        st.session_state.payload_tracker = PayloadTracker()
+    if "history_compactor" not in st.session_state:
+        st.session_state.history_compactor = HistoryCompactor(summarize_chat_history)
 
 init_session_state()
 
@@ -87,26 +108,36 @@ def should_simulate(agent_id):
         return False
     return agent_id == st.session_state.selected_agent
 
-# Update agents with simulated data
-agents_data = AGENTS_DATA.copy()
-for agent in agents_data:
-    agent_id = agent["id"]
+# Update this session's agent data with simulated rows
+# (appended to a per-session overlay, never to the shared base data)
+session_agents = st.session_state.agent_data
+for agent_id in session_agents.store.agent_ids:
     if should_simulate(agent_id):
         # Add simulated rows based on agent type
         if agent_id == "isabella":
-            agent["rows"].extend(simulator.simulate_isabella(12))
+            session_agents.append_rows(agent_id, simulator.simulate_isabella(12))
         elif agent_id == "gabriel":
-            agent["rows"].extend(simulator.simulate_gabriel(12))
+            session_agents.append_rows(agent_id, simulator.simulate_gabriel(12))
         elif agent_id == "nora":
-            agent["rows"].extend(simulator.simulate_nora(12))
+            session_agents.append_rows(agent_id, simulator.simulate_nora(12))
         elif agent_id == "leo":
-            agent["rows"].extend(simulator.simulate_leo(12))
+            session_agents.append_rows(agent_id, simulator.simulate_leo(12))
         elif agent_id == "auditor":
-            agent["rows"].extend(simulator.simulate_auditor(5))
-
-# Prepare payload
-payload = {
-    "agents": agents_data,
+            session_agents.append_rows(agent_id, simulator.simulate_auditor(5))
+
+# Let the sidecar chat endpoints find this session by its token
+register_chat_session(
+    st.session_state.get("_chat_token", ""),
+    current_user,
+    session_agents,
+    st.session_state.chat_history,
+    st.session_state.history_compactor,
+    st.session_state.payload_tracker
+)
+
+# Prepare payload (full on first render, otherwise a delta against the
+# version this session's browser already has)
+payload_meta = {
     "simulate_active": st.session_state.simulate_active,
     "selected_agent": st.session_state.selected_agent,
     "user_info": {
@@ -117,29 +148,21 @@ payload = {
         "job_role": current_user.get("job_role", "admin")
     },
     "show_welcome": show_welcome_msg,
-    "session_token": st.session_state.get("_session_token", "")
+    # Chat bearer token; restore_token is only persisted for session restore
+    "session_token": st.session_state.get("_chat_token", ""),
+    "restore_token": st.session_state.get("_session_token", ""),
+    "app_server": {
+        "url": get_public_url(),
+        "port": APP_SERVER_PORT,
+        "running": app_server_running
+    }
 }
 
-payload_json = json.dumps(payload, ensure_ascii=False)
-
-# Handle chat requests via query params (simpler approach)
-if "chat_message" in st.query_params:
-    user_message = st.query_params.get("chat_message", "")
-    chat_history = st.session_state.get("chat_history", [])
-    
-    if user_message:
-        # Get AI response
-        response = chat_with_azure(user_message, agents_data, chat_history)
-        
-        # Update chat history
-        chat_history.append({"who": "user", "text": user_message})
-        chat_history.append({"who": "bot", "text": response})
-        st.session_state.chat_history = chat_history
-        
-        # Return JSON response
-        st.json({"response": response})
-        st.stop()
+with stage("payload_build"):
+    payload = st.session_state.payload_tracker.build_message(session_agents, payload_meta)
+    payload_json = json.dumps(payload, ensure_ascii=False)
 
 # Render HTML component
-html_content = get_html_template().replace('__PAYLOAD__', payload_json)
-st.components.v1.html(html_content, height=800, scrolling=False)
\ No newline at end of file
+html_content = render_html(payload_json)
+st.components.v1.html(html_content, height=800, scrolling=False)
+observe_stage("streamlit_rerun", time.perf_counter() - _rerun_started)
\ No newline at end of file
@@ -0,0 +1,144 @@
+"""
+In-process metrics registry
+Fixed-bucket histograms and counters, cheap enough to update on every chat
+request (one lock and a bisect per observation). The sidecar exports them
+at GET /metrics as JSON or, with ?format=prometheus, in the Prometheus text
+format.
+
+Chat pipeline stages are timed with `stage("name")` into the
+dental_iq_stage_seconds histogram; token counts go to dental_iq_tokens.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Tuple
+
+METRIC_PREFIX = "dental_iq_"
+
+# Upper bounds (seconds) for latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Upper bounds for token count histograms
+TOKEN_BUCKETS = (16, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+_DESCRIPTIONS = {
+    "stage_seconds": "Duration of chat pipeline stages",
+    "tokens": "Tokens per Azure OpenAI request",
+}
+
+
+class Histogram:
+    """Cumulative-bucket histogram of one label set"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts, total, count = list(self.counts), self.total, self.count
+        cumulative, running = {}, 0
+        for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+            running += bucket_count
+            cumulative["+Inf" if bound == float("inf") else f"{bound:g}"] = running
+        return {"count": count, "sum": total, "buckets": cumulative}
+
+
+class MetricsRegistry:
+    """Histograms and counters keyed by metric name and labels"""
+
+    def __init__(self):
+        self._histograms: Dict[tuple, Histogram] = {}
+        self._counters: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram(buckets))
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def to_json(self) -> Dict:
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+        result = {"histograms": [], "counters": []}
+        for (name, labels), histogram in sorted(histograms, key=lambda item: item[0]):
+            result["histograms"].append(dict(histogram.snapshot(), name=name, labels=dict(labels)))
+        for (name, labels), value in sorted(counters):
+            result["counters"].append({"name": name, "labels": dict(labels), "value": value})
+        return result
+
+    def to_prometheus(self) -> str:
+        data = self.to_json()
+        lines, described = [], set()
+
+        def describe(name: str, kind: str):
+            if name not in described:
+                described.add(name)
+                if name in _DESCRIPTIONS:
+                    lines.append(f"# HELP {METRIC_PREFIX}{name} {_DESCRIPTIONS[name]}")
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+
+        for h in data["histograms"]:
+            describe(h["name"], "histogram")
+            metric = METRIC_PREFIX + h["name"]
+            for bound, count in h["buckets"].items():
+                lines.append(f"{metric}_bucket{_labels(h['labels'], le=bound)} {count}")
+            lines.append(f"{metric}_sum{_labels(h['labels'])} {h['sum']:g}")
+            lines.append(f"{metric}_count{_labels(h['labels'])} {h['count']}")
+        for c in data["counters"]:
+            describe(c["name"], "counter")
+            lines.append(f"{METRIC_PREFIX}{c['name']}_total{_labels(c['labels'])} {c['value']:g}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Dict, **extra) -> str:
+    items = list(labels.items()) + list(extra.items())
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in items)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(items, escaped)) + "}"
+
+
+_registry = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Process-wide registry"""
+    return _registry
+
+
+def observe_stage(name: str, seconds: float):
+    _registry.observe("stage_seconds", seconds, stage=name)
+
+
+def observe_tokens(kind: str, tokens: int):
+    _registry.observe("tokens", tokens, TOKEN_BUCKETS, kind=kind)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as a chat pipeline stage"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
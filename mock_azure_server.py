@@ -0,0 +1,295 @@
+"""
+Local mock of the Azure OpenAI chat completions API
+Answers POST .../chat/completions like Azure does (JSON or SSE stream) with
+configurable latency, token rate and injected errors, so the chat path can
+be load-tested offline without spending real tokens. Like Azure, it reports
+prompt prefixes it has seen before (1024+ tokens, in 128-token steps) as
+cached prompt tokens. When the request offers tools, the mock first calls
+the first tool (arguments filled from its schema) and answers once the
+tool result is in the conversation.
+
+Usage:
+    python mock_azure_server.py --port 8600 --latency-ms 800 --error-rate 0.02
+
+Point the app at it:
+    AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8600 AZURE_OPENAI_API_KEY=mock streamlit run main.py
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# Prompt caching: minimum cached prefix and its granularity (tokens)
+PREFIX_CACHE_MIN_TOKENS = 1024
+PREFIX_CACHE_BLOCK_TOKENS = 128
+PREFIX_CACHE_MAX_ENTRIES = 100000
+
+# Czech-looking filler the mock answers with
+ANSWER_WORDS = (
+    "Podle", "dat", "agentů", "je", "dnes", "vše", "v", "pořádku", "až", "na", "několik",
+    "záznamů", "které", "vyžadují", "kontrolu", "recepce", "by", "měla", "ověřit",
+    "čekající", "hovory", "a", "doplnit", "chybějící", "přílohy", "u", "karet", "pacientů."
+)
+
+
+class MockSettings:
+    """Behaviour of the mock, shared by all request threads"""
+
+    def __init__(self, latency_ms: float = 600, latency_sigma: float = 0.5,
+                 tokens_per_second: float = 60, answer_tokens: int = 80,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = 1.0, seed: int = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._prefixes = set()
+        self.requests = 0
+
+    def sample_latency(self) -> float:
+        """Time to first token in seconds (log-normal around latency_ms)"""
+        with self._lock:
+            self.requests += 1
+            if self.latency_sigma <= 0:
+                return self.latency_ms / 1000
+            return self._random.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+    def sample_outcome(self) -> str:
+        """"ok", "throttle" (429) or "error" (500)"""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return "throttle"
+        if roll < self.throttle_rate + self.error_rate:
+            return "error"
+        return "ok"
+
+    def cached_prompt_tokens(self, messages: list) -> int:
+        """Longest previously seen prompt prefix, in whole cache blocks"""
+        text = "".join(f"{m.get('role')}\n{m.get('content') or ''}\n" for m in messages)
+        block_chars = PREFIX_CACHE_BLOCK_TOKENS * 4
+        digest = hashlib.sha1()
+        cached, boundaries = 0, []
+        for end in range(block_chars, len(text) + 1, block_chars):
+            digest.update(text[end - block_chars:end].encode("utf-8"))
+            if end // 4 >= PREFIX_CACHE_MIN_TOKENS:
+                boundaries.append((end // 4, digest.hexdigest()))
+        with self._lock:
+            for tokens, key in boundaries:
+                if key in self._prefixes:
+                    cached = tokens
+            if len(self._prefixes) > PREFIX_CACHE_MAX_ENTRIES:
+                self._prefixes.clear()
+            self._prefixes.update(key for _, key in boundaries)
+        return cached
+
+    def answer_tokens_for(self, max_tokens: int) -> list:
+        count = min(self.answer_tokens, max_tokens or self.answer_tokens)
+        return [ANSWER_WORDS[i % len(ANSWER_WORDS)] + " " for i in range(count)]
+
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    """Chat completions endpoint; any deployment path is accepted"""
+
+    protocol_version = "HTTP/1.1"
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        # Load-test clients drop keep-alive connections at will
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _send_json(self, status: int, data: dict, headers: dict = None):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        path = self.path.split("?", 1)[0]
+        if not path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"code": "404", "message": "Resource not found"}})
+            return
+        length = int(self.headers.get("Content-Length", "0"))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"code": "BadRequest", "message": "Invalid JSON"}})
+            return
+
+        settings = self.settings
+        time.sleep(settings.sample_latency())
+
+        outcome = settings.sample_outcome()
+        if outcome == "throttle":
+            self._send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                            {"Retry-After": f"{settings.retry_after:g}",
+                             "retry-after-ms": str(int(settings.retry_after * 1000))})
+            return
+        if outcome == "error":
+            self._send_json(500, {"error": {"code": "InternalServerError", "message": "Mock failure"}})
+            return
+
+        messages = request.get("messages", [])
+        prompt_tokens = sum(len(m.get("content") or "") for m in messages) // 4
+        usage = {"prompt_tokens": prompt_tokens,
+                 "prompt_tokens_details": {"cached_tokens": min(settings.cached_prompt_tokens(messages), prompt_tokens)}}
+        tool_call = self._tool_call(request)
+        if tool_call is not None:
+            if request.get("stream"):
+                self._stream(request, [], usage, tool_call)
+            else:
+                self._send_json(200, self._completion(request, None, 10, usage, tool_call))
+            return
+        tokens = settings.answer_tokens_for(request.get("max_tokens"))
+        if request.get("stream"):
+            self._stream(request, tokens, usage)
+        else:
+            # Non-streamed answers arrive once fully generated
+            time.sleep(len(tokens) / settings.tokens_per_second)
+            self._send_json(200, self._completion(request, "".join(tokens).strip(), len(tokens), usage))
+
+    @staticmethod
+    def _tool_call(request: dict):
+        """Call to the first offered tool, unless a tool result is already there"""
+        tools = request.get("tools") or []
+        messages = request.get("messages") or []
+        if not tools or request.get("tool_choice") == "none" or (messages and messages[-1].get("role") == "tool"):
+            return None
+        function = tools[0]["function"]
+        properties = function.get("parameters", {}).get("properties", {})
+        arguments = {}
+        for name in function.get("parameters", {}).get("required", []):
+            schema = properties.get(name, {})
+            if schema.get("type") == "integer":
+                arguments[name] = 5
+            else:
+                arguments[name] = (schema.get("enum") or ["mock"])[0]
+        return {"id": f"call_{uuid.uuid4().hex[:12]}", "type": "function",
+                "function": {"name": function["name"], "arguments": json.dumps(arguments, ensure_ascii=False)}}
+
+    @staticmethod
+    def _usage(usage: dict, completion_tokens: int) -> dict:
+        return dict(usage, completion_tokens=completion_tokens,
+                    total_tokens=usage["prompt_tokens"] + completion_tokens)
+
+    def _completion(self, request: dict, content: str, completion_tokens: int, usage: dict,
+                    tool_call: dict = None) -> dict:
+        message = {"role": "assistant", "content": content}
+        if tool_call is not None:
+            message["tool_calls"] = [tool_call]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop" if tool_call is None else "tool_calls",
+                "message": message
+            }],
+            "usage": self._usage(usage, completion_tokens)
+        }
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _stream(self, request: dict, tokens: list, usage: dict, tool_call: dict = None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        base = {"id": completion_id, "object": "chat.completion.chunk",
+                "created": int(time.time()), "model": request.get("model", "mock")}
+        delay = 1 / self.settings.tokens_per_second
+        try:
+            # Azure starts with a prompt-filter chunk that has no choices
+            self._write_chunk(b"data: " + json.dumps(dict(base, choices=[])).encode() + b"\n\n")
+            for token in tokens:
+                chunk = dict(base, choices=[{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+                self._write_chunk(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                time.sleep(delay)
+            if tool_call is not None:
+                # Name first, arguments in a second piece, as the API streams them
+                head = dict(tool_call, index=0, function={"name": tool_call["function"]["name"], "arguments": ""})
+                for delta in ({"role": "assistant", "tool_calls": [head]},
+                              {"tool_calls": [{"index": 0, "function": {"arguments": tool_call["function"]["arguments"]}}]}):
+                    chunk = dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                    self._write_chunk(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            finish_reason = "stop" if tool_call is None else "tool_calls"
+            final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": finish_reason}])
+            self._write_chunk(b"data: " + json.dumps(final).encode() + b"\n\n")
+            if (request.get("stream_options") or {}).get("include_usage"):
+                # Like OpenAI: a separate last chunk with usage and no choices
+                usage_chunk = dict(base, choices=[], usage=self._usage(usage, len(tokens)))
+                self._write_chunk(b"data: " + json.dumps(usage_chunk).encode() + b"\n\n")
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_mock_server(host: str = "127.0.0.1", port: int = 8600, settings: MockSettings = None) -> ThreadingHTTPServer:
+    """Start the mock in a background thread (used by bench_chat.py)"""
+    handler = type("ConfiguredMockAzureHandler", (MockAzureHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="mock-azure", daemon=True).start()
+    return server
+
+
+def add_mock_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--latency-ms", type=float, default=600, help="Median time to first token")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Log-normal spread of the latency (0 = fixed)")
+    parser.add_argument("--tokens-per-second", type=float, default=60, help="Generation speed")
+    parser.add_argument("--answer-tokens", type=int, default=80, help="Tokens per answer")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing with 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of requests failing with 429")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with 429")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def settings_from_args(args) -> MockSettings:
+    return MockSettings(
+        latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        tokens_per_second=args.tokens_per_second, answer_tokens=args.answer_tokens,
+        error_rate=args.error_rate, throttle_rate=args.throttle_rate,
+        retry_after=args.retry_after, seed=args.seed
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = start_mock_server(args.host, args.port, settings_from_args(args))
+    print(f"Mock Azure OpenAI listening on http://{args.host}:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,130 @@
+"""
+Versioned delta protocol for the dashboard payload
+The server remembers what it last sent to each session and sends only the
+rows added or removed and the agent fields (KPIs, ...) changed since then;
+static/js/main.js keeps the last full state in sessionStorage and applies
+deltas in place. A browser that missed a version (its state doesn't match
+a delta's base_version) fetches a full payload from the sidecar
+(POST /payload, see resync), and later deltas build on that one
+"""
+import threading
+from collections import deque
+from typing import Dict, List
+
+from agent_store import ROW_ID_KEY
+
+
+class PayloadTracker:
+    """
+    Per-session record of the last payload version sent to the browser
+    Rows are immutable once appended, so only the ids of the rows sent are
+    kept (oldest first), and after the first full payload only rows newer
+    than the last sent id are decoded from the session's overlay.
+    Thread-safe: reruns build messages, the sidecar handles resyncs
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        self._row_ids: Dict[str, deque] = {}  # agent id -> ids of rows sent
+        self._fields: Dict[str, Dict] = {}    # agent id -> non-row fields
+        self._last_message = None
+        self._last_meta = None
+
+    def reset(self):
+        """Forget what was sent; the next message will be a full payload"""
+        with self._lock:
+            self._row_ids = {}
+            self._fields = {}
+            self._last_message = None
+            self._last_meta = None
+
+    def resync(self, session_data) -> Dict:
+        """
+        Full payload of the current data for a browser whose state is out of
+        sync; becomes the base of the next delta
+        """
+        with self._lock:
+            message = self._full_message(session_data.snapshot(), self._last_meta or {})
+            self._last_message = message
+            return message
+
+    def _remember_fields(self, agent: Dict):
+        self._fields[agent["id"]] = {k: v for k, v in agent.items() if k != "rows"}
+
+    def _full_message(self, agents: List[Dict], meta: Dict) -> Dict:
+        self.version += 1
+        self._row_ids = {
+            agent["id"]: deque(row[ROW_ID_KEY] for row in agent.get("rows", []))
+            for agent in agents
+        }
+        self._fields = {}
+        for agent in agents:
+            self._remember_fields(agent)
+        return {"type": "full", "version": self.version, "agents": agents, **meta}
+
+    def build_message(self, session_data, meta: Dict) -> Dict:
+        """
+        Build the next payload message for a session's agent data
+        (agent_store.SessionAgentData)
+        Returns the previous message unchanged if nothing changed, so the
+        rendered HTML is identical and the browser keeps the iframe as is
+        """
+        with self._lock:
+            return self._build_message(session_data, meta)
+
+    def _build_message(self, session_data, meta: Dict) -> Dict:
+        if self._last_message is None or session_data.store.agent_ids != list(self._row_ids):
+            message = self._full_message(session_data.snapshot(), meta)
+        else:
+            agents = session_data.snapshot({
+                agent_id: ids[-1] if ids else 0 for agent_id, ids in self._row_ids.items()
+            })
+            agent_deltas = {}
+            for agent in agents:
+                delta = self._agent_delta(agent)
+                if delta:
+                    agent_deltas[agent["id"]] = delta
+
+            if not agent_deltas and meta == self._last_meta:
+                return self._last_message
+
+            self.version += 1
+            message = {
+                "type": "delta",
+                "version": self.version,
+                "base_version": self.version - 1,
+                "agents": agent_deltas,
+                **meta
+            }
+
+        self._last_message = message
+        self._last_meta = meta
+        return message
+
+    def _agent_delta(self, agent: Dict) -> Dict:
+        """
+        Diff one agent against what was last sent (agent holds only rows
+        newer than the last sent one) and record it as sent
+        """
+        sent = self._row_ids[agent["id"]]
+        first_id = agent.pop("first_row_id", None)
+        removed = []
+        while sent and (first_id is None or sent[0] < first_id):
+            removed.append(sent.popleft())
+        added = agent.get("rows", [])
+        sent.extend(row[ROW_ID_KEY] for row in added)
+
+        prev_fields = self._fields.get(agent["id"], {})
+        fields = {k: v for k, v in agent.items() if k != "rows" and prev_fields.get(k) != v}
+        if fields:
+            self._remember_fields(agent)
+
+        delta = {}
+        if added:
+            delta["added"] = added
+        if removed:
+            delta["removed"] = removed
+        if fields:
+            delta["fields"] = fields
+        return delta
@@ -0,0 +1,272 @@
+"""
+Tokens-per-minute scheduler for Azure OpenAI calls
+Every upstream request reserves its estimated tokens in a shared 60 s
+ledger before it is sent, and the reservation is corrected with the
+actual usage from the response. Requests are admitted only while the
+ledger stays under a headroom fraction of the deployment's TPM/RPM quota,
+so traffic is smoothed instead of bursting into 429s. Waiting requests
+are admitted by priority, then by the least recent usage of their clinic
+(fairness), then in arrival order.
+
+The ledger is process-local by default; set DENTAL_IQ_RATE_LEDGER_FILE to
+share it between processes on one machine (file lock, POSIX only).
+"""
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+from chat_executor import CancelToken, ChatCancelled, ChatQueueTimeout
+
+try:
+    import fcntl
+except ImportError:  # Windows - cross-process ledger unavailable
+    fcntl = None
+
+# Deployment quota (0 = unlimited)
+TPM_LIMIT = int(os.getenv("AZURE_OPENAI_TPM_LIMIT", "0"))
+RPM_LIMIT = int(os.getenv("AZURE_OPENAI_RPM_LIMIT", "0"))
+# Fraction of the quota we allow ourselves to use
+QUOTA_HEADROOM = float(os.getenv("AZURE_OPENAI_QUOTA_HEADROOM", "0.9"))
+RATE_WAIT_TIMEOUT_SECONDS = float(os.getenv("AZURE_OPENAI_RATE_WAIT_SECONDS", "30"))
+LEDGER_FILE = os.getenv("DENTAL_IQ_RATE_LEDGER_FILE", "")
+
+WINDOW_SECONDS = 60.0
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+
+class RateLimitTimeout(ChatQueueTimeout):
+    """The quota did not free up before the request's deadline"""
+
+
+class _MemoryLedger:
+    """Reservations of the last minute in this process"""
+
+    def __init__(self):
+        self._entries: Dict[str, list] = {}
+
+    def usage(self, now: float):
+        cutoff = now - WINDOW_SECONDS
+        for entry_id in [k for k, v in self._entries.items() if v[0] < cutoff]:
+            del self._entries[entry_id]
+        return sum(v[1] for v in self._entries.values()), len(self._entries)
+
+    def oldest(self) -> Optional[float]:
+        return min((v[0] for v in self._entries.values()), default=None)
+
+    def add(self, entry_id: str, now: float, tokens: int):
+        self._entries[entry_id] = [now, tokens]
+
+    def update(self, entry_id: str, tokens: int):
+        if entry_id in self._entries:
+            self._entries[entry_id][1] = tokens
+
+    def remove(self, entry_id: str):
+        self._entries.pop(entry_id, None)
+
+
+class _FileLedger:
+    """Reservations of the last minute shared through a locked JSON file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._cached_oldest = None
+
+    def _locked(self, mutate):
+        with open(self.path, "a+") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                try:
+                    entries = json.loads(f.read() or "{}")
+                except json.JSONDecodeError:
+                    entries = {}
+                cutoff = time.time() - WINDOW_SECONDS
+                entries = {k: v for k, v in entries.items() if v[0] >= cutoff}
+                result = mutate(entries)
+                f.seek(0)
+                f.truncate()
+                f.write(json.dumps(entries))
+                f.flush()
+                self._cached_oldest = min((v[0] for v in entries.values()), default=None)
+                return result
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def usage(self, now: float):
+        return self._locked(lambda e: (sum(v[1] for v in e.values()), len(e)))
+
+    def oldest(self) -> Optional[float]:
+        return self._cached_oldest
+
+    def add(self, entry_id: str, now: float, tokens: int):
+        self._locked(lambda e: e.__setitem__(entry_id, [now, tokens]))
+
+    def update(self, entry_id: str, tokens: int):
+        def mutate(entries):
+            if entry_id in entries:
+                entries[entry_id][1] = tokens
+        self._locked(mutate)
+
+    def remove(self, entry_id: str):
+        self._locked(lambda e: e.pop(entry_id, None))
+
+
+class Reservation:
+    """Tokens reserved for one request; reconcile with the actual usage"""
+
+    def __init__(self, scheduler: "RateScheduler", entry_id: str, tokens: int, client_id: str):
+        self.scheduler = scheduler
+        self.entry_id = entry_id
+        self.tokens = tokens
+        self.client_id = client_id
+
+    def reconcile(self, actual_tokens: Optional[int]):
+        if actual_tokens is not None and actual_tokens != self.tokens:
+            self.scheduler._reconcile(self, actual_tokens)
+
+    def release(self):
+        """Drop the reservation entirely (the request never reached the server)"""
+        self.scheduler._release(self)
+
+
+class RateScheduler:
+    """Admits upstream requests within the TPM/RPM quota"""
+
+    def __init__(self, tpm_limit: int = TPM_LIMIT, rpm_limit: int = RPM_LIMIT,
+                 headroom: float = QUOTA_HEADROOM, ledger_file: str = LEDGER_FILE):
+        self.tpm_budget = int(tpm_limit * headroom)
+        self.rpm_budget = max(int(rpm_limit * headroom), 1) if rpm_limit else 0
+        self._ledger = _FileLedger(ledger_file) if ledger_file and fcntl else _MemoryLedger()
+        self._shared = isinstance(self._ledger, _FileLedger)
+        self._condition = threading.Condition()
+        self._waiting = {}
+        self._tickets = itertools.count()
+        # Tokens per clinic over the last window, for fairness between clinics
+        self._clinic_usage = defaultdict(deque)
+        self._paused_until = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.tpm_budget or self.rpm_budget)
+
+    def _clinic_recent(self, client_id: str, now: float) -> int:
+        usage = self._clinic_usage[client_id]
+        while usage and usage[0][0] < now - WINDOW_SECONDS:
+            usage.popleft()
+        return sum(tokens for _, tokens in usage)
+
+    def _fits(self, tokens: int, now: float) -> bool:
+        if now < self._paused_until:
+            return False
+        used_tokens, used_requests = self._ledger.usage(time.time())
+        if self.tpm_budget and used_tokens > 0 and used_tokens + tokens > self.tpm_budget:
+            return False
+        if self.rpm_budget and used_requests + 1 > self.rpm_budget:
+            return False
+        return True
+
+    def _is_next(self, ticket: int, now: float) -> bool:
+        """Highest priority, least-served clinic, oldest ticket goes first"""
+        best = min(
+            self._waiting.items(),
+            key=lambda item: (item[1][0], self._clinic_recent(item[1][1], now), item[0])
+        )[0]
+        return best == ticket
+
+    def acquire(self, tokens: int, client_id: str = None, priority: int = PRIORITY_INTERACTIVE,
+                timeout: float = RATE_WAIT_TIMEOUT_SECONDS,
+                cancel: CancelToken = None) -> Optional[Reservation]:
+        """
+        Wait until `tokens` fit into the quota and reserve them
+        Returns None when no quota is configured; raises RateLimitTimeout,
+        or ChatCancelled as soon as `cancel` fires while waiting
+        """
+        if not self.enabled:
+            return None
+        client_id = client_id or ""
+        deadline = time.monotonic() + timeout
+
+        def wake():
+            with self._condition:
+                self._condition.notify_all()
+
+        if cancel is not None:
+            cancel.add_callback(wake)
+        with self._condition:
+            ticket = next(self._tickets)
+            self._waiting[ticket] = (priority, client_id)
+            try:
+                while True:
+                    if cancel is not None:
+                        cancel.check()
+                    now = time.monotonic()
+                    if self._is_next(ticket, now) and self._fits(tokens, now):
+                        break
+                    if now >= deadline:
+                        raise RateLimitTimeout()
+                    self._condition.wait(self._wait_time(now, deadline))
+                entry_id = uuid.uuid4().hex
+                self._ledger.add(entry_id, time.time(), tokens)
+                self._clinic_usage[client_id].append((now, tokens))
+            finally:
+                del self._waiting[ticket]
+                # The next waiter may fit now
+                self._condition.notify_all()
+                if cancel is not None:
+                    cancel.remove_callback(wake)
+        return Reservation(self, entry_id, tokens, client_id)
+
+    def _wait_time(self, now: float, deadline: float) -> float:
+        wait = deadline - now
+        if self._paused_until > now:
+            wait = min(wait, self._paused_until - now)
+        oldest = self._ledger.oldest()
+        if oldest is not None:
+            # The oldest reservation leaves the window then
+            wait = min(wait, max(oldest + WINDOW_SECONDS - time.time(), 0.01))
+        if self._shared:
+            # Other processes don't notify us
+            wait = min(wait, 0.25)
+        return max(wait, 0.01)
+
+    def _reconcile(self, reservation: Reservation, actual_tokens: int):
+        with self._condition:
+            self._ledger.update(reservation.entry_id, actual_tokens)
+            usage = self._clinic_usage[reservation.client_id]
+            usage.append((time.monotonic(), actual_tokens - reservation.tokens))
+            reservation.tokens = actual_tokens
+            self._condition.notify_all()
+
+    def _release(self, reservation: Reservation):
+        with self._condition:
+            self._ledger.remove(reservation.entry_id)
+            usage = self._clinic_usage[reservation.client_id]
+            usage.append((time.monotonic(), -reservation.tokens))
+            reservation.tokens = 0
+            self._condition.notify_all()
+
+    def pause(self, seconds: float):
+        """Hold all admissions (Azure answered 429 with Retry-After)"""
+        with self._condition:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+_scheduler: Optional[RateScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_rate_scheduler() -> RateScheduler:
+    """Process-wide scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = RateScheduler()
+    return _scheduler
@@ -0,0 +1,290 @@
+"""
+Resilience for Azure OpenAI calls
+- retries of transient errors and 429s with jittered exponential backoff
+  that honours Retry-After
+- optional hedging: a second identical request is sent when the first is
+  slower than the observed p95 latency, and the first answer wins
+- a circuit breaker that fails fast while Azure is degraded, so callers
+  can answer from cache or locally instead of waiting for timeouts
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+import openai
+
+from chat_executor import CancelToken, ChatCancelled
+from metrics import get_metrics
+
+MAX_ATTEMPTS = int(os.getenv("AZURE_OPENAI_MAX_RETRIES", "3")) + 1
+RETRY_BASE_SECONDS = float(os.getenv("AZURE_OPENAI_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("AZURE_OPENAI_RETRY_MAX_SECONDS", "8"))
+
+# Off by default: a non-streamed request cannot be aborted once sent, so the
+# losing request of a race still runs to completion, is billed for its
+# tokens and holds its quota reservation until then, outside the chat
+# executor's concurrency limit. Only not-yet-started losers are cancelled.
+HEDGING_ENABLED = os.getenv("AZURE_OPENAI_HEDGING", "0") == "1"
+# Extra (hedge) requests in flight at once, losers still running included
+HEDGE_MAX_INFLIGHT = int(os.getenv("AZURE_OPENAI_HEDGE_MAX_INFLIGHT", "2"))
+# Hedge no earlier than this, even when p95 is lower
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("AZURE_OPENAI_HEDGE_MIN_SECONDS", "1.0"))
+# Samples needed before p95 is trusted
+HEDGE_MIN_SAMPLES = 20
+
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("AZURE_OPENAI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("AZURE_OPENAI_BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """Azure is considered down; the call was not attempted"""
+
+
+def is_transient(error: Exception) -> bool:
+    """Errors worth retrying (timeouts, connection problems, 429 and 5xx)"""
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Server-requested wait from retry-after-ms / Retry-After headers"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """Full-jitter exponential backoff, never shorter than Retry-After"""
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+
+class LatencyTracker:
+    """Recent successful call latencies for the hedging delay"""
+
+    def __init__(self, size: int = 200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; after
+    `reset_seconds` one probe call is let through (half-open) and its
+    outcome closes or re-opens the circuit
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_seconds or self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._probing = False
+
+    def release_probe(self):
+        """The probe ended without a verdict (e.g. a 400) - let another one through"""
+        with self._lock:
+            self._probing = False
+
+
+class ResilientCaller:
+    """Runs upstream calls with retries, optional hedging and a circuit breaker"""
+
+    def __init__(self, hedging: bool = HEDGING_ENABLED):
+        self.hedging = hedging
+        self.breaker = CircuitBreaker()
+        self.latency = LatencyTracker()
+        # Only hedges run here; the slots keep the pool from ever queueing
+        self._hedge_pool = ThreadPoolExecutor(
+            HEDGE_MAX_INFLIGHT, thread_name_prefix="dental-iq-hedge"
+        ) if hedging else None
+        self._hedge_slots = threading.BoundedSemaphore(HEDGE_MAX_INFLIGHT)
+
+    def call(self, fn: Callable, hedge: bool = True, cancel: CancelToken = None):
+        """
+        Call fn() resiliently and return its result
+        Raises CircuitOpenError when failing fast, ChatCancelled when `cancel`
+        fires during a retry backoff, otherwise the last error
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError()
+        try:
+            result = self._call_with_retries(fn, hedge and self.hedging, cancel)
+        except Exception as e:
+            if is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _call_with_retries(self, fn: Callable, hedge: bool, cancel: Optional[CancelToken]):
+        for attempt in range(MAX_ATTEMPTS):
+            start = time.monotonic()
+            try:
+                result = self._call_hedged(fn) if hedge else fn()
+            except Exception as e:
+                if not is_transient(e) or attempt == MAX_ATTEMPTS - 1:
+                    raise
+                retry_after = retry_after_seconds(e)
+                if retry_after is not None and retry_after > RETRY_MAX_SECONDS:
+                    # Longer than we are willing to keep the user waiting
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise ChatCancelled()
+                continue
+            if hedge:
+                # Only hedge-eligible calls: stream opens and summaries have other latencies
+                self.latency.record(time.monotonic() - start)
+            return result
+
+    def _call_hedged(self, fn: Callable):
+        p95 = self.latency.percentile(95)
+        if p95 is None:
+            return fn()
+        delay = max(p95, HEDGE_MIN_DELAY_SECONDS)
+
+        first = _start_primary(fn)
+        done, _ = wait([first], timeout=delay)
+        if done:
+            return first.result()
+
+        # Slower than p95 - race a second request unless too many already run
+        if not self._hedge_slots.acquire(blocking=False):
+            get_metrics().inc("hedged_requests", result="skipped")
+            return first.result()
+        second = self._hedge_pool.submit(fn)
+        second.add_done_callback(lambda _: self._hedge_slots.release())
+        pending = {first, second}
+        error = None
+        try:
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        get_metrics().inc("hedged_requests", result="hedge" if future is second else "first")
+                        return future.result()
+                    error = future.exception()
+            raise error
+        finally:
+            for future in pending:
+                _discard_loser(future)
+
+
+def _start_primary(fn: Callable) -> Future:
+    """
+    Run the primary request of a hedged call on a thread of its own
+    The calling (executor worker) thread has to stay free to return the
+    hedge's answer, and a shared pool would cap hedge-enabled calls below
+    the executor's concurrency limit and count its queueing as latency
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name="dental-iq-hedge-primary", daemon=True).start()
+    return future
+
+
+def _discard_loser(future: Future):
+    """Cancel the losing request of a race, or close its result once it arrives"""
+    if future.cancel():
+        return
+
+    def close(done: Future):
+        if done.cancelled() or done.exception() is not None:
+            return
+        get_metrics().inc("hedge_losers_completed")
+        result = done.result()
+        close_result = getattr(result, "close", None)
+        if callable(close_result):
+            close_result()
+
+    future.add_done_callback(close)
+
+_caller: Optional[ResilientCaller] = None
+_caller_lock = threading.Lock()
+
+
+def get_resilient_caller() -> ResilientCaller:
+    """Process-wide caller (one breaker and latency history per process)"""
+    global _caller
+    if _caller is None:
+        with _caller_lock:
+            if _caller is None:
+                _caller = ResilientCaller()
+    return _caller
@@ -0,0 +1,113 @@
+"""
+Lexical retrieval over agent rows for the chat context
+A small BM25 index over all agent rows picks the rows relevant to the
+user's question instead of a fixed sample. Text is folded (lowercase,
+Czech diacritics removed) and lightly stemmed by prefix, so "pojištění",
+"pojistění" and "pojišťovna" meet on the same terms.
+"""
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Rows scoring below this fraction of the best row are not returned
+# (keeps generic matches like "pacient" from filling the result)
+MIN_RELATIVE_SCORE = 0.3
+
+# Tokens are cut to this many characters (crude stemming for Czech inflection)
+STEM_LENGTH = 5
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Frequent Czech function words that carry no meaning for matching (folded)
+STOPWORDS = frozenset((
+    "a", "i", "k", "o", "s", "v", "z", "u", "na", "do", "od", "po", "pro", "za", "se", "si",
+    "je", "jsou", "byl", "byla", "bylo", "ze", "ke", "ve", "to", "ten", "ta", "co", "jak",
+    "kdo", "kde", "kolik", "ktery", "ktera", "ktere", "mi", "me", "nam", "mam", "jsem",
+    "ma", "maji", "nebo", "ale", "jen", "uz", "jeste", "tak", "take", "prosim", "dnes",
+))
+
+
+def fold_text(text: str) -> str:
+    """Lowercase and strip diacritics ("Čeká" -> "ceka")"""
+    decomposed = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    """Folded, stemmed terms of a text without stopwords"""
+    return [
+        token[:STEM_LENGTH]
+        for token in _TOKEN_RE.findall(fold_text(text))
+        if token not in STOPWORDS and (len(token) > 1 or token.isdigit())
+    ]
+
+
+def row_text(row: Dict) -> str:
+    """Visible text of a row (internal "_" columns excluded)"""
+    return " ".join(str(v) for k, v in row.items() if v and not k.startswith("_"))
+
+
+class RowIndex:
+    """BM25 index over the rows of all agents"""
+
+    def __init__(self, agents_data: List[Dict]):
+        # Document = (agent position, row position)
+        self.documents: List[Tuple[int, int]] = []
+        self._lengths: List[int] = []
+        self._postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+
+        for agent_pos, agent in enumerate(agents_data):
+            # Agent name and role are part of every row, so "Isabella ..." favours her rows
+            agent_terms = tokenize(f"{agent.get('name', '')} {agent.get('role', '')}")
+            for row_pos, row in enumerate(agent.get("rows", [])):
+                terms = agent_terms + tokenize(row_text(row))
+                doc = len(self.documents)
+                self.documents.append((agent_pos, row_pos))
+                self._lengths.append(len(terms))
+                counts = defaultdict(int)
+                for term in terms:
+                    counts[term] += 1
+                for term, tf in counts.items():
+                    self._postings[term].append((doc, tf))
+
+        count = len(self.documents)
+        self._avg_length = sum(self._lengths) / count if count else 0.0
+        self._idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def search(self, query: str, limit: int = 20) -> List[Tuple[float, int, int]]:
+        """
+        Rank rows for a query
+        Returns up to `limit` (score, agent position, row position), best first;
+        rows sharing no term with the query are never returned
+        """
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = self._idf[term]
+            for doc, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self._lengths[doc] / self._avg_length
+                scores[doc] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+
+        if not scores:
+            return []
+        cutoff = max(scores.values()) * MIN_RELATIVE_SCORE
+        # Ties go to the newer row
+        ranked = sorted(
+            (item for item in scores.items() if item[1] >= cutoff),
+            key=lambda item: (-item[1], -item[0])
+        )[:limit]
+        return [(score, *self.documents[doc]) for doc, score in ranked]
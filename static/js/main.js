@@ -3,8 +3,103 @@
  * Handles all interactive functionality for the agent dashboard
  */
 
+/**
+ * Payload delta protocol
+ * The server sends a full payload once per session and afterwards only
+ * deltas (added/changed/removed rows, changed agent fields) against the
+ * version kept in sessionStorage. If the stored version doesn't match a
+ * delta's base, a full payload is fetched from the sidecar (POST /payload)
+ * and the next deltas build on it
+ */
+const APP_STATE_KEY = 'dental_iq_app_state';
+// Set when the stored state missed a version; resolved once the page is ready
+let payloadResyncPending = false;
+
+function loadCachedAppState() {
+  try {
+    const stored = sessionStorage.getItem(APP_STATE_KEY);
+    return stored ? JSON.parse(stored) : null;
+  } catch (e) {
+    return null;
+  }
+}
+
+function saveCachedAppState(state) {
+  try {
+    sessionStorage.setItem(APP_STATE_KEY, JSON.stringify(state));
+  } catch (e) {
+    console.error('Error caching app state:', e);
+  }
+}
+
+function applyAgentDelta(agent, delta) {
+  if (delta.removed && delta.removed.length) {
+    const removed = new Set(delta.removed);
+    agent.rows = agent.rows.filter(row => !removed.has(row._id));
+  }
+  if (delta.changed && delta.changed.length) {
+    const changed = new Map(delta.changed.map(row => [row._id, row]));
+    agent.rows = agent.rows.map(row => changed.get(row._id) || row);
+  }
+  if (delta.added && delta.added.length) {
+    agent.rows.push(...delta.added);
+  }
+  if (delta.fields) {
+    Object.assign(agent, delta.fields);
+  }
+}
+
+async function requestFullResync() {
+  if (!appData.session_token || (appData.app_server && appData.app_server.running === false)) {
+    console.error('Payload resync unavailable: app server not running');
+    return;
+  }
+  try {
+    const response = await fetch(resolveAppServerUrl('/payload'), {
+      method: 'POST',
+      headers: { 'Authorization': 'Bearer ' + appData.session_token }
+    });
+    if (!response.ok) throw new Error('HTTP ' + response.status);
+    const { type, version, base_version, agents, ...meta } = await response.json();
+    saveCachedAppState({ version, agents, ...meta });
+    appData.agents = agents;
+    placeAgents();
+  } catch (e) {
+    console.error('Error fetching full payload:', e);
+  }
+}
+
+function resolveAppData(message) {
+  if (!message) return null;
+  const { type, version, base_version, agents, ...meta } = message;
+  
+  if (type === 'full') {
+    const state = { version, agents, ...meta };
+    saveCachedAppState(state);
+    return state;
+  }
+  
+  const cached = loadCachedAppState();
+  if (cached && cached.version === version) {
+    // Same message rendered again - already applied
+    return { ...cached, ...meta };
+  }
+  if (!cached || cached.version !== base_version) {
+    console.warn('Payload version mismatch, fetching full payload');
+    payloadResyncPending = true;
+    return { agents: cached ? cached.agents : [], ...meta };
+  }
+  
+  cached.agents.forEach(agent => {
+    if (agents[agent.id]) applyAgentDelta(agent, agents[agent.id]);
+  });
+  const state = { ...cached, ...meta, version };
+  saveCachedAppState(state);
+  return state;
+}
+
 // Global state
-const appData = window.APP_DATA || { agents: [], simulate_active: false, selected_agent: "", user_info: {} };
+const appData = resolveAppData(window.APP_DATA) || { agents: [], simulate_active: false, selected_agent: "", user_info: {} };
 
 // Define handleLogout globally IMMEDIATELY (before DOMContentLoaded)
 // This ensures it's available when onclick handlers are evaluated
@@ -56,6 +151,8 @@ let selectedAgentId = null;
 let simulateActive = appData.simulate_active;
 let selectedSimAgent = appData.selected_agent || "";
 let isTyping = false;
+// Aborts the chat request in flight (superseded by a new message or chat closed)
+let chatAbortController = null;
 let miniKpiPopups = [];
 let kpiPopupsVisible = false;
 
@@ -66,6 +163,31 @@ const ROLE_AGENT_ACCESS = {
   'admin': ['isabella', 'leo', 'gabriel', 'nora', 'auditor']
 };
 
+/**
+ * Resolve a URL served by the sidecar app server (hashed avatars etc.)
+ * Absolute and data URLs are returned unchanged
+ */
+function resolveAppServerUrl(path) {
+  if (!path || !path.startsWith('/')) return path;
+  const server = appData.app_server || {};
+  if (server.url) return server.url + path;
+  
+  // Same host as the Streamlit page (use top window when embedded in iframe)
+  let loc = window.location;
+  try {
+    if (window.top && window.top !== window) {
+      loc = window.top.location;
+    }
+  } catch (e) {
+    // Cross-origin iframe, use current window
+  }
+  return `${loc.protocol}//${loc.hostname}:${server.port}${path}`;
+}
+
+function isImageAvatar(avatar) {
+  return !!avatar && (avatar.startsWith('data:image') || avatar.startsWith('/') || avatar.startsWith('http'));
+}
+
 function canUserSeeAgent(agentId) {
   const userJobRole = appData.user_info?.job_role || 'admin';
   const allowedAgents = ROLE_AGENT_ACCESS[userJobRole] || ROLE_AGENT_ACCESS['admin'];
@@ -120,11 +242,12 @@ function placeAgents() {
     div.style.left = (pos.x - 60) + 'px'; // 60 = half of 120px width
     div.style.top = (pos.y - 60) + 'px'; // 60 = half of 120px height
     
-    // Render avatar properly - check if it's a data URL (image) or emoji
+    // Render avatar properly - check if it's an image URL or emoji
     let avatarHtml = '';
-    if (agent.avatar && agent.avatar.startsWith('data:image')) {
-      // It's a base64 image - render as img tag
-      avatarHtml = `<img src="${agent.avatar}" style="width:100%;height:100%;object-fit:cover;border-radius:50%;" alt="${agent.name}">`;
+    if (isImageAvatar(agent.avatar)) {
+      // It's a hashed asset URL or base64 image - render as img tag
+      const srcset = agent.avatar_2x ? ` srcset="${resolveAppServerUrl(agent.avatar)} 1x, ${resolveAppServerUrl(agent.avatar_2x)} 2x"` : '';
+      avatarHtml = `<img src="${resolveAppServerUrl(agent.avatar)}"${srcset} style="width:100%;height:100%;object-fit:cover;border-radius:50%;" alt="${agent.name}">`;
     } else {
       // It's an emoji or text - render as div
       avatarHtml = `<div style="font-size:44px;display:flex;align-items:center;justify-content:center;width:100%;height:100%;">${agent.avatar || '👤'}</div>`;
@@ -284,49 +407,25 @@ function handleOutsideClick(e) {
 
 /**
  * Get rows that need attention (for simulation mode)
+ * Rows are classified on the server; agent.attention_ids indexes them
  */
+function findRowById(rows, rowId) {
+  // Rows are ordered by their monotonically increasing _id
+  let lo = 0;
+  let hi = rows.length - 1;
+  while (lo <= hi) {
+    const mid = (lo + hi) >> 1;
+    const midId = rows[mid]._id;
+    if (midId === rowId) return rows[mid];
+    if (midId < rowId) lo = mid + 1;
+    else hi = mid - 1;
+  }
+  return null;
+}
+
 function getRowsNeedingAttention(agent) {
-  if (!agent.rows || agent.rows.length === 0) return [];
-  
-  // Filter rows that need attention based on status/result
-  const attentionIndicators = [
-    '⚠️', '⏳', '📞', 
-    'Chybí', 'Nalezeno', 'Problém', 'Neodpovězený',
-    'Přepojeno', 'Čeká', 'Vyžaduje', 'Nesoulad',
-    'Chybějící', 'Neúplná', 'Duplicitní'
-  ];
-  
-  return agent.rows.filter(row => {
-    const values = Object.values(row).join(' ').toLowerCase();
-    const lowerIndicators = attentionIndicators.map(i => i.toLowerCase());
-    
-    // Check if any indicator is in the row values
-    const hasIndicator = lowerIndicators.some(indicator => 
-      values.includes(indicator)
-    );
-    
-    // Also check specific fields for each agent type
-    if (agent.id === 'isabella') {
-      const result = row['Výsledek'] || '';
-      return hasIndicator || result.includes('⏳') || result.includes('📞') || result.includes('Čeká');
-    } else if (agent.id === 'gabriel') {
-      const comment = row['Komentář'] || '';
-      const found = row['Zjištěno'] || '';
-      return hasIndicator || comment.includes('⚠️') || found === 'Ano';
-    } else if (agent.id === 'leo') {
-      const status = row['Status'] || '';
-      return hasIndicator || status.includes('⚠️') || status.includes('⏳') || status.includes('Chybí');
-    } else if (agent.id === 'auditor') {
-      // All auditor rows need attention
-      return true;
-    } else if (agent.id === 'nora') {
-      // Nora rows typically don't need attention, but check anyway
-      const summary = row['Shrnutí'] || '';
-      return hasIndicator || summary.includes('Drobné') || summary.includes('Nutná');
-    }
-    
-    return hasIndicator;
-  });
+  if (!agent.rows || agent.rows.length === 0 || !agent.attention_ids) return [];
+  return agent.attention_ids.map(rowId => findRowById(agent.rows, rowId)).filter(row => row);
 }
 
 /**
@@ -400,8 +499,8 @@ function formatAttentionItem(row, agentId, idx) {
   } else {
     // Fallback: try to find patient name in any field
     patientName = row['Pacient'] || row['Odesílatel'] || row['Soubor'] || '';
-    const keys = Object.keys(row);
-    const values = Object.values(row);
+    const keys = Object.keys(row).filter(key => !key.startsWith('_'));
+    const values = keys.map(key => row[key]);
     context = keys.map((key, i) => {
       if (key === 'Link' || key === 'Čas' || key === 'Velikost' || key === 'Archiv' || key === 'Popis problému' || key === 'Pacient' || key === 'Odesílatel' || key === 'Soubor') {
         return '';
@@ -459,7 +558,7 @@ function showModal(agent, isSimulated = false) {
   } else {
     // Non-simulation mode: Show table as before (exclude "Popis problému" from table display)
     if (agent.rows && agent.rows.length > 0) {
-      const headers = Object.keys(agent.rows[0]).filter(h => h !== 'Popis problému');
+      const headers = Object.keys(agent.rows[0]).filter(h => h !== 'Popis problému' && !h.startsWith('_'));
       const headerRow = '<tr>' + headers.map(h => '<th>' + h + '</th>').join('') + '</tr>';
       const bodyRows = agent.rows.map(r => {
         const values = headers.map(h => r[h] || '');
@@ -629,7 +728,30 @@ function hideMiniKpis() {
  * Toggle chat window
  */
 function toggleChat() {
-  document.getElementById('chatBox').classList.toggle('show');
+  const chatBox = document.getElementById('chatBox');
+  chatBox.classList.toggle('show');
+  if (!chatBox.classList.contains('show') && chatAbortController) {
+    // Closing the chat - stop generating the answer on the server as well
+    abortChatRequest();
+    fetch(resolveAppServerUrl('/chat/cancel'), {
+      method: 'POST',
+      headers: { 'Authorization': 'Bearer ' + appData.session_token },
+      keepalive: true
+    }).catch(() => {});
+  }
+}
+
+/**
+ * Abort the chat request in flight and drop its typing indicator
+ * (a new request cancels the previous one on the server by itself)
+ */
+function abortChatRequest() {
+  if (!chatAbortController) return;
+  chatAbortController.abort();
+  chatAbortController = null;
+  isTyping = false;
+  const typingIndicator = document.getElementById('typingIndicator');
+  if (typingIndicator) typingIndicator.remove();
 }
 
 /**
@@ -638,7 +760,9 @@ function toggleChat() {
 async function sendChat() {
   const input = document.getElementById('chatInput');
   const sendBtn = document.getElementById('chatSendBtn');
-  if (!input.value.trim() || isTyping) return;
+  if (!input.value.trim()) return;
+  // A new message supersedes the answer still being generated
+  abortChatRequest();
   
   // Animate button
   if (sendBtn) {
@@ -653,109 +777,164 @@ async function sendChat() {
   renderChat();
   input.value = '';
   
+  if (appData.app_server && appData.app_server.running === false) {
+    // Chat is answered only by the app server - say so instead of waiting
+    chatMessages.push({
+      who: 'bot',
+      text: 'Chat je teď nedostupný: chatovací server se nepodařilo spustit. Obnovte stránku, případně kontaktujte správce.'
+    });
+    renderChat();
+    return;
+  }
+  
   // Show typing indicator
   isTyping = true;
   showTypingIndicator();
   
+  const controller = new AbortController();
+  chatAbortController = controller;
+  
+  // Stream the answer through the app server, fall back to a single JSON reply
+  if (!(await streamChat(userMessage, controller.signal)) && !controller.signal.aborted) {
+    await callChatAPI(userMessage, controller.signal);
+  }
+  if (chatAbortController === controller) chatAbortController = null;
+}
+
+/**
+ * Stream a chat answer from the app server (NDJSON events)
+ * Returns false if streaming is unavailable so the caller can fall back
+ */
+async function streamChat(userMessage, signal) {
+  if (!appData.session_token) return false;
+  let botMessage = null;
+  let cancelled = false;
+  let streamError = null;
   try {
-    // Send message to Streamlit backend via postMessage
-    if (window.parent && window.parent !== window) {
-      // We're in an iframe (Streamlit component)
-      window.parent.postMessage({
-        type: 'streamlit:setComponentValue',
-        value: JSON.stringify({
-          action: 'chat',
-          message: userMessage,
-          agents_data: appData.agents,
-          chat_history: chatMessages
-        })
-      }, '*');
-      
-      // Poll for response (Streamlit will rerun and we can check for response)
-      let pollCount = 0;
-      const maxPolls = 40; // 20 seconds max
-      
-      const pollInterval = setInterval(() => {
-        pollCount++;
-        
-        // Try to get response from parent (this is a simplified approach)
-        // In production, you'd use proper Streamlit component return values
-        if (pollCount >= maxPolls) {
-          clearInterval(pollInterval);
-          isTyping = false;
-          chatMessages.push({ 
-            who: 'bot', 
-            text: 'Omlouvám se, odpověď trvá příliš dlouho. Zkontrolujte prosím konfiguraci Azure OpenAI.' 
-          });
+    const response = await fetch(resolveAppServerUrl('/chat/stream'), {
+      method: 'POST',
+      headers: {
+        'Authorization': 'Bearer ' + appData.session_token,
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ message: userMessage }),
+      signal
+    });
+    if (!response.ok || !response.body) return false;
+    
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    const handleEvent = (event) => {
+      if (event.error) {
+        // The answer failed (possibly part-way) - shown apart from any partial text
+        streamError = event.error;
+        return;
+      }
+      if (event.cancelled) {
+        // Superseded on the server (e.g. a message from another tab)
+        cancelled = true;
+        return;
+      }
+      if (!botMessage) {
+        // First token - replace the typing indicator with the answer bubble
+        botMessage = { who: 'bot', text: '' };
+        chatMessages.push(botMessage);
+        renderChat();
+      }
+      if (event.delta) {
+        botMessage.text += event.delta;
+      } else if (event.done) {
+        botMessage.text = event.response;
+        if (event.cached) {
+          botMessage.cached = true;
           renderChat();
+          return;
         }
-      }, 500);
-      
-      // For now, use a direct API approach via a hidden endpoint
-      // This is a workaround until proper Streamlit component communication is set up
-      callChatAPI(userMessage, pollInterval);
-    } else {
-      // Direct call if not in iframe
-      callChatAPI(userMessage);
+      }
+      updateLastChatBubble(botMessage.text);
+    };
+    
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop();
+      lines.filter(line => line.trim()).forEach(line => handleEvent(JSON.parse(line)));
     }
-  } catch (error) {
+    if (buffer.trim()) handleEvent(JSON.parse(buffer));
+    
     isTyping = false;
-    chatMessages.push({ 
-      who: 'bot', 
-      text: 'Omlouvám se, došlo k chybě při komunikaci s AI. Zkuste to prosím znovu.' 
-    });
-    renderChat();
-    console.error('Chat error:', error);
+    if (cancelled) {
+      renderChat();
+      return true;
+    }
+    if (streamError) {
+      chatMessages.push({ who: 'bot', text: streamError });
+      renderChat();
+      return true;
+    }
+    if (!botMessage) return false;
+    return true;
+  } catch (error) {
+    // Superseded or chat closed - keep whatever was shown, no fallback
+    if (signal && signal.aborted) return true;
+    console.error('Chat stream error:', error);
+    if (botMessage) {
+      // Part of the answer is already shown - keep it and stop
+      isTyping = false;
+      return true;
+    }
+    return false;
   }
 }
 
 /**
- * Call chat API directly
+ * Update the text of the last chat bubble without re-rendering the chat
  */
-async function callChatAPI(userMessage, pollInterval = null) {
+function updateLastChatBubble(text) {
+  const body = document.getElementById('chatBody');
+  const bubbles = body.querySelectorAll(':scope > div > div');
+  const last = bubbles[bubbles.length - 1];
+  if (last) last.innerHTML = text;
+  body.scrollTop = body.scrollHeight;
+}
+
+/**
+ * Call the app server chat endpoint (JSON in, JSON out)
+ */
+async function callChatAPI(userMessage, signal) {
   try {
-    // Create a form data approach for Streamlit
-    // Since Streamlit components run in iframes, we need to communicate via parent
-    const formData = new FormData();
-    formData.append('message', userMessage);
-    formData.append('agents_data', JSON.stringify(appData.agents));
-    formData.append('chat_history', JSON.stringify(chatMessages));
-    
-    // Use fetch to call a Streamlit endpoint
-    // Note: This requires a custom Streamlit endpoint or using query params
-    const response = await fetch(window.location.href + '?chat_message=' + encodeURIComponent(userMessage), {
-      method: 'GET',
+    const response = await fetch(resolveAppServerUrl('/chat'), {
+      method: 'POST',
       headers: {
-        'Accept': 'application/json'
-      }
+        'Authorization': 'Bearer ' + appData.session_token,
+        'Content-Type': 'application/json'
+      },
+      body: JSON.stringify({ message: userMessage }),
+      signal
     });
-    
-    // Parse response if it's JSON
-    const text = await response.text();
-    let data;
-    try {
-      data = JSON.parse(text);
-    } catch {
-      // If not JSON, it might be HTML (Streamlit page)
-      // In this case, we'll need to extract data differently
-      // For now, show a message about configuration
-      throw new Error('Response is not JSON - check Azure OpenAI configuration');
-    }
-    
-    if (data && data.response) {
-      if (pollInterval) clearInterval(pollInterval);
+    const data = await response.json();
+    if (data.cancelled) {
       isTyping = false;
-      chatMessages.push({ who: 'bot', text: data.response });
       renderChat();
-    } else {
-      throw new Error('No response in data');
+      return;
+    }
+    
+    if (!response.ok || !data.response) {
+      throw new Error(data.error || ('HTTP ' + response.status));
     }
+    isTyping = false;
+    chatMessages.push({ who: 'bot', text: data.response, cached: !!data.cached });
+    renderChat();
   } catch (error) {
-    if (pollInterval) clearInterval(pollInterval);
+    if (signal && signal.aborted) return;
     isTyping = false;
     chatMessages.push({ 
       who: 'bot', 
-      text: 'Omlouvám se, došlo k chybě při komunikaci s AI. Zkontrolujte prosím konfiguraci Azure OpenAI (AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY).' 
+      text: 'Omlouvám se, došlo k chybě při komunikaci s AI. Zkuste to prosím znovu.' 
     });
     renderChat();
     console.error('Chat API error:', error);
@@ -788,7 +967,9 @@ function renderChat() {
   body.innerHTML = chatMessages.map(m => 
     '<div style="margin-bottom:8px"><div style="display:inline-block;padding:10px;border-radius:12px;max-width:80%;background:' +
     (m.who === 'user' ? 'linear-gradient(135deg,#7dd1fc,#c0ebff)' : 'linear-gradient(135deg,#e0f8ff,#fff)') +
-    '">' + m.text + '</div></div>'
+    '">' + m.text + '</div>' +
+    (m.cached ? '<div class="chat-cached-badge" title="Odpověď z mezipaměti">⚡ z mezipaměti</div>' : '') +
+    '</div>'
   ).join('');
   
   body.scrollTop = body.scrollHeight;
@@ -1870,16 +2051,16 @@ function generateNoraSummary(patientId, patientName) {
 
 // Session persistence functions
 function saveSessionToStorage() {
-  if (appData.user_info && appData.session_token) {
+  if (appData.user_info && appData.restore_token) {
     try {
       const sessionData = {
         user_id: appData.user_info.user_id,
         client_id: appData.user_info.client_id || 'client001',
-        token: appData.session_token,
+        token: appData.restore_token,
         timestamp: Date.now()
       };
       localStorage.setItem('dental_iq_session', JSON.stringify(sessionData));
-      localStorage.setItem('dental_iq_session_token', appData.session_token);
+      localStorage.setItem('dental_iq_session_token', appData.restore_token);
     } catch (e) {
       console.error('Error saving session to storage:', e);
     }
@@ -1889,11 +2070,15 @@ function saveSessionToStorage() {
 // Initialize on page load
 document.addEventListener('DOMContentLoaded', function() {
   // Save session to localStorage FIRST (before anything else)
-  if (appData.user_info && appData.user_info.user_id && appData.session_token) {
+  if (appData.user_info && appData.user_info.user_id && appData.restore_token) {
     saveSessionToStorage();
   }
   
   placeAgents();
+  if (payloadResyncPending) {
+    payloadResyncPending = false;
+    requestFullResync();
+  }
   
   // Set initial config content
   const contentDiv = document.getElementById('configContent');
@@ -0,0 +1,148 @@
+"""
+Token budget for chat prompts
+Estimates tokens per message and fits the system prompt, agent context and
+chat history into a fixed input budget so every request has a predictable
+prompt size. Parts are kept by priority:
+
+1. system prompt and the current user message (always sent)
+2. the most recent history exchange
+3. the summary of older turns (history_summary.py)
+4. agent context (trimmed from the end, line by line)
+5. older history (newest first)
+
+Messages are ordered from the most stable to the most volatile: system
+prompt, summary, history, then the agent context right before the
+question. Consecutive turns of a session thus share a long identical
+prefix that Azure serves from its prompt cache; the context, which is
+retrieved per question, is always part of the uncached tail.
+"""
+import logging
+import os
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger("dental_iq.token_budget")
+
+# Input tokens per request (system prompt + context + history + question)
+INPUT_TOKEN_BUDGET = int(os.getenv("AZURE_OPENAI_INPUT_TOKEN_BUDGET", "3000"))
+
+# History messages considered at all (older ones are never sent)
+HISTORY_MAX_MESSAGES = 10
+
+# Chat format overhead per message (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Messages of the latest exchange kept ahead of the agent context
+RECENT_HISTORY_MESSAGES = 2
+
+CONTEXT_PREFIX = "Kontext z agentů:\n"
+CONTEXT_SUFFIX = "\n\nPoužij tyto informace k zodpovězení dotazů uživatele."
+SUMMARY_PREFIX = "Shrnutí dřívější konverzace:\n"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for mixed Czech/English)"""
+    return len(text) // 4 + 1 if text else 0
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+def history_to_messages(chat_history: List[Dict]) -> List[Dict]:
+    """Convert UI chat history ({"who", "text"}) into chat messages"""
+    messages = []
+    for msg in chat_history or []:
+        if msg.get("who") == "user":
+            messages.append({"role": "user", "content": msg.get("text", "")})
+        elif msg.get("who") == "bot":
+            messages.append({"role": "assistant", "content": msg.get("text", "")})
+    return messages
+
+
+def _trim_context(context: str, budget: int) -> Tuple[str, int]:
+    """Drop context lines from the end until it fits; returns (text, dropped lines)"""
+    lines = context.split("\n")
+    fixed = estimate_tokens(CONTEXT_PREFIX + CONTEXT_SUFFIX) + MESSAGE_OVERHEAD_TOKENS
+    kept, used = [], fixed
+    for line in lines:
+        cost = estimate_tokens(line) + 1
+        if used + cost > budget:
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept), len(lines) - len(kept)
+
+
+def fit_prompt(system_prompt: str, context: str, chat_history: List[Dict], user_message: str,
+               budget: int = None, history_summary: str = "") -> List[Dict]:
+    """
+    Build the message list for a request within the input token budget
+
+    Args:
+        system_prompt: Assistant instructions (always kept)
+        context: Agent context text (trimmed if needed)
+        chat_history: UI chat history, oldest first
+        user_message: Current question (always kept)
+        budget: Input token budget (default INPUT_TOKEN_BUDGET)
+        history_summary: Summary of turns no longer in chat_history
+
+    Returns:
+        Messages in the order expected by the chat completions API
+    """
+    budget = INPUT_TOKEN_BUDGET if budget is None else budget
+    system_message = {"role": "system", "content": system_prompt}
+    user = {"role": "user", "content": user_message}
+    remaining = budget - message_tokens(system_message) - message_tokens(user)
+
+    history = history_to_messages(chat_history)[-HISTORY_MAX_MESSAGES:]
+    history_costs = [message_tokens(m) for m in history]
+
+    # Newest history first; the latest exchange outranks the context
+    keep_from = len(history)
+    for i in range(len(history) - 1, max(len(history) - RECENT_HISTORY_MESSAGES, 0) - 1, -1):
+        if history_costs[i] > remaining:
+            break
+        remaining -= history_costs[i]
+        keep_from = i
+
+    summary_message = None
+    if history_summary:
+        summary_message = {"role": "system", "content": SUMMARY_PREFIX + history_summary}
+        if message_tokens(summary_message) <= remaining:
+            remaining -= message_tokens(summary_message)
+        else:
+            summary_message = None
+
+    context_text, dropped_lines = "", 0
+    if context:
+        context_text, dropped_lines = _trim_context(context, remaining)
+        if context_text.strip():
+            remaining -= estimate_tokens(CONTEXT_PREFIX + context_text + CONTEXT_SUFFIX) + MESSAGE_OVERHEAD_TOKENS
+        else:
+            context_text = ""
+
+    # Older history fills what is left, newest first, without gaps
+    if keep_from == len(history) - min(RECENT_HISTORY_MESSAGES, len(history)):
+        for i in range(keep_from - 1, -1, -1):
+            if history_costs[i] > remaining:
+                break
+            remaining -= history_costs[i]
+            keep_from = i
+
+    # Stable prefix first, volatile context last (see module docstring)
+    messages = [system_message]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(history[keep_from:])
+    if context_text:
+        messages.append({"role": "system", "content": CONTEXT_PREFIX + context_text + CONTEXT_SUFFIX})
+    messages.append(user)
+
+    logger.info(
+        "prompt tokens=%d budget=%d context=%d (dropped %d lines) summary=%d history=%d/%d messages",
+        budget - remaining, budget,
+        estimate_tokens(context_text), dropped_lines,
+        message_tokens(summary_message) if summary_message else 0,
+        len(history) - keep_from, len(history)
+    )
+    return messages
@@ -1,21 +1,19 @@
 """
 HTML and JavaScript template for the UI
+The static shell (CSS + JavaScript) is compiled and minified once and
+memoized; it is rebuilt only when static/js/main.js changes. Per rerun
+only the JSON payload is spliced in between the two compiled halves.
 """
 import os
-import base64
+import re
+import threading
+from typing import Optional, Tuple
 
-def get_html_template():
-    """Returns the complete HTML template with embedded JavaScript"""
-    
-    # Read JavaScript file and encode it
-    js_path = os.path.join(os.path.dirname(__file__), 'static', 'js', 'main.js')
-    js_content = ""
-    
-    if os.path.exists(js_path):
-        with open(js_path, 'r', encoding='utf-8') as f:
-            js_content = f.read()
-    
-    return '''
+JS_PATH = os.path.join(os.path.dirname(__file__), 'static', 'js', 'main.js')
+PAYLOAD_PLACEHOLDER = '__PAYLOAD__'
+MAIN_JS_PLACEHOLDER = '__MAIN_JS__'
+
+HTML_SHELL = '''
 <!DOCTYPE html>
 <html>
 <head>
@@ -652,6 +650,11 @@ body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Arial
 .chat-send-btn.animating {
   animation: sendPulse 0.6s ease;
 }
+.chat-cached-badge {
+  margin-top: 2px;
+  font-size: 11px;
+  color: #5b7a99;
+}
 .typing-indicator { 
   display: inline-flex;
   padding: 10px 15px;
@@ -1178,17 +1181,17 @@ window.APP_DATA = __PAYLOAD__;
   }
   
   // If user IS logged in, save session to localStorage for future reloads
-  if (appData.user_info && appData.user_info.user_id && appData.session_token) {
+  if (appData.user_info && appData.user_info.user_id && appData.restore_token) {
     console.log('User logged in, saving session to localStorage');
     try {
       const sessionData = {
         user_id: appData.user_info.user_id,
         client_id: appData.user_info.client_id || 'client001',
-        token: appData.session_token,
+        token: appData.restore_token,
         timestamp: Date.now()
       };
       localStorage.setItem('dental_iq_session', JSON.stringify(sessionData));
-      localStorage.setItem('dental_iq_session_token', appData.session_token);
+      localStorage.setItem('dental_iq_session_token', appData.restore_token);
       console.log('Session saved to localStorage');
     } catch (e) {
       console.error('Error saving session:', e);
@@ -1253,8 +1256,227 @@ window.APP_DATA = __PAYLOAD__;
 })();
 </script>
 <script>
-''' + js_content + '''
+__MAIN_JS__
 </script>
 </body>
 </html>
-'''
\ No newline at end of file
+'''
+
+# Comments and string literals are matched as whole tokens, so the contents
+# of strings (e.g. the inline SVG data URL) are never rewritten
+_CSS_TOKEN_RE = re.compile(r'(/\*.*?\*/)|("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')', re.S)
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCT_RE = re.compile(r'\s*([{};,>])\s*')
+_STYLE_RE = re.compile(r'(<style>)(.*?)(</style>)', re.S)
+_SCRIPT_RE = re.compile(r'(<script>)(.*?)(</script>)', re.S)
+
+_compiled: Optional[Tuple[tuple, str, str]] = None
+_compile_lock = threading.Lock()
+
+
+def _minify_css_code(code: str) -> str:
+    code = _CSS_SPACE_RE.sub(' ', code)
+    return _CSS_PUNCT_RE.sub(r'\1', code)
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and collapse whitespace outside of string literals"""
+    parts = []
+    pos = 0
+    for match in _CSS_TOKEN_RE.finditer(css):
+        parts.append(_minify_css_code(css[pos:match.start()]))
+        if match.group(2):
+            parts.append(match.group(2))
+        pos = match.end()
+    parts.append(_minify_css_code(css[pos:]))
+    return ''.join(parts).replace(';}', '}').strip()
+
+
+# A "/" after one of these starts a regex literal rather than a division
+_JS_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'new', 'delete',
+                      'void', 'throw', 'instanceof', 'yield', 'await'}
+_JS_LINE_SPACE_RE = re.compile(r'[ \t]*\n\s*')
+_JS_WORD_RE = re.compile(r'[A-Za-z_$][\w$]*$')
+
+
+def _skip_js_string(js: str, i: int) -> int:
+    """End of the quoted string starting at i"""
+    quote = js[i]
+    i += 1
+    while i < len(js) and js[i] != quote and js[i] != '\n':
+        i += 2 if js[i] == '\\' else 1
+    return i + 1
+
+
+def _skip_js_regex(js: str, i: int) -> int:
+    """End of the regex literal (flags included) starting at i"""
+    i += 1
+    in_class = False
+    while i < len(js) and js[i] != '\n':
+        c = js[i]
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            break
+        i += 1
+    while i < len(js) and (js[i].isalnum() or js[i] == '_'):
+        i += 1
+    return i
+
+
+def _js_tokens(js: str):
+    """
+    Split JavaScript into (is_code, text) pieces with comments removed
+    Strings, template literals and regex literals are returned as literal
+    pieces, so their contents are never rewritten; a block comment spanning
+    lines leaves a line break (automatic semicolon insertion)
+    """
+    code = []
+    templates = []  # open ${ } depth of each enclosing template literal
+    after_literal = False  # nothing but whitespace since the last literal
+    i = 0
+    n = len(js)
+
+    def flush():
+        if code:
+            yield True, ''.join(code)
+            code.clear()
+
+    def template_end(i: int) -> int:
+        """End of the template literal text from i (at "`" or "${")"""
+        while i < n:
+            if js[i] == '\\':
+                i += 2
+            elif js[i] == '`':
+                return i + 1
+            elif js.startswith('${', i):
+                templates.append(0)
+                return i + 2
+            else:
+                i += 1
+        return n
+
+    while i < n:
+        c = js[i]
+        if js.startswith('/*', i):
+            end = js.find('*/', i + 2)
+            end = n if end == -1 else end + 2
+            code.append('\n' if '\n' in js[i:end] else ' ')
+            i = end
+        elif js.startswith('//', i):
+            end = js.find('\n', i)
+            i = n if end == -1 else end
+        elif c in '"\'' or c == '`' or (c == '}' and templates and templates[-1] == 0):
+            if c == '}':
+                templates.pop()
+                end = template_end(i + 1)
+            elif c == '`':
+                end = template_end(i + 1)
+            else:
+                end = _skip_js_string(js, i)
+            yield from flush()
+            yield False, js[i:end]
+            after_literal = True
+            i = end
+        elif c == '/':
+            before = ''.join(code[-16:]).rstrip()
+            word = _JS_WORD_RE.search(before)
+            if (not before and not after_literal) or (before and before[-1] in _JS_REGEX_PRECEDERS) or (
+                    word and word.group() in _JS_REGEX_KEYWORDS):
+                end = _skip_js_regex(js, i)
+                yield from flush()
+                yield False, js[i:end]
+                after_literal = True
+                i = end
+            else:
+                code.append(c)
+                after_literal = False
+                i += 1
+        else:
+            if not c.isspace():
+                after_literal = False
+            if templates and c == '{':
+                templates[-1] += 1
+            elif templates and c == '}':
+                templates[-1] -= 1
+            code.append(c)
+            i += 1
+    yield from flush()
+
+
+def minify_js(js: str) -> str:
+    """
+    Conservative JavaScript minification
+    Drops comments, indentation and blank lines outside of string, template
+    and regex literals; line breaks are kept so automatic semicolon
+    insertion behaves exactly as before
+    """
+    parts = []
+    pending = []
+    for is_code, text in _js_tokens(js):
+        if is_code:
+            pending.append(text)
+            continue
+        parts.append(_JS_LINE_SPACE_RE.sub('\n', ''.join(pending)))
+        pending.clear()
+        parts.append(text)
+    parts.append(_JS_LINE_SPACE_RE.sub('\n', ''.join(pending)))
+    return ''.join(parts).strip()
+
+
+def _source_key() -> tuple:
+    """Cache key for the compiled shell: main.js mtime and size"""
+    try:
+        stat = os.stat(JS_PATH)
+        return (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        return (None, None)
+
+
+def compile_template() -> Tuple[str, str]:
+    """
+    Build (or reuse) the minified shell split around the payload placeholder
+    Returns (prefix, suffix)
+    """
+    global _compiled
+    key = _source_key()
+    compiled = _compiled
+    if compiled is not None and compiled[0] == key:
+        return compiled[1], compiled[2]
+
+    with _compile_lock:
+        if _compiled is not None and _compiled[0] == key:
+            return _compiled[1], _compiled[2]
+
+        js_content = ""
+        if os.path.exists(JS_PATH):
+            with open(JS_PATH, 'r', encoding='utf-8') as f:
+                js_content = f.read()
+
+        html = _STYLE_RE.sub(lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), HTML_SHELL)
+        html = _SCRIPT_RE.sub(lambda m: m.group(1) + minify_js(m.group(2)) + m.group(3), html)
+        # Inserted after minifying the shell so main.js is processed exactly once
+        html = html.replace(MAIN_JS_PLACEHOLDER, minify_js(js_content))
+
+        prefix, suffix = html.split(PAYLOAD_PLACEHOLDER, 1)
+        _compiled = (key, prefix, suffix)
+        return prefix, suffix
+
+
+def get_html_template():
+    """Returns the complete HTML template with embedded JavaScript"""
+    prefix, suffix = compile_template()
+    return prefix + PAYLOAD_PLACEHOLDER + suffix
+
+
+def render_html(payload_json: str) -> str:
+    """Returns the HTML document with the JSON payload spliced in"""
+    prefix, suffix = compile_template()
+    return ''.join((prefix, payload_json, suffix))
@@ -0,0 +1,118 @@
+"""
+Per-request usage of Azure OpenAI calls
+Records prompt, cached-prompt and completion tokens with the request
+latency, so the effect of provider-side prompt caching can be measured:
+requests whose prompt prefix was served from cache are compared against
+those that were not.
+"""
+import logging
+import threading
+from collections import deque
+from typing import Dict, Optional
+
+from metrics import METRIC_PREFIX, observe_tokens
+
+logger = logging.getLogger("dental_iq.usage")
+
+# Recent requests kept for the summary
+USAGE_HISTORY_SIZE = 1000
+
+# What the latency of each kind of record measures; latencies are only
+# compared (cache hit vs. miss) within one kind
+LATENCY_MEANING = {
+    "chat": "full response",
+    "stream": "time to first token",
+    "summary": "full response",
+}
+
+
+class UsageStats:
+    """Rolling record of recent request usage"""
+
+    def __init__(self, size: int = USAGE_HISTORY_SIZE):
+        self._records = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, prompt_tokens: int, cached_tokens: int,
+               completion_tokens: int, latency: float):
+        """
+        Args:
+            kind: "chat", "stream" (latency = time to first token) or "summary"
+            latency: Seconds until the response (or first token) arrived
+        """
+        with self._lock:
+            self._records.append((kind, prompt_tokens, cached_tokens, completion_tokens, latency))
+        observe_tokens("prompt", prompt_tokens)
+        observe_tokens("cached", cached_tokens)
+        observe_tokens("completion", completion_tokens)
+        logger.info(
+            "%s usage prompt=%d cached=%d completion=%d latency=%.0fms",
+            kind, prompt_tokens, cached_tokens, completion_tokens, latency * 1000
+        )
+
+    def summary(self) -> Dict:
+        """
+        Totals, cache hit ratio, and per kind of request ("chat", "stream",
+        "summary") the mean latency with and without a cache hit
+        """
+        with self._lock:
+            records = list(self._records)
+        prompt = sum(r[1] for r in records)
+        cached = sum(r[2] for r in records)
+        by_kind = {}
+        for kind in sorted({r[0] for r in records}):
+            hits = [r[4] for r in records if r[0] == kind and r[2] > 0]
+            misses = [r[4] for r in records if r[0] == kind and r[2] == 0]
+            by_kind[kind] = {
+                "latency": LATENCY_MEANING.get(kind, "response"),
+                "requests": len(hits) + len(misses),
+                "requests_with_cache_hit": len(hits),
+                "mean_latency_cache_hit": sum(hits) / len(hits) if hits else None,
+                "mean_latency_cache_miss": sum(misses) / len(misses) if misses else None,
+            }
+        return {
+            "requests": len(records),
+            "prompt_tokens": prompt,
+            "cached_tokens": cached,
+            "completion_tokens": sum(r[3] for r in records),
+            "cached_ratio": cached / prompt if prompt else 0.0,
+            "requests_with_cache_hit": sum(k["requests_with_cache_hit"] for k in by_kind.values()),
+            "by_kind": by_kind,
+        }
+
+    def to_prometheus(self) -> str:
+        """The summary as Prometheus gauges"""
+        summary = self.summary()
+        lines = [
+            f"# TYPE {METRIC_PREFIX}usage_cached_ratio gauge",
+            f"{METRIC_PREFIX}usage_cached_ratio {summary['cached_ratio']:g}",
+            f"# TYPE {METRIC_PREFIX}usage_mean_latency_seconds gauge",
+        ]
+        for kind, stats in summary["by_kind"].items():
+            for cache, key in (("hit", "mean_latency_cache_hit"), ("miss", "mean_latency_cache_miss")):
+                if stats[key] is not None:
+                    lines.append(f'{METRIC_PREFIX}usage_mean_latency_seconds{{kind="{kind}",cache="{cache}"}} '
+                                 f'{stats[key]:g}')
+        return "\n".join(lines) + "\n"
+
+
+def cached_prompt_tokens(usage) -> int:
+    """Cached prompt tokens from a usage object (0 if not reported)"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+
+_stats = UsageStats()
+
+
+def record_usage(kind: str, usage, latency: float) -> Optional[int]:
+    """Record a response's usage; returns its total tokens (None without usage)"""
+    if usage is None:
+        return None
+    _stats.record(kind, usage.prompt_tokens or 0, cached_prompt_tokens(usage),
+                  usage.completion_tokens or 0, latency)
+    return usage.total_tokens
+
+
+def get_usage_stats() -> UsageStats:
+    return _stats